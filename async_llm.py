@@ -0,0 +1,101 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, Callable, Iterator
+import asyncio
+import contextvars
+import functools
+import json
+from delegating_llm import can_stream
+from llm_interface import LLMInterface
+from profiler import bind
+
+class AsyncLLMInterface(ABC):
+    """Async counterpart of LLMInterface used by Leo.aprocess_input"""
+
+    @abstractmethod
+    async def process_clinical_conversation(self, transcript: str) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def process_clinical_image(self, image_text: str) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def compare_notes(self, previous_note: str, current_note: str) -> Dict[str, Any]:
+        pass
+
+    async def stream_clinical_conversation(self, transcript: str) -> AsyncIterator[str]:
+        """
+        Yield the JSON text of process_clinical_conversation's result as it is generated.
+
+        Providers that support token streaming should override this; the default yields
+        the whole result in a single chunk.
+        """
+        result = await self.process_clinical_conversation(transcript)
+        yield json.dumps(result)
+
+    @abstractmethod
+    async def process_clinical_encounter(self, transcript: str, image_text: str, previous_note: str) -> Dict[str, Any]:
+        """Single-pass extraction of all inputs in one call, for single_pass_extraction"""
+        pass
+
+async def run_in_executor(executor: ThreadPoolExecutor, func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call in executor, carrying over the caller's context variables"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, bind(func), *args, **kwargs))
+
+async def iterate_in_executor(executor: ThreadPoolExecutor, func: Callable[..., Iterator], *args) -> AsyncIterator[Any]:
+    """Consume a blocking iterator in executor, yielding its items on the event loop"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    def pump() -> None:
+        try:
+            for item in func(*args):
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, end)
+
+    pumping = loop.run_in_executor(executor, contextvars.copy_context().run, bind(pump))
+    while True:
+        item = await queue.get()
+        if item is end:
+            break
+        yield item
+    # Surface any exception raised by the iterator
+    await pumping
+
+class ExecutorLLM(AsyncLLMInterface):
+    """
+    Async adapter for a synchronous LLMInterface.
+
+    Blocking provider calls run in a bounded thread pool so the event loop stays free;
+    max_workers caps how many calls are in flight at once.
+    """
+
+    def __init__(self, llm: LLMInterface, max_workers: int = 32):
+        self.llm = llm
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="leo-llm")
+
+    async def process_clinical_conversation(self, transcript: str) -> Dict[str, Any]:
+        return await run_in_executor(self.executor, self.llm.process_clinical_conversation, transcript)
+
+    async def process_clinical_image(self, image_text: str) -> Dict[str, Any]:
+        return await run_in_executor(self.executor, self.llm.process_clinical_image, image_text)
+
+    async def compare_notes(self, previous_note: str, current_note: str) -> Dict[str, Any]:
+        return await run_in_executor(self.executor, self.llm.compare_notes, previous_note, current_note)
+
+    async def process_clinical_encounter(self, transcript: str, image_text: str, previous_note: str) -> Dict[str, Any]:
+        return await run_in_executor(self.executor, self.llm.process_clinical_encounter, transcript, image_text, previous_note)
+
+    async def stream_clinical_conversation(self, transcript: str) -> AsyncIterator[str]:
+        # Use the provider's token stream when the wrapped LLM implements one
+        if not can_stream(self.llm):
+            async for chunk in super().stream_clinical_conversation(transcript):
+                yield chunk
+            return
+        async for chunk in iterate_in_executor(self.executor, self.llm.stream_clinical_conversation, transcript):
+            yield chunk
@@ -0,0 +1,450 @@
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from contextvars import ContextVar
+import asyncio
+import io
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import wave
+import numpy as np
+from async_llm import run_in_executor
+from transcription import Transcriber
+
+logger = logging.getLogger(__name__)
+
+SPEECH_SAMPLE_RATE = 16000
+# Audio is decoded and scanned this many seconds at a time
+BLOCK_SECONDS = 30
+
+class AudioDecodeError(RuntimeError):
+    """Raised when an audio file cannot be decoded to PCM"""
+
+def open_pcm(path: str, sample_rate: int = SPEECH_SAMPLE_RATE, block_seconds: float = BLOCK_SECONDS) -> Tuple[Iterator[np.ndarray], int]:
+    """
+    Decode an audio (or video) file to mono 16-bit PCM, block_seconds at a time; returns the
+    blocks and their sample rate.
+
+    WAV files are read with the standard library at their own sample rate; anything else is
+    decoded and resampled to sample_rate with ffmpeg, which must then be on PATH, reading its
+    output as it is produced.
+    """
+    if path.lower().endswith(".wav"):
+        try:
+            with wave.open(path, "rb") as wav:
+                if wav.getsampwidth() != 2:
+                    raise AudioDecodeError("Only 16-bit PCM WAV files are supported")
+                rate = wav.getframerate()
+            return _wav_blocks(path, int(block_seconds * rate)), rate
+        except (wave.Error, EOFError):
+            pass  # Not plain PCM; let ffmpeg try
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise AudioDecodeError(f"ffmpeg is required to decode {path}")
+    command = [ffmpeg, "-nostdin", "-v", "error", "-i", path, "-vn", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "-"]
+    return _ffmpeg_blocks(command, path, int(block_seconds * sample_rate)), sample_rate
+
+def _wav_blocks(path: str, block_frames: int) -> Iterator[np.ndarray]:
+    with wave.open(path, "rb") as wav:
+        channels = wav.getnchannels()
+        while True:
+            samples = np.frombuffer(wav.readframes(block_frames), dtype="<i2")
+            if len(samples) == 0:
+                return
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+            yield samples
+
+def _ffmpeg_blocks(command: List[str], path: str, block_samples: int) -> Iterator[np.ndarray]:
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = proc.stdout.read(2 * block_samples)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            raise AudioDecodeError(stderr.decode("utf-8", "replace").strip() or f"ffmpeg failed on {path}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+def decode_to_pcm(path: str, sample_rate: int = SPEECH_SAMPLE_RATE) -> Tuple[np.ndarray, int]:
+    """The whole of an audio file as mono 16-bit PCM, decoded as by open_pcm"""
+    blocks, rate = open_pcm(path, sample_rate)
+    parts = list(blocks)
+    return (np.concatenate(parts) if parts else np.empty(0, dtype=np.int16)), rate
+
+def encode_wav(samples: np.ndarray, sample_rate: int, name: str = "audio.wav") -> io.BytesIO:
+    """Encode mono 16-bit PCM as an in-memory WAV file named for upload"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+    buffer.seek(0)
+    buffer.name = name
+    return buffer
+
+def frame_energy(samples: np.ndarray, sample_rate: int, frame_ms: int = 20) -> np.ndarray:
+    """RMS energy of consecutive non-overlapping frames"""
+    frame = max(1, sample_rate * frame_ms // 1000)
+    usable = len(samples) - len(samples) % frame
+    frames = samples[:usable].astype(np.float32).reshape(-1, frame)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+def find_split_points(
+    samples: np.ndarray,
+    sample_rate: int,
+    max_chunk_seconds: float,
+    search_seconds: float,
+    frame_ms: int = 20
+) -> List[int]:
+    """
+    Choose sample offsets that cut the audio into chunks of at most max_chunk_seconds.
+
+    Each cut is placed in the middle of the longest run of quietest frames within the last
+    search_seconds before the chunk would exceed its maximum length, so splits land in
+    pauses rather than mid-word.
+    """
+    energy = frame_energy(samples, sample_rate, frame_ms)
+    frame = max(1, sample_rate * frame_ms // 1000)
+    max_frames = max(1, int(max_chunk_seconds * 1000 / frame_ms))
+    search_frames = min(max_frames - 1, int(search_seconds * 1000 / frame_ms))
+    splits = []
+    start = 0
+    while len(energy) - start > max_frames:
+        window = energy[start + max_frames - search_frames:start + max_frames]
+        cut = start + max_frames - search_frames + _quietest_point(window)
+        splits.append(cut * frame)
+        start = cut
+    return splits
+
+def _quietest_point(window: np.ndarray) -> int:
+    """Index of the centre of the longest run of minimum-energy frames in window"""
+    quiet = np.concatenate(([0], (window <= window.min() * 1.1 + 1e-6).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(quiet))
+    starts, ends = edges[::2], edges[1::2]
+    longest = int(np.argmax(ends - starts))
+    return int(starts[longest] + ends[longest]) // 2
+
+def resample(samples: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """Resample PCM by linear interpolation, box-filtering first when downsampling"""
+    if from_rate == to_rate or len(samples) == 0:
+        return samples
+    signal = samples.astype(np.float32)
+    if to_rate < from_rate:
+        width = int(np.ceil(from_rate / to_rate))
+        signal = np.convolve(signal, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    positions = np.arange(int(len(samples) * to_rate / from_rate)) * (from_rate / to_rate)
+    return np.interp(positions, np.arange(len(samples)), signal).astype(np.int16)
+
+def detect_speech(
+    samples: np.ndarray,
+    sample_rate: int,
+    frame_ms: int = 30,
+    hangover_ms: int = 300,
+    threshold_ratio: float = 3.0,
+    min_threshold: float = 200.0
+) -> np.ndarray:
+    """
+    Energy-based voice activity detection.
+
+    A frame is speech when its RMS energy exceeds threshold_ratio times the noise floor
+    (the 10th percentile of frame energies), and never less than min_threshold. Speech
+    regions are widened by hangover_ms on each side so word onsets and trailing consonants
+    survive. Returns an (n, 2) array of [start, end) sample offsets.
+    """
+    energy = frame_energy(samples, sample_rate, frame_ms)
+    return _speech_bounds(energy, len(samples), sample_rate, frame_ms, hangover_ms, threshold_ratio, min_threshold)
+
+def _speech_bounds(
+    energy: np.ndarray,
+    total_samples: int,
+    sample_rate: int,
+    frame_ms: int,
+    hangover_ms: int,
+    threshold_ratio: float,
+    min_threshold: float
+) -> np.ndarray:
+    """detect_speech's regions, from the energy of each frame"""
+    if energy.size == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    frame = max(1, sample_rate * frame_ms // 1000)
+    threshold = max(float(np.percentile(energy, 10)) * threshold_ratio, min_threshold)
+    pad = hangover_ms // frame_ms
+    speech = np.convolve((energy > threshold).astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode="same") > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    bounds = edges.reshape(-1, 2).astype(np.int64) * frame
+    if speech[-1]:
+        bounds[-1, 1] = total_samples  # Include the partial frame at the end
+    return bounds
+
+class FrameEnergyScanner:
+    """frame_energy over audio fed a block at a time, carrying partial frames between blocks"""
+
+    def __init__(self, sample_rate: int, frame_ms: int = 30):
+        self.frame = max(1, sample_rate * frame_ms // 1000)
+        self.total_samples = 0
+        self._energies: List[np.ndarray] = []
+        self._carry = np.empty(0, dtype=np.int16)
+
+    def feed(self, samples: np.ndarray) -> None:
+        self.total_samples += len(samples)
+        if len(self._carry):
+            samples = np.concatenate((self._carry, samples))
+        usable = len(samples) - len(samples) % self.frame
+        frames = samples[:usable].astype(np.float32).reshape(-1, self.frame)
+        self._energies.append(np.sqrt(np.mean(frames * frames, axis=1)))
+        self._carry = samples[usable:].copy()
+
+    def energy(self) -> np.ndarray:
+        return np.concatenate(self._energies) if self._energies else np.empty(0, dtype=np.float32)
+
+class PreprocessedAudio:
+    """
+    Speech-only PCM produced by preprocess_audio, with the map back to the original timeline.
+
+    segments is an (n, 3) array of [processed_start, original_start, duration] in seconds,
+    one row per kept stretch of speech.
+    """
+
+    def __init__(
+        self,
+        samples: np.ndarray,
+        sample_rate: int,
+        segments: np.ndarray,
+        original_bytes: int,
+        original_seconds: float
+    ):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.segments = segments
+        self.original_bytes = original_bytes
+        self.original_seconds = original_seconds
+
+    @property
+    def seconds(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    @property
+    def wav_bytes(self) -> int:
+        return 44 + 2 * len(self.samples)  # Canonical WAV header plus 16-bit mono samples
+
+    def to_original_time(self, seconds: float) -> float:
+        """Map an offset in the processed audio (e.g. a transcript timestamp) to the original"""
+        if len(self.segments) == 0:
+            return seconds
+        row = max(0, int(np.searchsorted(self.segments[:, 0], seconds, side="right")) - 1)
+        processed_start, original_start, _ = self.segments[row]
+        return float(original_start + seconds - processed_start)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "original_bytes": self.original_bytes,
+            "processed_bytes": self.wav_bytes,
+            "bytes_saved": self.original_bytes - self.wav_bytes,
+            "original_seconds": round(self.original_seconds, 3),
+            "processed_seconds": round(self.seconds, 3),
+            "seconds_saved": round(self.original_seconds - self.seconds, 3),
+            "timestamp_map": [[round(float(v), 3) for v in row] for row in self.segments]
+        }
+
+def preprocess_audio(
+    path: str,
+    sample_rate: int = SPEECH_SAMPLE_RATE,
+    frame_ms: int = 30,
+    hangover_ms: int = 300,
+    threshold_ratio: float = 3.0,
+    min_threshold: float = 200.0
+) -> PreprocessedAudio:
+    """
+    Decode to mono PCM at speech sample rate and keep only the stretches that contain speech.
+
+    The recording is decoded once, a block at a time: each block's frame energies are taken
+    for voice activity detection (see detect_speech) and its samples spooled to a temporary
+    file, from which only the speech is read back. Memory holds the kept speech and one
+    energy per frame, however long the recording. If no speech is detected at all the whole
+    recording is kept, so nothing is silently lost.
+    """
+    blocks, rate = open_pcm(path, sample_rate)
+    scanner = FrameEnergyScanner(sample_rate, frame_ms)
+    with tempfile.TemporaryFile() as spool:
+        for block in blocks:
+            # Blocks are resampled one at a time; they are long enough that their edges do not matter
+            block = resample(block, rate, sample_rate).astype("<i2")
+            scanner.feed(block)
+            spool.write(block.tobytes())
+
+        total = scanner.total_samples
+        bounds = _speech_bounds(scanner.energy(), total, sample_rate, frame_ms, hangover_ms, threshold_ratio, min_threshold)
+        if len(bounds) == 0:
+            bounds = np.array([[0, total]], dtype=np.int64)
+
+        lengths = bounds[:, 1] - bounds[:, 0]
+        kept = np.empty(int(lengths.sum()), dtype="<i2")
+        position = 0
+        for start, length in zip(bounds[:, 0], lengths):
+            spool.seek(int(start) * 2)
+            spool.readinto(memoryview(kept[position:position + length]).cast("B"))
+            position += length
+
+    processed_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    segments = np.column_stack((processed_starts, bounds[:, 0], lengths)) / sample_rate
+    return PreprocessedAudio(kept, sample_rate, segments, os.path.getsize(path), total / sample_rate)
+
+_preprocessing_report: ContextVar[Optional[Dict[str, Any]]] = ContextVar("preprocessing_report", default=None)
+
+def preprocessing_report() -> Optional[Dict[str, Any]]:
+    """Report of the last audio preprocessed in the current request, if any"""
+    return _preprocessing_report.get()
+
+def reset_preprocessing_report() -> None:
+    _preprocessing_report.set(None)
+
+_WORD = re.compile(r"[^\w']+")
+
+def _normalize(word: str) -> str:
+    return _WORD.sub("", word.lower())
+
+def merge_transcripts(texts: List[str], max_overlap_words: int = 30) -> str:
+    """
+    Join chunk transcripts in order, dropping words repeated across a chunk boundary.
+
+    Consecutive chunks overlap in time, so the tail of one transcript is usually repeated at
+    the head of the next; the longest such run (compared case- and punctuation-insensitively)
+    is removed from the later chunk.
+    """
+    merged: List[str] = []
+    for text in texts:
+        words = text.split()
+        tail = [_normalize(w) for w in merged[-max_overlap_words:]]
+        head = [_normalize(w) for w in words[:max_overlap_words]]
+        overlap = 0
+        for size in range(min(len(tail), len(head)), 0, -1):
+            if tail[-size:] == head[:size]:
+                overlap = size
+                break
+        merged.extend(words[overlap:])
+    return " ".join(merged)
+
+class ChunkedTranscriber(Transcriber):
+    """
+    Splits long recordings at quiet points and transcribes the chunks concurrently.
+
+    Each chunk after the first starts overlap_seconds before its split point so words at the
+    boundary are heard in full by at least one chunk; merge_transcripts removes the repeats.
+    Recordings that are short, or that cannot be decoded, are passed to the inner
+    transcriber whole. Audio already decoded, such as PreprocessingTranscriber's output, is
+    passed in as PCM with transcribe_pcm rather than decoded again.
+    """
+
+    def __init__(
+        self,
+        transcriber: Transcriber,
+        max_chunk_seconds: float = 300.0,
+        overlap_seconds: float = 2.0,
+        search_seconds: float = 30.0,
+        parallelism: int = 4
+    ):
+        self.transcriber = transcriber
+        self.max_chunk_seconds = max_chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        self.search_seconds = search_seconds
+        self.parallelism = parallelism
+
+    async def transcribe(self, audio_file: BinaryIO, audio_sha256: Optional[str] = None) -> str:
+        chunks = await run_in_executor(None, self._decode_and_split, getattr(audio_file, "name", None))
+        if chunks is None:
+            return await self.transcriber.transcribe(audio_file, audio_sha256)
+        return await self._transcribe_chunks(chunks)
+
+    async def transcribe_pcm(self, samples: np.ndarray, sample_rate: int) -> str:
+        """Transcribe mono 16-bit PCM, split into chunks if it is long"""
+        if len(samples) <= self.max_chunk_seconds * sample_rate:
+            return await self.transcriber.transcribe(encode_wav(samples, sample_rate))
+        chunks = await run_in_executor(None, self._split, samples, sample_rate)
+        return await self._transcribe_chunks(chunks)
+
+    async def _transcribe_chunks(self, chunks: List[io.BytesIO]) -> str:
+        logger.info("Transcribing %d chunks with parallelism %d", len(chunks), self.parallelism)
+        semaphore = asyncio.Semaphore(self.parallelism)
+
+        async def transcribe_chunk(chunk: io.BytesIO) -> str:
+            async with semaphore:
+                return await self.transcriber.transcribe(chunk)
+
+        texts = await asyncio.gather(*(transcribe_chunk(chunk) for chunk in chunks))
+        return merge_transcripts(list(texts))
+
+    def _decode_and_split(self, path: Optional[str]) -> Optional[List[io.BytesIO]]:
+        """Decode and split the file at path, or return None to transcribe it whole"""
+        if not isinstance(path, str):
+            return None
+        try:
+            samples, sample_rate = decode_to_pcm(path)
+        except AudioDecodeError as e:
+            logger.warning("Not chunking %s: %s", path, e)
+            return None
+        if len(samples) <= self.max_chunk_seconds * sample_rate:
+            return None
+        return self._split(samples, sample_rate)
+
+    def _split(self, samples: np.ndarray, sample_rate: int) -> List[io.BytesIO]:
+        splits = find_split_points(samples, sample_rate, self.max_chunk_seconds, self.search_seconds)
+        overlap = int(self.overlap_seconds * sample_rate)
+        bounds = zip([0] + splits, splits + [len(samples)])
+        return [
+            encode_wav(samples[max(0, start - overlap):end], sample_rate, f"chunk_{i:03d}.wav")
+            for i, (start, end) in enumerate(bounds)
+        ]
+
+class PreprocessingTranscriber(Transcriber):
+    """
+    Trims non-speech and downsamples audio before handing it to the wrapped transcriber.
+
+    The trimmed PCM goes straight to a wrapped transcriber that takes PCM (transcribe_pcm,
+    as ChunkedTranscriber does); others get it as a temporary WAV file for the duration of
+    the call. The bytes and seconds saved are logged and made available through
+    preprocessing_report(). Files that cannot be decoded are passed through unchanged.
+    """
+
+    def __init__(self, transcriber: Transcriber, sample_rate: int = SPEECH_SAMPLE_RATE, **vad_options):
+        self.transcriber = transcriber
+        self.sample_rate = sample_rate
+        self.vad_options = vad_options
+
+    async def transcribe(self, audio_file: BinaryIO, audio_sha256: Optional[str] = None) -> str:
+        path = getattr(audio_file, "name", None)
+        if not isinstance(path, str):
+            return await self.transcriber.transcribe(audio_file, audio_sha256)
+        try:
+            prepared = await run_in_executor(None, preprocess_audio, path, self.sample_rate, **self.vad_options)
+        except AudioDecodeError as e:
+            logger.warning("Not preprocessing %s: %s", path, e)
+            return await self.transcriber.transcribe(audio_file, audio_sha256)
+
+        report = prepared.report()
+        _preprocessing_report.set(report)
+        logger.info(
+            "Preprocessed %s: saved %d bytes and %.1fs of audio",
+            path, report["bytes_saved"], report["seconds_saved"]
+        )
+        if getattr(type(self.transcriber), "transcribe_pcm", None) is not None:
+            return await self.transcriber.transcribe_pcm(prepared.samples, prepared.sample_rate)
+        fd, wav_path = tempfile.mkstemp(suffix=".wav")
+        try:
+            with os.fdopen(fd, "wb") as wav_file:
+                wav_file.write(encode_wav(prepared.samples, prepared.sample_rate).getbuffer())
+            with open(wav_path, "rb") as wav_file:
+                return await self.transcriber.transcribe(wav_file)
+        finally:
+            os.remove(wav_path)
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import statistics
+import time
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput
+from context_packer import TokenCounter
+from combined_extraction import SYSTEM_PROMPT, ENCOUNTER_SCHEMA
+from run_leo_test import create_mock_llm
+
+# Stub provider costs, in seconds: a fixed round trip and queueing delay per call, plus time
+# per prompt token and per generated token
+ROUND_TRIP = 0.25
+PER_TOKEN_IN = 0.0002
+PER_TOKEN_OUT = 0.004
+# Every call also sends a system prompt; the per-stage prompts are assumed to be as long as
+# the single-pass one, schema included
+SYSTEM_TOKENS = TokenCounter().count(SYSTEM_PROMPT + json.dumps(ENCOUNTER_SCHEMA))
+RUNS = 5
+
+def delayed(value, counter):
+    """A stub LLM method that sleeps as long as a provider would take for its prompt and value"""
+    def call(*texts):
+        tokens_in = SYSTEM_TOKENS + sum(counter.count(text) for text in texts)
+        tokens_out = counter.count(json.dumps(value))
+        time.sleep(ROUND_TRIP + tokens_in * PER_TOKEN_IN + tokens_out * PER_TOKEN_OUT)
+        return value
+    return call
+
+def create_stub_llm():
+    """Mock LLM from the Leo tests, with provider-like delays and a single-pass method"""
+    counter = TokenCounter()
+    mock = create_mock_llm()
+    for method in ("process_clinical_conversation", "process_clinical_image", "compare_notes"):
+        getattr(mock, method).side_effect = delayed(getattr(mock, method).return_value, counter)
+    audio = mock.process_clinical_conversation.return_value
+    image = mock.process_clinical_image.return_value
+    mock.process_clinical_encounter = Mock(side_effect=delayed({
+        **{key: audio[key] for key in ("subjective", "vitals", "labs", "assessment", "plan", "medications")},
+        "other_data": image["other_data"],
+        **mock.compare_notes.return_value
+    }, counter))
+    return mock
+
+def timed(func, *args):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        note = func(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), note
+
+def main():
+    llm = create_stub_llm()
+    three_call = Config()
+    three_call.clinical_note.local_note_diff = False  # Always make the compare call
+    single_pass = three_call.model_copy(deep=True)
+    single_pass.clinical_note.single_pass_extraction = True
+    input_data = ClinicalInput(
+        transcribed_audio="Doctor: Patient reports improved breathing overnight, no chest pain. "
+                          "Nurse: BP 120/80, HR 72, sats 97% on room air. Continue lisinopril.",
+        extracted_text_from_images="BP: 120/80, HR: 72, WBC: 8.5\nWhiteboard: Room 302",
+        previous_note="Patient short of breath overnight, febrile to 38.4. Plan: chest X-ray, start antibiotics.",
+        patient_info={"name": "John Doe", "mrn": "12345"}
+    )
+
+    print(f"Single-pass extraction benchmark (median of {RUNS} runs, {SYSTEM_TOKENS} system prompt tokens per call)")
+    for name, config in (("three calls", three_call), ("single pass", single_pass)):
+        leo = Leo(config, llm=llm)
+        sync, note = timed(leo.process_input, input_data)
+        async_, _ = timed(lambda data: asyncio.run(leo.aprocess_input(data)), input_data)
+        calls = len(note.stage_timings)  # One model call per stage
+        usage = note.token_usage
+        total_in = usage["tokens_in"] + calls * SYSTEM_TOKENS
+        print(f"  {name}: process_input {sync:.3f}s, aprocess_input {async_:.3f}s, {calls} call(s), "
+              f"{total_in} tokens in ({usage['tokens_in']} input + system prompts), {usage['tokens_out']} out")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput
+from resilience import CircuitBreaker, DeadlineExceeded, GuardedLLM, remaining_time
+
+# Stub provider: calls take LATENCY seconds, give or take JITTER, and a HANG_RATE fraction
+# of them stall for HANG seconds. Like PooledAdapter, the stub stops waiting at the deadline.
+# During an outage every call fails with a connection error after the usual latency.
+LATENCY = 0.1
+JITTER = 0.05
+HANG_RATE = 0.05
+HANG = 3.0
+REQUESTS = 200
+CONCURRENCY = 20
+
+class FaultyProvider:
+    """Stub LLM that injects hangs, or fails every call while an outage is on"""
+
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+        self.outage = False
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self, value):
+        def call(*texts):
+            with self._lock:
+                self.calls += 1
+                hang = not self.outage and self.random.random() < HANG_RATE
+                duration = HANG if hang else LATENCY + self.random.uniform(-JITTER, JITTER)
+            remaining = remaining_time()
+            time.sleep(min(duration, remaining) if remaining is not None else duration)
+            if remaining is not None and remaining < duration:
+                raise DeadlineExceeded("Provider call timed out")
+            if self.outage:
+                raise ConnectionError("Provider unavailable")
+            return value
+        return call
+
+    def llm(self) -> Mock:
+        llm = Mock()
+        llm.process_clinical_conversation.side_effect = self._call({"subjective": "Feels better", "plan": "Continue"})
+        llm.process_clinical_image.side_effect = self._call({"vitals": {"BP": "120/80"}, "other_data": ["Room 302"]})
+        llm.compare_notes.side_effect = self._call({"changes_since_last_note": ["Afebrile"], "discrepancies": []})
+        return llm
+
+def run(leo: Leo, requests: int = REQUESTS):
+    input_data = ClinicalInput(
+        transcribed_audio="Doctor: Breathing is better today. Nurse: BP 120/80.",
+        extracted_text_from_images="BP: 120/80\nWhiteboard: Room 302",
+        previous_note="Short of breath overnight, febrile to 38.4."
+    )
+
+    def one(_):
+        start = time.perf_counter()
+        note = leo.process_input(input_data)
+        return time.perf_counter() - start, bool(note.discrepancies)
+
+    with ThreadPoolExecutor(CONCURRENCY) as pool:
+        results = list(pool.map(one, range(requests)))
+    latencies = sorted(latency for latency, _ in results)
+    partial = sum(1 for _, missing in results if missing)
+    return latencies, partial
+
+def percentile(samples, p):
+    return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+def report(name, latencies, partial):
+    print(f"  {name}: p50 {statistics.median(latencies):.3f}s, p95 {percentile(latencies, 0.95):.3f}s, "
+          f"p99 {percentile(latencies, 0.99):.3f}s, max {latencies[-1]:.3f}s, {partial} partial note(s)")
+
+def main():
+    unbounded = Config()
+    unbounded.deadlines = unbounded.deadlines.model_copy(update={
+        "request_seconds": None, "extraction_seconds": None, "compare_seconds": None
+    })
+    bounded = Config()
+    bounded.deadlines = bounded.deadlines.model_copy(update={
+        "request_seconds": 0.8, "extraction_seconds": 0.4, "compare_seconds": 0.3
+    })
+
+    print(f"Deadline benchmark: {REQUESTS} notes, {CONCURRENCY} at a time, "
+          f"{HANG_RATE:.0%} of provider calls hang for {HANG:.0f}s")
+    for name, config in (("no deadlines", unbounded), ("deadlines", bounded)):
+        report(name, *run(Leo(config, llm=FaultyProvider().llm())))
+
+    print(f"Provider outage: every call fails; {REQUESTS // 4} notes")
+    for name, breaker in (("no breaker", None), ("breaker", CircuitBreaker("stub/gpt-4"))):
+        provider = FaultyProvider()
+        provider.outage = True
+        llm = provider.llm()
+        leo = Leo(bounded, llm=GuardedLLM(llm, breaker) if breaker else llm)
+        latencies, partial = run(leo, REQUESTS // 4)
+        report(f"{name} ({provider.calls} provider calls)", latencies, partial)
+
+if __name__ == "__main__":
+    main()
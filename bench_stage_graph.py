@@ -0,0 +1,63 @@
+import asyncio
+import statistics
+import time
+from config import Config
+from leo import Leo, ClinicalInput
+from run_leo_test import create_mock_llm
+
+# Artificial per-call latencies, in seconds
+DELAYS = {
+    "process_clinical_conversation": 0.30,
+    "process_clinical_image": 0.20,
+    "compare_notes": 0.15
+}
+RUNS = 5
+
+def create_delayed_mock_llm():
+    """Mock LLM from the Leo tests, with a fixed delay added to each call"""
+    mock = create_mock_llm()
+    for method, delay in DELAYS.items():
+        value = getattr(mock, method).return_value
+        def call(*args, _value=value, _delay=delay):
+            time.sleep(_delay)
+            return _value
+        getattr(mock, method).side_effect = call
+    return mock
+
+def serial_pipeline(llm, input_data):
+    """The pre-graph pipeline: each LLM stage waits for the previous one"""
+    llm.process_clinical_conversation(input_data.transcribed_audio)
+    llm.process_clinical_image(input_data.extracted_text_from_images)
+    llm.compare_notes(input_data.previous_note, "")
+
+def timed(func, *args):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def main():
+    llm = create_delayed_mock_llm()
+    leo = Leo(Config(), llm=llm)
+    input_data = ClinicalInput(
+        transcribed_audio="Doctor: Patient reports improved breathing. BP 120/80, HR 72.",
+        extracted_text_from_images="BP: 120/80, HR: 72, WBC: 8.5",
+        previous_note="Previous note content",
+        patient_info={"name": "John Doe", "mrn": "12345"}
+    )
+
+    serial = timed(serial_pipeline, llm, input_data)
+    graph = timed(leo.process_input, input_data)
+    agraph = timed(lambda data: asyncio.run(leo.aprocess_input(data)), input_data)
+    timings = leo.process_input(input_data).stage_timings
+
+    print(f"Leo stage graph benchmark (median of {RUNS} runs)")
+    print(f"  serial stages:        {serial:.3f}s")
+    print(f"  process_input graph:  {graph:.3f}s ({serial / graph:.2f}x)")
+    print(f"  aprocess_input graph: {agraph:.3f}s ({serial / agraph:.2f}x)")
+    print("  stage timings: " + ", ".join(f"{name}={seconds:.3f}s" for name, seconds in timings.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import statistics
+import time
+from config import Config
+from leo import Leo, ClinicalInput
+from structured_extraction import extract_structured
+from bench_stage_graph import create_delayed_mock_llm
+
+# Sample strings with the vitals and labs a reader would pull out of them
+CORPUS = [
+    ("BP: 120/80, HR: 72, WBC: 8.5", ["BP: 120/80", "HR: 72"], ["WBC: 8.5"]),
+    ("Vitals: BP 134/86 HR 88 RR 18 Temp 98.6F SpO2 97%",
+     ["BP: 134/86", "HR: 88", "RR: 18", "Temp: 98.6°F", "SpO2: 97%"], []),
+    ("CBC  WBC 11.2 K/uL  Hgb 9.8 g/dL  Hct 29.5  Plt 250",
+     [], ["WBC: 11.2 K/uL", "Hgb: 9.8 g/dL", "Hct: 29.5", "Plt: 250"]),
+    ("BMP\nNa 134 mEq/L\nK 5.6 mEq/L\nCl 101\nCO2 22\nBUN 28\nCr 1.4 mg/dL\nGlucose 210 mg/dL",
+     [], ["Na: 134 mEq/L", "K: 5.6 mEq/L", "Cl: 101", "CO2: 22", "BUN: 28", "Cr: 1.4 mg/dL", "Glucose: 210 mg/dL"]),
+    ("Doctor: Blood pressure is 150/95 and pulse was 110. Sats 91% on room air.",
+     ["BP: 150/95", "HR: 110", "SpO2: 91%"], []),
+    ("Temperature 38.4 C overnight, resp rate 24, lactate 3.1 mmol/L, troponin 0.04 ng/mL",
+     ["Temp: 38.4°C", "RR: 24"], ["Lactate: 3.1 mmol/L", "Troponin: 0.04 ng/mL"]),
+    ("Start vitamin K 10 mg IV, recheck INR 2.8 in the morning", [], ["INR: 2.8"]),
+    ("Weight 82.5 kg, A1c 8.2%, TSH 2.1", ["Weight: 82.5 kg"], ["A1c: 8.2%", "TSH: 2.1"]),
+    ("Mg 1.6, Phos 2.2, Ca 8.1 - replete magnesium 2 g IV", [], ["Mg: 1.6", "Phos: 2.2", "Ca: 8.1"]),
+    ("AST 45 U/L ALT 52 U/L Alk Phos 130 T Bili 1.8 Albumin 3.1 g/dL",
+     [], ["AST: 45 U/L", "ALT: 52 U/L", "Alk Phos: 130", "T Bili: 1.8", "Albumin: 3.1 g/dL"]),
+    ("Patient reports improved breathing and no chest pain.", [], []),
+]
+ITERATIONS = 2000
+RUNS = 5
+
+def accuracy():
+    """Entry-level precision and recall over the corpus"""
+    true_positive = false_positive = false_negative = 0
+    for text, vitals, labs in CORPUS:
+        result = extract_structured(text)
+        expected = set(vitals) | set(labs)
+        found = set(result.vitals) | set(result.labs)
+        true_positive += len(expected & found)
+        false_positive += len(found - expected)
+        false_negative += len(expected - found)
+    return true_positive / (true_positive + false_positive), true_positive / (true_positive + false_negative)
+
+def throughput():
+    """Corpus strings extracted per second"""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for text, _, _ in CORPUS:
+            extract_structured(text)
+    return ITERATIONS * len(CORPUS) / (time.perf_counter() - start)
+
+def timed(func, *args):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def main():
+    precision, recall = accuracy()
+    print(f"Structured extraction benchmark ({len(CORPUS)} sample strings)")
+    print(f"  precision: {precision:.3f}, recall: {recall:.3f}")
+    print(f"  throughput: {throughput():,.0f} strings/s")
+
+    lab_sheet = ClinicalInput(extracted_text_from_images=CORPUS[3][0])
+    llm_config = Config()
+    rules_config = Config()
+    rules_config.clinical_note.skip_llm_for_structured_input = True
+    with_llm = timed(Leo(llm_config, llm=create_delayed_mock_llm()).process_input, lab_sheet)
+    rules_only = timed(Leo(rules_config, llm=create_delayed_mock_llm()).process_input, lab_sheet)
+    print(f"  lab sheet note, LLM extraction: {with_llm * 1000:.1f}ms")
+    print(f"  lab sheet note, rules only:     {rules_only * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
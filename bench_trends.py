@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from trends import collect_readings, WardSeries, TrendStats, analyze
+
+PATIENTS = 2000
+READINGS = 200  # Notes per patient, each with BP, HR, SpO2 and K
+
+def synthetic_ward(seed: int = 0):
+    """Random-walk vitals and labs for a ward of patients"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 3, 1)
+    ward = {}
+    for patient in range(PATIENTS):
+        hr = 80 + np.cumsum(rng.normal(0, 2, READINGS))
+        sbp = 130 + np.cumsum(rng.normal(0, 3, READINGS))
+        spo2 = np.clip(95 + np.cumsum(rng.normal(0, 0.3, READINGS)), 80, 100)
+        k = 4.2 + np.cumsum(rng.normal(0, 0.05, READINGS))
+        ward[f"MRN{patient:05d}"] = [
+            {
+                "date": start + timedelta(hours=6 * i),
+                "objective": {
+                    "vitals": [f"BP: {sbp[i]:.0f}/{sbp[i] * 0.6:.0f}", f"HR: {hr[i]:.0f}", f"SpO2: {spo2[i]:.0f}%"],
+                    "labs": [f"K: {k[i]:.1f}"]
+                }
+            }
+            for i in range(READINGS)
+        ]
+    return ward
+
+def python_slopes(readings):
+    """Per-patient least-squares slopes in plain Python, for comparison"""
+    slopes = {}
+    for mrn, series in readings.items():
+        n = len(series)
+        mean_t = sum(t for t, _ in series) / n
+        mean_v = sum(v for _, v in series) / n
+        num = sum((t - mean_t) * (v - mean_v) for t, v in series)
+        den = sum((t - mean_t) ** 2 for t, _ in series)
+        slopes[mrn] = num / den if den else float("nan")
+    return slopes
+
+def main():
+    ward = synthetic_ward()
+    print(f"Trend engine benchmark ({PATIENTS} patients × {READINGS} notes, {PATIENTS * READINGS * 5:,} readings)")
+
+    start = time.perf_counter()
+    by_name = collect_readings(ward)
+    parse = time.perf_counter() - start
+
+    start = time.perf_counter()
+    series = {name: WardSeries.from_readings(name, readings) for name, readings in by_name.items()}
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stats = {name: TrendStats(s) for name, s in series.items()}
+    compute = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for readings in by_name.values():
+        python_slopes(readings)
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = analyze(ward)
+    total = time.perf_counter() - start
+
+    flagged = sum(1 for lines in results.values() if lines)
+    print(f"  parse note entries:     {parse:.3f}s")
+    print(f"  build padded matrices:  {build:.3f}s")
+    print(f"  NumPy trend stats:      {compute:.3f}s (slopes only in Python: {baseline:.3f}s, {baseline / compute:.1f}x)")
+    print(f"  analyze() end to end:   {total:.3f}s, {flagged} patients with trends")
+    print(f"  series: " + ", ".join(f"{name}={len(s.mrns)}×{s.values.shape[1]}" for name, s in series.items()))
+    assert all(np.isfinite(s.slope).all() for s in stats.values())
+
+if __name__ == "__main__":
+    main()
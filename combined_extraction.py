@@ -0,0 +1,134 @@
+from typing import Any, Dict, List
+import json
+from pydantic import BaseModel
+from config import LLMConfig
+from delegating_llm import DelegatingLLM
+from llm_interface import LLMInterface
+
+ENCOUNTER_FUNCTION = "record_encounter"
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+# JSON schema the single-pass response is constrained to
+ENCOUNTER_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "subjective": {"type": "string", "description": "Patient-reported symptoms and history from the transcript"},
+        "vitals": {**_STRINGS, "description": "Vital signs as 'Name: value', e.g. 'BP: 120/80'"},
+        "labs": {**_STRINGS, "description": "Lab results as 'Name: value unit', e.g. 'K: 4.1 mmol/L'"},
+        "physical_exam": _STRINGS,
+        "other_data": {**_STRINGS, "description": "Anything else read from the image text"},
+        "assessment": {"type": "string"},
+        "plan": {"type": "string"},
+        "medications": {**_STRINGS, "description": "Medications with dose, e.g. 'Lisinopril 10mg daily'"},
+        "new_findings": {**_STRINGS, "description": "Compared with the previous note; empty without one"},
+        "resolved_issues": _STRINGS,
+        "trends": _STRINGS,
+        "significant_changes": _STRINGS
+    },
+    "required": ["subjective", "vitals", "labs", "assessment", "plan", "medications"]
+}
+SYSTEM_PROMPT = (
+    "You are a clinical documentation assistant writing a nurse's progress note. You are given "
+    "a transcript of the encounter, text read from images of monitors or charts, and the "
+    "previous progress note; any of them may be missing. Record the current note's sections "
+    "and, when there is a previous note, what changed since it. Use only facts in the inputs. "
+    "Where the transcript and the images disagree on a reading, prefer the images."
+)
+
+def build_encounter_prompt(transcript: str, image_text: str, previous_note: str) -> str:
+    """The user message for a single-pass call; missing inputs are marked as such"""
+    sections = [
+        ("Transcript", transcript),
+        ("Text from images", image_text),
+        ("Previous note", previous_note)
+    ]
+    return "\n\n".join(f"## {title}\n{text.strip() or '(none)'}" for title, text in sections)
+
+class EncounterExtraction(BaseModel):
+    """A single-pass response, checked against ENCOUNTER_SCHEMA"""
+    subjective: str = ""
+    vitals: List[str] = []
+    labs: List[str] = []
+    physical_exam: List[str] = []
+    other_data: List[str] = []
+    assessment: str = ""
+    plan: str = ""
+    medications: List[str] = []
+    new_findings: List[str] = []
+    resolved_issues: List[str] = []
+    trends: List[str] = []
+    significant_changes: List[str] = []
+
+    def stage_results(self) -> Dict[str, Dict[str, Any]]:
+        """
+        The response split into what the audio, image and compare stages would have
+        returned, so Leo applies it the same way. Medications are only in the audio result,
+        so they become action items once.
+        """
+        return {
+            "audio": {
+                "subjective": self.subjective,
+                "vitals": self.vitals,
+                "labs": self.labs,
+                "assessment": self.assessment,
+                "plan": self.plan,
+                "physical_exam": self.physical_exam,
+                "medications": self.medications
+            },
+            "image": {"vitals": self.vitals, "labs": self.labs, "other_data": self.other_data},
+            "compare": {
+                "new_findings": self.new_findings,
+                "resolved_issues": self.resolved_issues,
+                "trends": self.trends,
+                "significant_changes": self.significant_changes
+            }
+        }
+
+class EncounterInputs:
+    """What Leo sends in one single-pass call: each text packed to its budget"""
+
+    def __init__(self, transcript: str = "", image_text: str = "", previous_note: str = "", trimmed: int = 0):
+        self.transcript = transcript
+        self.image_text = image_text
+        self.previous_note = previous_note
+        self.trimmed = trimmed  # Tokens dropped by packing
+
+    @property
+    def texts(self) -> List[str]:
+        return [self.transcript, self.image_text, self.previous_note]
+
+class OpenAIEncounterLLM(DelegatingLLM):
+    """
+    LLMInterface wrapper adding process_clinical_encounter: transcript, image text and
+    previous note in one chat completion, with the output constrained to ENCOUNTER_SCHEMA
+    through function calling. The per-stage methods are passed through to the wrapped LLM.
+    """
+
+    def __init__(self, llm: LLMInterface, config: LLMConfig):
+        super().__init__(llm)
+        self.config = config
+
+    def handles_encounter(self) -> bool:
+        return True
+
+    def process_clinical_encounter(self, transcript: str, image_text: str, previous_note: str) -> Dict[str, Any]:
+        import openai
+        response = openai.ChatCompletion.create(
+            model=self.config.model,
+            api_key=self.config.api_key,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": build_encounter_prompt(transcript, image_text, previous_note)}
+            ],
+            functions=[{
+                "name": ENCOUNTER_FUNCTION,
+                "description": "Record the progress note for this encounter",
+                "parameters": ENCOUNTER_SCHEMA
+            }],
+            function_call={"name": ENCOUNTER_FUNCTION},
+            temperature=self.config.temperature,
+            max_tokens=self.config.max_tokens,
+            top_p=self.config.top_p,
+            frequency_penalty=self.config.frequency_penalty,
+            presence_penalty=self.config.presence_penalty
+        )
+        return json.loads(response["choices"][0]["message"]["function_call"]["arguments"])
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import Optional, Dict, Any
 import os
 from dotenv import load_dotenv
@@ -15,6 +15,63 @@ class LLMConfig(BaseModel):
     top_p: float = 1.0
     frequency_penalty: float = 0.0
     presence_penalty: float = 0.0
+    max_concurrent_requests: int = 32  # Thread pool size for blocking provider calls
+
+class ProviderConfig(BaseModel):
+    """Configuration for HTTP connections to the model and transcription providers"""
+    base_url: Optional[str] = os.getenv("OPENAI_API_BASE")  # e.g. a local stub server; the provider's own if unset
+    pool_size: int = 40  # Keep-alive connections per host, enough for the LLM and transcription workers
+    pool_hosts: int = 4  # Hosts given their own connection pool
+    max_retries: int = 3  # Retries for 429 and 5xx responses and failed connections
+    retry_base_delay: float = 0.5  # Backoff before the first retry, doubling after each
+    retry_max_delay: float = 8.0
+
+class LLMSchedulerConfig(BaseModel):
+    """Configuration for rate-limited, prioritised admission of model calls"""
+    enabled: bool = True
+    requests_per_minute: float = 500  # Starting limits, replaced by the provider's rate limit headers
+    tokens_per_minute: float = 300_000
+    burst_seconds: float = 10.0  # Share of a minute's allowance that may be used at once
+    max_queued: int = 256  # Calls that may wait for admission, each holding a worker thread
+
+class DeadlineConfig(BaseModel):
+    """Configuration for request deadlines, stage budgets and provider circuit breakers"""
+    # Sized for GPT-4, whose calls on long transcripts take 20-40s; None for no limit
+    request_seconds: Optional[float] = 180.0  # Whole request, transcription included
+    transcription_seconds: Optional[float] = 120.0
+    extraction_seconds: Optional[float] = 60.0  # Each of the transcript and image stages
+    compare_seconds: Optional[float] = 45.0
+    # Uploads processed as background jobs, which nobody is waiting on and run at background priority
+    background_request_seconds: Optional[float] = 1800.0
+    background_transcription_seconds: Optional[float] = 1200.0
+    breaker_failures: int = 5  # Consecutive failures that open a provider and model's circuit
+    breaker_reset_seconds: float = 30.0  # How long an open circuit fails fast before a trial call
+
+class ModelRoute(BaseModel):
+    """How one kind of model call chooses its model"""
+    model: Optional[str] = None  # LLMConfig.model if unset
+    fast_model: Optional[str] = None  # Faster fallback; calls never fall back if unset
+    fast_below_tokens: int = 0  # Inputs up to this many tokens always go to fast_model
+    slo_seconds: float = 20.0  # Latency target; the budget is this or the time left before the deadline, if sooner, so calls near the deadline fall back
+
+class ModelRoutingConfig(BaseModel):
+    """Configuration for choosing a model per call by input size and recent provider latency"""
+    enabled: bool = True
+    extraction: ModelRoute = ModelRoute(fast_model="gpt-3.5-turbo", fast_below_tokens=1000, slo_seconds=5.0)  # Image text
+    comparison: ModelRoute = ModelRoute(fast_model="gpt-3.5-turbo", slo_seconds=10.0)
+    narrative: ModelRoute = ModelRoute(fast_model="gpt-3.5-turbo", slo_seconds=20.0)  # Transcripts and single-pass notes
+    window: int = 200  # Recent calls per model the p95 is taken over
+    min_samples: int = 20  # Calls needed before a model's p95 is trusted
+    sample_seconds: float = 300.0  # Calls older than this no longer count, so a passed-over model is retried
+
+class LLMCacheConfig(BaseModel):
+    """Configuration for the LLM response cache"""
+    enabled: bool = True
+    db_path: Optional[str] = None  # Defaults to llm_cache.sqlite3 in the upload directory
+    ttl_seconds: float = 7 * 24 * 3600  # Responses older than this are never served
+    memory_entries: int = 1024  # Responses kept in the in-process LRU in front of SQLite
+    max_bytes: int = 256 * 1024 * 1024  # Total response size kept on disk before LRU eviction
+    sweep_seconds: float = 600.0  # How often expired responses are deleted from disk
 
 class ClinicalNoteConfig(BaseModel):
     """Configuration for clinical note generation"""
@@ -23,13 +80,110 @@ class ClinicalNoteConfig(BaseModel):
     include_labs: bool = True
     include_medications: bool = True
     highlight_abnormal: bool = True
-    max_note_length: int = 4000
+    max_note_length: int = 4000  # Token budget for each transcript or image text sent to the model
+    previous_note_tokens: int = 1000  # Token budget for a previous note sent for full comparison
+    context_recent_share: float = 0.5  # Share of a budget kept for the most recent part of a text
+    map_reduce_extraction: bool = True  # Extract transcripts over max_note_length in concurrent segments
+    map_reduce_segment_tokens: int = 1500
+    rule_based_extraction: bool = True  # Read vitals and labs with local patterns, filling in those the model leaves out
+    local_note_diff: bool = True  # Diff readings, action items and plan locally; the LLM compares only changed narrative
+    history_trends: bool = True  # Trends computed over the stored note history replace the model's
+    trend_window_days: int = 30  # How far back the trend history reaches
+    skip_llm_for_structured_input: bool = False  # No LLM call for input that is only readings, e.g. lab sheets
+    single_pass_extraction: bool = False  # One model call for transcript, images and comparison instead of three
+    stream_extraction: bool = True  # Stream transcript extractions from the provider token by token on /generate-note/stream
+
+class TranscriptionConfig(BaseModel):
+    """Configuration for speech-to-text"""
+    model: str = "whisper-1"
+    max_concurrent_requests: int = 8
+    cache_enabled: bool = True
+    cache_path: Optional[str] = None  # Defaults to transcripts.sqlite3 in the upload directory
+    cache_max_bytes: int = 256 * 1024 * 1024  # Total transcript size kept before LRU eviction
+    chunking_enabled: bool = True
+    chunk_max_seconds: float = 300.0  # Longest chunk sent for transcription
+    chunk_overlap_seconds: float = 2.0  # Audio repeated across chunk boundaries
+    chunk_search_seconds: float = 30.0  # How far back from the limit to look for a pause
+    chunk_parallelism: int = 4
+    preprocessing_enabled: bool = True  # Downsample and drop non-speech before transcription
+    vad_threshold_ratio: float = 3.0  # Speech must be this many times louder than the noise floor
+    vad_hangover_ms: int = 300  # Audio kept either side of detected speech
+
+class ImageConfig(BaseModel):
+    """Configuration for image text extraction"""
+    ocr_backend: str = "tesseract"
+    max_workers: int = 4  # OCR worker processes
+    max_side: int = 2000  # Images are shrunk to this many pixels on their longest side before OCR
+    dedup_distance: int = 5  # Perceptual hashes within this many bits count as the same photo
+    max_images_per_request: int = 20
+
+class UploadConfig(BaseModel):
+    """Configuration for audio and image uploads"""
+    upload_dir: str = "uploads"
+    chunk_size: int = 1024 * 1024  # Bytes copied to disk per read
+    max_audio_bytes: int = 1024 * 1024 * 1024
+    max_image_bytes: int = 50 * 1024 * 1024
+
+class NoteStoreConfig(BaseModel):
+    """Configuration for the per-patient note history"""
+    enabled: bool = True
+    db_path: Optional[str] = None  # Defaults to notes.sqlite3 in the upload directory
+
+class JobConfig(BaseModel):
+    """Configuration for background note generation jobs"""
+    db_path: Optional[str] = None  # Defaults to jobs.sqlite3 in the upload directory
+    concurrency: int = 4  # Jobs processed at once per server process
+    lease_seconds: float = 60.0  # A running job whose process stops renewing its claim this long is run again
+    heartbeat_seconds: float = 15.0  # Keep-alive interval for job event streams
+
+class ProfilingConfig(BaseModel):
+    """Configuration for sampling profiles of live requests"""
+    header_enabled: bool = True  # Profile requests sent with an X-Profile: 1 header
+    sample_rate: float = 0.0  # Share of all other requests profiled
+    interval_seconds: float = 0.01  # Time between stack samples
+    profile_dir: Optional[str] = None  # Defaults to profiles in the upload directory
+    max_profiles: int = 200  # Stored profiles kept, oldest deleted first
+
+class BatchConfig(BaseModel):
+    """Configuration for batch note generation"""
+    default_concurrency: int = 8
+    max_concurrency: int = 32
+    max_notes: int = 200  # Largest batch accepted in one request
+
+# Files kept in the upload directory unless their section sets a path: (section, field, name)
+UPLOAD_DIR_PATHS = (
+    ("llm_cache", "db_path", "llm_cache.sqlite3"),
+    ("note_store", "db_path", "notes.sqlite3"),
+    ("jobs", "db_path", "jobs.sqlite3"),
+    ("profiling", "profile_dir", "profiles"),
+    ("transcription", "cache_path", "transcripts.sqlite3"),
+)
 
 class Config(BaseModel):
     """Main configuration class"""
     llm: LLMConfig = LLMConfig()
+    provider: ProviderConfig = ProviderConfig()
+    llm_cache: LLMCacheConfig = LLMCacheConfig()
+    llm_scheduler: LLMSchedulerConfig = LLMSchedulerConfig()
+    deadlines: DeadlineConfig = DeadlineConfig()
+    routing: ModelRoutingConfig = ModelRoutingConfig()
     clinical_note: ClinicalNoteConfig = ClinicalNoteConfig()
+    transcription: TranscriptionConfig = TranscriptionConfig()
+    images: ImageConfig = ImageConfig()
+    upload: UploadConfig = UploadConfig()
+    note_store: NoteStoreConfig = NoteStoreConfig()
+    jobs: JobConfig = JobConfig()
+    batch: BatchConfig = BatchConfig()
+    profiling: ProfilingConfig = ProfilingConfig()
     
+    @model_validator(mode="after")
+    def _paths_in_upload_dir(self) -> "Config":
+        """Put the stores whose path is not set in the configured upload directory"""
+        for section, field, name in UPLOAD_DIR_PATHS:
+            if getattr(getattr(self, section), field) is None:
+                setattr(getattr(self, section), field, os.path.join(self.upload.upload_dir, name))
+        return self
+
     model_config = {
         "env_prefix": "LEO_"
     } 
\ No newline at end of file
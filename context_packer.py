@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+import math
+import re
+import threading
+from structured_extraction import extract_structured
+from note_diff import parse_note
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency; token counts are estimated without it
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Placed where packing dropped part of a text
+GAP_MARKER = "[...]"
+# Words that make a transcript line worth keeping even when it is not recent
+_RELEVANT = re.compile(
+    r"\b(?:mg|mcg|units?|dose|allerg\w*|medication\w*|start\w*|stop\w*|increas\w*|decreas\w*|continu\w*|"
+    r"plan\w*|assess\w*|diagnos\w*|pain|fever|chest|breath\w*|nause\w*|vomit\w*|bleed\w*|fall|confus\w*)\b",
+    re.I
+)
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+@lru_cache(maxsize=None)
+def _encoding_for(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:  # Unknown model, or the encoding can't be downloaded
+        logger.warning("Estimating token counts, tiktoken unavailable for %s: %s", model, e)
+        return None
+
+class TokenCounter:
+    """
+    Counts tokens with the model's tiktoken encoding when it is available locally, and
+    otherwise estimates them at four characters per token
+    """
+
+    def __init__(self, model: str = "gpt-4"):
+        self.model = model
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        # Loaded on first use and shared, since loading may mean a download
+        encoding = _encoding_for(self.model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / 4)
+
+class TokenUsage:
+    """Tokens sent to and received from the model while generating one note"""
+
+    def __init__(self):
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.tokens_trimmed = 0  # Input tokens dropped by packing
+        self._lock = threading.Lock()
+
+    def add(self, tokens_in: int = 0, tokens_out: int = 0, tokens_trimmed: int = 0) -> None:
+        with self._lock:
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+            self.tokens_trimmed += tokens_trimmed
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"tokens_in": self.tokens_in, "tokens_out": self.tokens_out, "tokens_trimmed": self.tokens_trimmed}
+
+class PackedText:
+    """A text cut down to a token budget"""
+
+    def __init__(self, text: str, tokens: int, trimmed: int):
+        self.text = text
+        self.tokens = tokens
+        self.trimmed = trimmed
+
+def _segments(text: str) -> List[str]:
+    """Speaker turns or lines; a text without line breaks is split into sentences"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) > 1:
+        return lines
+    return [sentence for sentence in _SENTENCE.split(text) if sentence.strip()]
+
+def relevance(segment: str) -> int:
+    """How much a segment matters to a note: readings count double, clinical terms once"""
+    readings = extract_structured(segment)
+    return 2 * (len(readings.vitals) + len(readings.labs)) + len(_RELEVANT.findall(segment))
+
+class ContextPacker:
+    """
+    Fits text sent to the model into a token budget.
+
+    The most recent part of a text (its last recent_share of the budget) is always kept; the
+    rest of the budget goes to the most relevant earlier lines. Kept lines stay in their
+    original order, with a marker where lines were dropped. Compressed previous notes are
+    cached per MRN, so a patient's last note is only summarised once.
+    """
+
+    def __init__(self, counter: TokenCounter, recent_share: float = 0.5, cache_size: int = 1024):
+        self.counter = counter
+        self.recent_share = recent_share
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[str, Tuple[str, int, PackedText]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._marker_tokens = counter.count("\n" + GAP_MARKER + "\n")
+
+    def pack(self, text: str, budget: int) -> PackedText:
+        total = self.counter.count(text)
+        if total <= budget:
+            return PackedText(text, total, 0)
+
+        segments = _segments(text)
+        # Each segment is charged for a gap marker too, so the packed text stays within budget
+        costs = [self.counter.count(segment) + self._marker_tokens for segment in segments]
+        keep = set()
+        used = 0
+        for i in reversed(range(len(segments))):
+            if used + costs[i] > budget * self.recent_share:
+                break
+            keep.add(i)
+            used += costs[i]
+        older = sorted((i for i in range(len(segments)) if i not in keep), key=lambda i: (-relevance(segments[i]), -i))
+        for i in older:
+            if used + costs[i] <= budget:
+                keep.add(i)
+                used += costs[i]
+
+        if not keep:
+            # Not even the last line fits: keep as much of the end of the text as will
+            tail = text[-budget * 4:]
+            while tail and self.counter.count(GAP_MARKER + " " + tail) > budget:
+                tail = tail[len(tail) // 10 + 1:]
+            packed = GAP_MARKER + " " + tail
+        else:
+            parts = []
+            for i in range(len(segments)):
+                if i in keep:
+                    parts.append(segments[i])
+                elif not parts or parts[-1] != GAP_MARKER:
+                    parts.append(GAP_MARKER)
+            packed = "\n".join(parts)
+        tokens = self.counter.count(packed)
+        return PackedText(packed, tokens, max(total - tokens, 0))
+
+    def pack_previous_note(self, text: str, budget: int, mrn: Optional[str] = None) -> PackedText:
+        """
+        Compress a previous note to budget: for a note in Leo's format, keep the objective
+        data, assessment, plan and action items and only the opening of the subjective
+        """
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        key = mrn or digest
+        with self._lock:
+            cached = self._summaries.get(key)
+            if cached is not None and cached[0] == digest and cached[1] == budget:
+                self._summaries.move_to_end(key)
+                return cached[2]
+
+        total = self.counter.count(text)
+        if total <= budget:
+            packed = PackedText(text, total, 0)
+        else:
+            parsed = parse_note(text)
+            packed = self.pack(_compress_note(parsed) if parsed is not None else text, budget)
+            packed.trimmed = max(total - packed.tokens, 0)
+
+        with self._lock:
+            self._summaries[key] = (digest, budget, packed)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return packed
+
+def _compress_note(note: Dict) -> str:
+    """A parsed previous note without its changes and discrepancies, subjective cut to its first sentence"""
+    subjective = _SENTENCE.split(note["subjective"].strip(), maxsplit=1)[0]
+    objective = note["objective"]
+    lines = [
+        f"**Subjective:**\n{subjective}",
+        "**Objective:**",
+        f"- **Vitals:** {', '.join(objective['vitals'])}",
+        f"- **Physical Exam Findings:** {', '.join(objective['physical_exam'])}",
+        f"- **Labs:** {', '.join(objective['labs'])}",
+        f"**Assessment:**\n{note['assessment']}",
+        f"**Plan:**\n{note['plan']}",
+    ]
+    if note["action_items"]:
+        lines.append("**Action Items / To-Do:**")
+        lines.extend(f"- {item}" for item in note["action_items"])
+    return "\n".join(lines)
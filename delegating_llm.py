@@ -0,0 +1,60 @@
+from typing import Any, Dict, Iterator
+import json
+from llm_interface import LLMInterface
+
+def can_stream(llm: LLMInterface) -> bool:
+    """Whether llm implements stream_clinical_conversation"""
+    return getattr(type(llm), "stream_clinical_conversation", None) is not None
+
+def stream_from(llm: LLMInterface, transcript: str) -> Iterator[str]:
+    """llm's streamed transcript extraction, or its whole extraction as one chunk if it cannot stream"""
+    if not can_stream(llm):
+        yield json.dumps(llm.process_clinical_conversation(transcript))
+        return
+    yield from llm.stream_clinical_conversation(transcript)
+
+class DelegatingLLM(LLMInterface):
+    """
+    LLMInterface wrapper that passes each call on to the LLM it wraps.
+
+    Every method goes through _call with its name and inputs, so a wrapper overrides that
+    one hook. A streamed transcript extraction goes through _stream when the wrapped LLM can
+    stream; otherwise the whole extraction, made through _call, is yielded as one chunk.
+    """
+
+    def __init__(self, llm: LLMInterface):
+        self.llm = llm
+
+    def _call(self, method: str, *inputs: str) -> Dict[str, Any]:
+        return getattr(self.llm, method)(*inputs)
+
+    def _stream(self, transcript: str) -> Iterator[str]:
+        return self.llm.stream_clinical_conversation(transcript)
+
+    def handles_encounter(self) -> bool:
+        """Whether process_clinical_encounter reaches an LLM that implements it"""
+        return supports_encounter(self.llm)
+
+    def process_clinical_conversation(self, transcript: str) -> Dict[str, Any]:
+        return self._call("process_clinical_conversation", transcript)
+
+    def process_clinical_image(self, image_text: str) -> Dict[str, Any]:
+        return self._call("process_clinical_image", image_text)
+
+    def compare_notes(self, previous_note: str, current_note: str) -> Dict[str, Any]:
+        return self._call("compare_notes", previous_note, current_note)
+
+    def process_clinical_encounter(self, transcript: str, image_text: str, previous_note: str) -> Dict[str, Any]:
+        return self._call("process_clinical_encounter", transcript, image_text, previous_note)
+
+    def stream_clinical_conversation(self, transcript: str) -> Iterator[str]:
+        if not can_stream(self.llm):
+            yield json.dumps(self.process_clinical_conversation(transcript))
+            return
+        yield from self._stream(transcript)
+
+def supports_encounter(llm: LLMInterface) -> bool:
+    """Whether llm, through any wrappers, can extract a whole encounter in one call"""
+    if isinstance(llm, DelegatingLLM):
+        return llm.handles_encounter()
+    return callable(getattr(llm, "process_clinical_encounter", None))
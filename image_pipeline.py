@@ -0,0 +1,135 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+
+try:
+    from PIL import Image
+except ImportError:  # Optional dependency, only needed for /upload-image
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+class OCRBackend(ABC):
+    """Interface for local OCR engines; instances must be picklable to run in worker processes"""
+
+    @abstractmethod
+    def extract_text(self, image) -> str:
+        """Return the text in a PIL image"""
+        pass
+
+class TesseractOCR(OCRBackend):
+    """OCR with Tesseract via pytesseract"""
+
+    def __init__(self, lang: str = "eng", config: str = "--psm 6"):
+        self.lang = lang
+        self.config = config
+
+    def extract_text(self, image) -> str:
+        import pytesseract
+        return pytesseract.image_to_string(image, lang=self.lang, config=self.config)
+
+OCR_BACKENDS = {
+    "tesseract": TesseractOCR
+}
+
+def _require_pillow() -> None:
+    if Image is None:
+        raise RuntimeError("Pillow is required for image text extraction")
+
+def dhash(path: str, hash_size: int = 8) -> int:
+    """Difference hash: near-identical photos differ in only a few of the 64 bits"""
+    _require_pillow()
+    with Image.open(path) as image:
+        image.draft("L", (hash_size * 16, hash_size * 16))  # Cheap JPEG downscale while decoding
+        small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+        pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+def ocr_image(path: str, backend: OCRBackend, max_side: int) -> str:
+    """Decode, convert to greyscale, shrink to max_side and OCR one image"""
+    _require_pillow()
+    with Image.open(path) as image:
+        image = image.convert("L")
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+        return backend.extract_text(image).strip()
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def dedupe_by_hash(hashes: List[int], max_distance: int) -> Dict[int, int]:
+    """Map the index of each near-duplicate image to the index of the first image it matches"""
+    duplicates = {}
+    kept: List[int] = []
+    for i, value in enumerate(hashes):
+        match = next((k for k in kept if hamming(hashes[k], value) <= max_distance), None)
+        if match is None:
+            kept.append(i)
+        else:
+            duplicates[i] = match
+    return duplicates
+
+class ImageExtraction:
+    """Text extracted from a batch of images"""
+
+    def __init__(self, paths: List[str], texts: Dict[int, str], duplicates: Dict[int, int]):
+        self.paths = paths
+        self.texts = texts
+        self.duplicates = duplicates
+
+    @property
+    def combined_text(self) -> str:
+        """All extracted text, labelled by image, in the form Leo expects"""
+        sections = []
+        for i, path in enumerate(self.paths):
+            if i in self.texts and self.texts[i]:
+                sections.append(f"[Image {i + 1}: {os.path.basename(path)}]\n{self.texts[i]}")
+        return "\n\n".join(sections)
+
+class ImageTextExtractor:
+    """
+    Extracts text from batches of clinical photos in a process pool.
+
+    Decoding, resizing and OCR are CPU-bound, so they run in worker processes where they
+    neither hold the server's GIL nor block its event loop. Each batch is hashed first and
+    near-identical photos (perceptual hash within dedup_distance bits) skip OCR.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[OCRBackend] = None,
+        max_workers: int = 4,
+        max_side: int = 2000,
+        dedup_distance: int = 5
+    ):
+        self.backend = backend or TesseractOCR()
+        self.max_side = max_side
+        self.dedup_distance = dedup_distance
+        # Spawn rather than fork: the server process has live threads
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def extract(self, paths: List[str]) -> ImageExtraction:
+        loop = asyncio.get_running_loop()
+        hashes = await asyncio.gather(*(loop.run_in_executor(self.pool, dhash, path) for path in paths))
+        duplicates = dedupe_by_hash(list(hashes), self.dedup_distance)
+        if duplicates:
+            logger.info("Skipping OCR for %d near-duplicate images", len(duplicates))
+
+        unique = [i for i in range(len(paths)) if i not in duplicates]
+        texts = await asyncio.gather(*(
+            loop.run_in_executor(self.pool, ocr_image, paths[i], self.backend, self.max_side) for i in unique
+        ))
+        return ImageExtraction(paths, dict(zip(unique, texts)), duplicates)
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
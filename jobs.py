@@ -0,0 +1,274 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from datetime import datetime
+import asyncio
+import functools
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+# How often a waiter re-reads a job, which another process sharing the store may be running
+POLL_SECONDS = 1.0
+
+class JobStore:
+    """
+    SQLite-backed job state, so queued work survives a worker restart.
+
+    A job is run by whichever process claims it first. The claim is a lease that its owner
+    renews while the job runs; a running job whose lease has lapsed was abandoned by a
+    process that died, and may be claimed again.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                owner TEXT,
+                lease_until REAL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def create(self, kind: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(payload), now, now)
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def update(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, datetime.now().isoformat(), job_id)
+            )
+
+    def claim(self, job_id: str, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Mark the job running for owner and return it, if it is queued or its running owner's
+        lease has lapsed; None if another process has it or it is finished
+        """
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                """
+                UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated_at = ?
+                WHERE id = ? AND (status = ? OR (status = ? AND COALESCE(lease_until, 0) < ?))
+                """,
+                (RUNNING, owner, now + lease_seconds, datetime.now().isoformat(), job_id, QUEUED, RUNNING, now)
+            ).rowcount
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone() if claimed else None
+        return self._to_dict(row) if row else None
+
+    def renew(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """Extend owner's lease on a running job; False if it no longer holds it"""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time() + lease_seconds, job_id, owner, RUNNING)
+            ).rowcount == 1
+
+    def finish(self, job_id: str, owner: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> bool:
+        """Record the outcome of a job owner holds; False, leaving it alone, if it does not"""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ? AND owner = ? AND status = ?",
+                (status, json.dumps(result) if result is not None else None, error, datetime.now().isoformat(), job_id, owner, RUNNING)
+            ).rowcount == 1
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Jobs that may be claimed: queued, or running under a lapsed lease; oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? OR (status = ? AND COALESCE(lease_until, 0) < ?) ORDER BY created_at",
+                (QUEUED, RUNNING, time.time())
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+class JobQueue:
+    """
+    Runs persisted jobs on a fixed number of asyncio workers.
+
+    Handlers are registered per job kind and receive the job payload. Several processes may
+    share one store: each job is run by the process that claims it (JobStore.claim), which
+    renews its lease every lease_seconds / 3 while the job runs. On start, and every
+    lease_seconds after, queued jobs and jobs whose owner's lease has lapsed are picked up.
+    The store is read and written in the default executor, so SQLite never blocks the event
+    loop.
+    """
+
+    def __init__(self, store: JobStore, concurrency: int = 4, lease_seconds: float = 60.0):
+        self.store = store
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self.handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[str] = set()  # Job IDs in _queue
+        self._workers: List[asyncio.Task] = []
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self.handlers[kind] = handler
+
+    async def _io(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        await self._recover()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._sweep()))
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _recover(self) -> None:
+        """Queue the jobs no live process holds"""
+        for job in await self._io(self.store.unfinished):
+            self._enqueue(job["id"])
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                await self._recover()
+            except Exception:
+                logger.exception("Error looking for abandoned jobs")
+
+    async def _renew(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await self._io(self.store.renew, job_id, self.owner, self.lease_seconds):
+                    logger.warning("Lost the lease on job %s", job_id)
+                    return
+            except Exception:
+                logger.exception("Error renewing the lease on job %s", job_id)
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = await self._io(self.store.create, kind, payload)
+        self._enqueue(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._io(self.store.get, job_id)
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait until a job finishes and return it, or None if it is unknown"""
+        job = await self.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = None if timeout is None else loop.time() + timeout
+            while True:
+                # Re-check in case the job finished between the read and registering the
+                # waiter, or in another process
+                job = await self.get(job_id)
+                if job["status"] in FINISHED_STATUSES:
+                    return job
+                wait = POLL_SECONDS if deadline is None else min(POLL_SECONDS, deadline - loop.time())
+                if wait <= 0:
+                    raise asyncio.TimeoutError
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            waiters = self._waiters.get(job_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(job_id, None)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = await self._io(self.store.claim, job_id, self.owner, self.lease_seconds)
+        if job is None:
+            # Finished, or another process is running it
+            return
+        renewing = asyncio.create_task(self._renew(job_id))
+        try:
+            result = await self.handlers[job["kind"]](job["payload"])
+            outcome = {"status": SUCCEEDED, "result": result}
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            outcome = {"status": FAILED, "error": str(e)}
+        finally:
+            renewing.cancel()
+        if not await self._io(self.store.finish, job_id, self.owner, **outcome):
+            logger.warning("Job %s lost its lease before finishing; its outcome was not recorded", job_id)
+
+        job = await self.get(job_id)
+        for future in self._waiters.pop(job_id, []):
+            if not future.done():
+                future.set_result(job)
@@ -0,0 +1,135 @@
+from typing import Any, Dict, List, Tuple
+import json
+
+# Event kinds returned by IncrementalJSONParser.feed
+DELTA = "delta"  # (DELTA, key, text): more characters of a top-level string value
+VALUE = "value"  # (VALUE, key, value): a top-level value is complete
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+class IncrementalJSONParser:
+    """
+    Parse a streamed JSON object one chunk at a time.
+
+    Built for LLM output: anything before the first '{' (such as a ```json fence) is skipped.
+    String values at the top level are reported character by character as DELTA events so
+    narrative fields can be shown while they are generated; every top-level value is reported
+    as a VALUE event once complete. Nested values are buffered and decoded with json.loads.
+    """
+
+    def __init__(self):
+        self.result: Dict[str, Any] = {}
+        self.done = False
+        self._state = "start"
+        self._key = ""
+        self._buffer: List[str] = []
+        self._escape = ""
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        events: List[Tuple[str, str, Any]] = []
+        delta: List[str] = []
+        for char in chunk:
+            if self.done:
+                break
+            state = self._state
+            if state == "start":
+                if char == "{":
+                    self._state = "key_or_end"
+            elif state == "key_or_end":
+                if char == '"':
+                    self._state = "key"
+                    self._buffer = []
+                elif char == "}":
+                    self.done = True
+                elif not char.isspace() and char != ",":
+                    raise ValueError(f"Unexpected character in JSON object: {char!r}")
+            elif state == "key":
+                if self._escape:
+                    self._buffer.append(self._decode_escape(char))
+                elif char == "\\":
+                    self._escape = "\\"
+                elif char == '"':
+                    self._key = "".join(self._buffer)
+                    self._state = "colon"
+                else:
+                    self._buffer.append(char)
+            elif state == "colon":
+                if char == ":":
+                    self._state = "value_start"
+                elif not char.isspace():
+                    raise ValueError(f"Expected ':' after key {self._key!r}")
+            elif state == "value_start":
+                if char.isspace():
+                    continue
+                self._buffer = []
+                if char == '"':
+                    self._state = "string"
+                else:
+                    self._state = "raw"
+                    self._depth = 0
+                    self._in_string = False
+                    self._feed_raw(char, events)
+            elif state == "string":
+                decoded = ""
+                if self._escape:
+                    decoded = self._decode_escape(char)
+                elif char == "\\":
+                    self._escape = "\\"
+                elif char == '"':
+                    if delta:
+                        events.append((DELTA, self._key, "".join(delta)))
+                        delta = []
+                    self._finish_value("".join(self._buffer), events)
+                else:
+                    decoded = char
+                if decoded:
+                    self._buffer.append(decoded)
+                    delta.append(decoded)
+            elif state == "raw":
+                self._feed_raw(char, events)
+        if delta:
+            events.append((DELTA, self._key, "".join(delta)))
+        return events
+
+    def _decode_escape(self, char: str) -> str:
+        """Consume one character of an escape sequence, returning any decoded text"""
+        self._escape += char
+        if self._escape[1] == "u":
+            if len(self._escape) < 6:
+                return ""
+            decoded = chr(int(self._escape[2:], 16))
+        else:
+            decoded = _ESCAPES.get(char, char)
+        self._escape = ""
+        return decoded
+
+    def _feed_raw(self, char: str, events: List[Tuple[str, str, Any]]) -> None:
+        """Buffer a non-string value until it ends at depth zero"""
+        if self._in_string:
+            self._buffer.append(char)
+            if self._escape:
+                self._escape = ""
+            elif char == "\\":
+                self._escape = "\\"
+            elif char == '"':
+                self._in_string = False
+            return
+        if self._depth == 0 and char in ",}":
+            self._finish_value(json.loads("".join(self._buffer)), events)
+            if char == "}":
+                self.done = True
+            return
+        self._buffer.append(char)
+        if char == '"':
+            self._in_string = True
+        elif char in "[{":
+            self._depth += 1
+        elif char in "]}":
+            self._depth -= 1
+
+    def _finish_value(self, value: Any, events: List[Tuple[str, str, Any]]) -> None:
+        self.result[self._key] = value
+        events.append((VALUE, self._key, value))
+        self._state = "key_or_end"
@@ -1,9 +1,59 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Iterator, Union
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+import asyncio
+import copy
 import json
+import time
 from config import Config
 from llm_interface import LLMInterface, OpenAILLM
+from async_llm import AsyncLLMInterface, ExecutorLLM, run_in_executor
+from delegating_llm import supports_encounter
+from stage_graph import StageGraph, StageResult
+from json_stream import IncrementalJSONParser, DELTA
+from llm_cache import LLMResponseCache, CachedLLM, bypass_llm_cache
+from structured_extraction import extract_structured
+from note_diff import NoteDiff, diff_notes
+from note_store import NoteStore
+from trends import analyze as analyze_trends
+from context_packer import ContextPacker, PackedText, TokenCounter, TokenUsage
+from transcript_segments import split_transcript, merge_extractions
+from combined_extraction import EncounterExtraction, EncounterInputs, OpenAIEncounterLLM
+from streamed_extraction import OpenAIStreamingLLM
+from provider_client import shared_client
+from llm_scheduler import LLMScheduler, ScheduledLLM, llm_priority
+from model_router import ModelRouter, RoutedLLM, TimedLLM, recording_routes
+from metrics import MeteredLLM, STAGE_SECONDS, record_provider_usage
+from resilience import (
+    CircuitOpenError, DeadlineExceeded, GuardedLLM, check_deadline, circuit_breaker, current_deadline, deadline_scope,
+    remaining_time
+)
+
+# Pipeline stages in the order their results are applied to the note
+STAGE_ORDER = ("audio", "image", "compare")
+STAGE_ERRORS = {
+    "audio": "Error processing audio transcript",
+    "image": "Error processing image text",
+    "compare": "Error comparing notes"
+}
+# Sections missing from a note when a stage did not finish
+STAGE_SECTIONS = {
+    "audio": ("subjective", "vitals", "labs", "assessment", "plan"),
+    "image": ("vitals", "labs", "other data"),
+    "compare": ("changes since last note",)
+}
+# Note sections and the stages that write them; a section is final once its writers finish
+SECTION_WRITERS = {
+    "subjective": ("audio",),
+    "assessment": ("audio",),
+    "plan": ("audio",),
+    "objective": ("audio", "image"),
+    "action_items": ("audio", "image"),
+    "changes_since_last_note": ("compare",)
+}
+# Free-text sections streamed token by token
+NARRATIVE_SECTIONS = ("subjective", "assessment", "plan")
 
 class ClinicalInput(BaseModel):
     """Model for clinical input data"""
@@ -11,6 +61,7 @@ class ClinicalInput(BaseModel):
     extracted_text_from_images: Optional[str] = None
     previous_note: Optional[str] = None
     patient_info: Optional[Dict[str, Any]] = None
+    bypass_cache: bool = False  # Call the model even if a cached response exists
 
 class ProgressNote(BaseModel):
     """Model for structured progress note"""
@@ -24,13 +75,35 @@ class ProgressNote(BaseModel):
     changes_since_last_note: str
     action_items: List[str]
     discrepancies: List[str]
+    stage_timings: Dict[str, float] = {}  # Seconds spent in each pipeline stage
+    token_usage: Dict[str, int] = {}  # Tokens sent to and received from the model
+    llm_routes: List[Dict[str, str]] = []  # The model each call went to, and why
 
 class Leo:
     """Clinical Documentation AI Assistant"""
     
-    def __init__(self, config: Optional[Config] = None, llm: Optional[LLMInterface] = None):
+    def __init__(
+        self,
+        config: Optional[Config] = None,
+        llm: Optional[LLMInterface] = None,
+        async_llm: Optional[AsyncLLMInterface] = None,
+        note_store: Optional[NoteStore] = None
+    ):
         self.config = config or Config()
+        self.note_store = note_store
+        self.packer = ContextPacker(
+            TokenCounter(self.config.llm.model),
+            recent_share=self.config.clinical_note.context_recent_share
+        )
+        self.scheduler: Optional[LLMScheduler] = None
+        self.router: Optional[ModelRouter] = None
+        self.llm_cache: Optional[LLMResponseCache] = None
         self.llm = llm or self._initialize_llm()
+        max_workers = self.config.llm.max_concurrent_requests
+        if self.scheduler is not None:
+            # Calls waiting for admission hold a worker too, and must not keep new ones from queueing
+            max_workers += self.config.llm_scheduler.max_queued
+        self.async_llm = async_llm or ExecutorLLM(self.llm, max_workers=max_workers)
         self.note_template = {
             "subjective": "",
             "objective": {
@@ -48,32 +121,531 @@ class Leo:
 
     def _initialize_llm(self) -> LLMInterface:
         """Initialize the appropriate LLM based on configuration"""
-        if self.config.llm.provider == "openai":
-            return OpenAILLM(self.config.llm)
-        else:
+        if self.config.llm.provider != "openai":
             raise ValueError(f"Unsupported LLM provider: {self.config.llm.provider}")
 
+        # Provider calls share one keep-alive connection pool with transcription
+        client = shared_client(self.config.provider)
+        scheduler_config = self.config.llm_scheduler
+        if scheduler_config.enabled:
+            # Shared by every model, inside the cache so cached responses are not held back by rate limits
+            self.scheduler = LLMScheduler(
+                scheduler_config.requests_per_minute,
+                scheduler_config.tokens_per_minute,
+                max_in_flight=self.config.llm.max_concurrent_requests,
+                burst_seconds=scheduler_config.burst_seconds
+            )
+            client.on_response(lambda response: self.scheduler.observe(response.headers))
+        # Token metrics come from the usage each response reports
+        client.on_response(record_provider_usage)
+
+        cache_config = self.config.llm_cache
+        if cache_config.enabled:
+            self.llm_cache = LLMResponseCache(
+                cache_config.db_path,
+                ttl_seconds=cache_config.ttl_seconds,
+                memory_entries=cache_config.memory_entries,
+                max_bytes=cache_config.max_bytes,
+                sweep_seconds=cache_config.sweep_seconds
+            )
+
+        if self.config.routing.enabled:
+            self.router = ModelRouter(self.config.routing, self.config.llm.model)
+            return RoutedLLM(
+                {model: self._provider_llm(model) for model in self.router.models()},
+                self.router,
+                self.packer.counter
+            )
+        return self._provider_llm(self.config.llm.model)
+
+    def _provider_llm(self, model: str) -> LLMInterface:
+        """Calls to one model, rate limited, behind the model's circuit breaker and cached under the model"""
+        llm_config = self.config.llm.model_copy(update={"model": model})
+        llm = OpenAILLM(llm_config)
+        if self.config.clinical_note.stream_extraction:
+            llm = OpenAIStreamingLLM(llm, llm_config)
+        if self.config.clinical_note.single_pass_extraction:
+            llm = OpenAIEncounterLLM(llm, llm_config)
+        # Innermost, so only time spent with the provider is counted
+        llm = MeteredLLM(llm, model)
+        if self.scheduler is not None:
+            llm = ScheduledLLM(llm, self.scheduler, self.packer.counter, llm_config.max_tokens)
+        # Outside the scheduler, so calls to a failing provider do not queue for rate limits first
+        llm = GuardedLLM(llm, circuit_breaker(
+            llm_config.provider,
+            model,
+            failure_threshold=self.config.deadlines.breaker_failures,
+            reset_seconds=self.config.deadlines.breaker_reset_seconds
+        ))
+        if self.router is not None:
+            llm = TimedLLM(llm, model, self.router.tracker)
+        if self.llm_cache is not None:
+            # Keyed on this model, so responses from one routed model are never served for another
+            llm = CachedLLM(llm, llm_config, self.llm_cache)
+        return llm
+
     def process_input(self, input_data: ClinicalInput) -> ProgressNote:
         """
-        Process clinical input data and generate a structured progress note
+        Process clinical input data and generate a structured progress note.
+
+        Transcript and image extraction run concurrently; the comparison with the
+        previous note starts once both have finished. With single_pass_extraction, all three
+        are one model call instead.
         """
+        if self._single_pass():
+            return self._process_encounter(input_data)
+
         # Initialize note with basic structure
-        note = self.note_template.copy()
+        note = copy.deepcopy(self.note_template)
+        usage = TokenUsage()
         
-        # Process transcribed audio
+        graph = StageGraph()
         if input_data.transcribed_audio:
-            self._process_audio_transcript(input_data.transcribed_audio, note)
-        
-        # Process extracted text from images
+            graph.add("audio", self._budgeted("audio", lambda deps: self._extract_transcript(input_data.transcribed_audio, self.llm.process_clinical_conversation, usage)))
         if input_data.extracted_text_from_images:
-            self._process_image_text(input_data.extracted_text_from_images, note)
+            graph.add("image", self._budgeted("image", lambda deps: self._extract(input_data.extracted_text_from_images, self.llm.process_clinical_image, usage)))
+        previous = self._previous_note(input_data)
+        if previous is not None:
+            def compare(deps: Dict[str, StageResult]) -> Dict[str, Any]:
+                draft = self._draft_note(note, deps)
+                diff = self._diff_with_previous(previous, draft)
+                if diff is None:
+                    packed = self._pack_previous_note(input_data, previous)
+                    result = self._counted(
+                        usage, self.llm.compare_notes, packed.text, self._format_working_note(draft), trimmed=packed.trimmed
+                    )
+                elif not diff.changed_narrative:
+                    result = diff.as_result()
+                else:
+                    result = diff.merge_into(self._counted(
+                        usage, self.llm.compare_notes, diff.narrative(diff.previous), diff.narrative(draft)
+                    ))
+                return self._with_history_trends(input_data, draft, result)
+            graph.add("compare", self._budgeted("compare", compare), depends_on=("audio", "image"))
         
-        # Compare with previous note if available
+        with self._request_context(input_data) as routes:
+            # Stage threads cannot be interrupted; provider calls are cut off at the deadline
+            # by the HTTP client, and anything else still running is abandoned
+            results = graph.run(timeout=remaining_time())
+        self._merge_stage_results(note, results)
+        return self._build_progress_note(input_data, note, results, usage, routes)
+
+    async def aprocess_input(self, input_data: ClinicalInput) -> ProgressNote:
+        """
+        Async version of process_input; LLM calls are awaited instead of blocking the event loop
+        """
+        if self._single_pass():
+            return await self._aprocess_encounter(input_data)
+
+        note = copy.deepcopy(self.note_template)
+        usage = TokenUsage()
+        # The note store is SQLite, so it is read and written off the event loop
+        previous = await run_in_executor(None, self._previous_note, input_data)
+        with self._request_context(input_data) as routes:
+            results = await self._async_stage_graph(input_data, previous, note, usage).arun()
+        self._merge_stage_results(note, results)
+        return await run_in_executor(None, self._build_progress_note, input_data, note, results, usage, routes)
+
+    async def astream_input(self, input_data: ClinicalInput) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Like aprocess_input, but yield events while the note is being built:
+
+        - {"event": "delta", "section", "text"}: more text of a narrative section, streamed
+          from the model's output as it is generated
+        - {"event": "section", "section", "content"}: a section is final
+        - {"event": "missing", "section", "errors"}: every stage writing a section failed or
+          timed out, so it stays empty; errors maps each of those stages to its error
+        - {"event": "note", "note"}: the finished ProgressNote
+
+        Streaming always uses the per-stage calls, even with single_pass_extraction, so that
+        sections can be sent as they finish.
+        """
+        note = copy.deepcopy(self.note_template)
+        usage = TokenUsage()
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def stream_conversation(transcript: str) -> Dict[str, Any]:
+            parser = IncrementalJSONParser()
+            async for chunk in self.async_llm.stream_clinical_conversation(transcript):
+                for kind, key, value in parser.feed(chunk):
+                    if kind == DELTA and key in NARRATIVE_SECTIONS:
+                        events.put_nowait({"event": "delta", "section": key, "text": value})
+            if not parser.done:
+                raise ValueError("Model output ended before the JSON object was complete")
+            return parser.result
+
+        async def stream_audio(deps: Dict[str, StageResult]) -> Dict[str, Any]:
+            return await self._aextract_transcript(input_data.transcribed_audio, stream_conversation, usage)
+
+        previous = await run_in_executor(None, self._previous_note, input_data)
+        graph = self._async_stage_graph(input_data, previous, note, usage, audio=stream_audio)
+        finished: Dict[str, StageResult] = {}
+        pending_sections = {
+            section: [writer for writer in writers if writer in graph]
+            for section, writers in SECTION_WRITERS.items()
+        }
+
+        def on_complete(result: StageResult) -> None:
+            finished[result.name] = result
+            draft = self._draft_note(note, finished)
+            for section, writers in list(pending_sections.items()):
+                if writers and all(writer in finished for writer in writers):
+                    if all(finished[writer].error is not None for writer in writers):
+                        errors = {writer: str(finished[writer].error) for writer in writers}
+                        events.put_nowait({"event": "missing", "section": section, "errors": errors})
+                    else:
+                        events.put_nowait({"event": "section", "section": section, "content": draft[section]})
+                    del pending_sections[section]
+
+        with self._request_context(input_data) as routes:
+            # The task copies the current context, so the bypass flag and scheduling reach every stage
+            run = asyncio.ensure_future(graph.arun(on_complete=on_complete))
+        run.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            results = run.result()
+        finally:
+            # Stop the pipeline if the consumer goes away early
+            run.cancel()
+
+        self._merge_stage_results(note, results)
+        progress_note = await run_in_executor(None, self._build_progress_note, input_data, note, results, usage, routes)
+        yield {"event": "note", "note": progress_note}
+
+    def _async_stage_graph(
+        self,
+        input_data: ClinicalInput,
+        previous: Optional[Union[str, ProgressNote]],
+        note: Dict[str, Any],
+        usage: TokenUsage,
+        audio: Optional[Callable[[Dict[str, StageResult]], Awaitable[Dict[str, Any]]]] = None
+    ) -> StageGraph:
+        """Build the async stage graph; audio overrides the default transcript stage"""
+        graph = StageGraph()
+        if input_data.transcribed_audio:
+            graph.add("audio", self._abudgeted("audio", audio or (lambda deps: self._aextract_transcript(input_data.transcribed_audio, self.async_llm.process_clinical_conversation, usage))))
+        if input_data.extracted_text_from_images:
+            graph.add("image", self._abudgeted("image", lambda deps: self._aextract(input_data.extracted_text_from_images, self.async_llm.process_clinical_image, usage)))
+        if previous is not None:
+            async def compare(deps: Dict[str, StageResult]) -> Dict[str, Any]:
+                draft = self._draft_note(note, deps)
+                diff = self._diff_with_previous(previous, draft)
+                if diff is None:
+                    packed = self._pack_previous_note(input_data, previous)
+                    result = await self._acounted(
+                        usage, self.async_llm.compare_notes, packed.text, self._format_working_note(draft), trimmed=packed.trimmed
+                    )
+                elif not diff.changed_narrative:
+                    result = diff.as_result()
+                else:
+                    result = diff.merge_into(await self._acounted(
+                        usage, self.async_llm.compare_notes, diff.narrative(diff.previous), diff.narrative(draft)
+                    ))
+                # Reading the history is a SQLite query, so keep it off the event loop
+                return await run_in_executor(None, self._with_history_trends, input_data, draft, result)
+            graph.add("compare", self._abudgeted("compare", compare), depends_on=("audio", "image"))
+        return graph
+
+    def _extract(self, text: str, call: Callable[[str], Dict[str, Any]], usage: TokenUsage) -> Dict[str, Any]:
+        """
+        Run one extraction stage: vitals and labs the model leaves out come from local patterns,
+        and the model is skipped entirely if the text holds nothing else. The model sees the
+        text packed into the token budget.
+        """
+        rules = extract_structured(text) if self.config.clinical_note.rule_based_extraction else None
+        if rules is not None and rules.is_structured and self.config.clinical_note.skip_llm_for_structured_input:
+            return rules.as_result()
+        packed = self.packer.pack(text, self.config.clinical_note.max_note_length)
+        result = self._counted(usage, call, packed.text, trimmed=packed.trimmed)
+        return rules.merge_into(result) if rules is not None else result
+
+    async def _aextract(self, text: str, call: Callable[[str], Awaitable[Dict[str, Any]]], usage: TokenUsage) -> Dict[str, Any]:
+        """Async version of _extract"""
+        rules = extract_structured(text) if self.config.clinical_note.rule_based_extraction else None
+        if rules is not None and rules.is_structured and self.config.clinical_note.skip_llm_for_structured_input:
+            return rules.as_result()
+        packed = self.packer.pack(text, self.config.clinical_note.max_note_length)
+        result = await self._acounted(usage, call, packed.text, trimmed=packed.trimmed)
+        return rules.merge_into(result) if rules is not None else result
+
+    def _transcript_segments(self, transcript: str) -> List[str]:
+        """
+        Segments for map-reduce extraction; a single segment means the transcript fits in
+        one prompt, or map-reduce is off and it will be packed instead
+        """
+        clinical_note = self.config.clinical_note
+        if not clinical_note.map_reduce_extraction:
+            return [transcript]
+        if self.packer.counter.count(transcript) <= clinical_note.max_note_length:
+            return [transcript]
+        return split_transcript(transcript, clinical_note.map_reduce_segment_tokens, self.packer.counter.count)
+
+    def _extract_transcript(self, transcript: str, call: Callable[[str], Dict[str, Any]], usage: TokenUsage) -> Dict[str, Any]:
+        """
+        Extract from a transcript; one too long for a single prompt is split into segments that
+        are extracted concurrently and merged
+        """
+        segments = self._transcript_segments(transcript)
+        if len(segments) == 1:
+            return self._extract(transcript, call, usage)
+        graph = StageGraph()
+        for i, segment in enumerate(segments):
+            graph.add(f"segment {i}", lambda deps, segment=segment: self._extract(segment, call, usage))
+        results = graph.run(timeout=remaining_time())
+        for result in results.values():
+            if result.error is not None:
+                raise result.error
+        return merge_extractions([results[f"segment {i}"].value for i in range(len(segments))])
+
+    async def _aextract_transcript(self, transcript: str, call: Callable[[str], Awaitable[Dict[str, Any]]], usage: TokenUsage) -> Dict[str, Any]:
+        """
+        Async version of _extract_transcript. Segments are extracted without streaming, since
+        their deltas would interleave
+        """
+        segments = self._transcript_segments(transcript)
+        if len(segments) == 1:
+            return await self._aextract(transcript, call, usage)
+        results = await asyncio.gather(*(
+            self._aextract(segment, self.async_llm.process_clinical_conversation, usage) for segment in segments
+        ))
+        return merge_extractions(list(results))
+
+    @contextmanager
+    def _request_context(self, input_data: ClinicalInput) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Cache bypass, the patient to schedule by, and the deadline (the caller's, or
+        request_seconds if it set none) for the model calls made for input_data; yields the
+        models they are routed to
+        """
+        mrn = input_data.patient_info.get("mrn") if input_data.patient_info else None
+        with (
+            bypass_llm_cache(input_data.bypass_cache),
+            llm_priority(mrn=mrn),
+            deadline_scope(self.config.deadlines.request_seconds if current_deadline() is None else None),
+            recording_routes() as routes
+        ):
+            yield routes
+
+    def _stage_seconds(self, stage: str) -> Optional[float]:
+        deadlines = self.config.deadlines
+        if stage == "compare":
+            return deadlines.compare_seconds
+        if stage == "encounter" and deadlines.extraction_seconds is not None and deadlines.compare_seconds is not None:
+            # One call doing the work of extraction and then comparison
+            return deadlines.extraction_seconds + deadlines.compare_seconds
+        return deadlines.extraction_seconds
+
+    def _budgeted(self, stage: str, func: Callable[[Dict[str, StageResult]], Any]) -> Callable[[Dict[str, StageResult]], Any]:
+        """Run a stage within its time budget, and never past the request's deadline"""
+        def run(deps: Dict[str, StageResult]) -> Any:
+            with deadline_scope(self._stage_seconds(stage)):
+                check_deadline(f"the {stage} stage")
+                return func(deps)
+        return run
+
+    def _abudgeted(
+        self,
+        stage: str,
+        func: Callable[[Dict[str, StageResult]], Awaitable[Any]]
+    ) -> Callable[[Dict[str, StageResult]], Awaitable[Any]]:
+        """Async version of _budgeted; the stage is cancelled when its budget runs out"""
+        async def run(deps: Dict[str, StageResult]) -> Any:
+            with deadline_scope(self._stage_seconds(stage)) as deadline:
+                check_deadline(f"the {stage} stage")
+                try:
+                    return await asyncio.wait_for(func(deps), deadline.remaining() if deadline is not None else None)
+                except DeadlineExceeded:
+                    raise
+                except asyncio.TimeoutError as e:
+                    raise DeadlineExceeded(f"The {stage} stage ran out of time") from e
+        return run
+
+    def _single_pass(self) -> bool:
+        return self.config.clinical_note.single_pass_extraction and supports_encounter(self.llm)
+
+    def _process_encounter(self, input_data: ClinicalInput) -> ProgressNote:
+        """process_input in a single model call for the transcript, image text and previous note"""
+        note = copy.deepcopy(self.note_template)
+        usage = TokenUsage()
+        previous = self._previous_note(input_data)
+        inputs = self._encounter_inputs(input_data, previous)
+        result = StageResult("encounter")
+        start = time.perf_counter()
+        call = self._budgeted("encounter", lambda deps: self._counted(
+            usage, self.llm.process_clinical_encounter, *inputs.texts, trimmed=inputs.trimmed
+        ))
+        with self._request_context(input_data) as routes:
+            try:
+                result.value = call({})
+            except Exception as e:
+                result.error = e
+        result.duration = time.perf_counter() - start
+        self._apply_encounter_result(input_data, previous, note, result)
+        return self._build_progress_note(input_data, note, {"encounter": result}, usage, routes)
+
+    async def _aprocess_encounter(self, input_data: ClinicalInput) -> ProgressNote:
+        """Async version of _process_encounter"""
+        note = copy.deepcopy(self.note_template)
+        usage = TokenUsage()
+        previous = await run_in_executor(None, self._previous_note, input_data)
+        inputs = self._encounter_inputs(input_data, previous)
+        result = StageResult("encounter")
+        start = time.perf_counter()
+        call = self._abudgeted("encounter", lambda deps: self._acounted(
+            usage, self.async_llm.process_clinical_encounter, *inputs.texts, trimmed=inputs.trimmed
+        ))
+        with self._request_context(input_data) as routes:
+            try:
+                result.value = await call({})
+            except Exception as e:
+                result.error = e
+        result.duration = time.perf_counter() - start
+        # Local diffing and the history trends read SQLite, so keep them off the event loop
+        await run_in_executor(None, self._apply_encounter_result, input_data, previous, note, result)
+        return await run_in_executor(None, self._build_progress_note, input_data, note, {"encounter": result}, usage, routes)
+
+    def _encounter_inputs(self, input_data: ClinicalInput, previous: Optional[Union[str, ProgressNote]]) -> EncounterInputs:
+        """The texts for a single-pass call, each packed to the budget of the stage it replaces"""
+        budget = self.config.clinical_note.max_note_length
+        transcript = self.packer.pack(input_data.transcribed_audio or "", budget)
+        image_text = self.packer.pack(input_data.extracted_text_from_images or "", budget)
+        previous_note = self._pack_previous_note(input_data, previous) if previous is not None else PackedText("", 0, 0)
+        return EncounterInputs(
+            transcript.text,
+            image_text.text,
+            previous_note.text,
+            trimmed=transcript.trimmed + image_text.trimmed + previous_note.trimmed
+        )
+
+    def _apply_encounter_result(
+        self,
+        input_data: ClinicalInput,
+        previous: Optional[Union[str, ProgressNote]],
+        note: Dict[str, Any],
+        result: StageResult
+    ) -> None:
+        """
+        Apply a single-pass result as the audio, image and compare stages it replaces would
+        have been applied: rule-based readings and the local diff and trends still take
+        precedence, and a failed call is a discrepancy for each of those stages
+        """
+        stages = {
+            name: StageResult(name) for name, present in (
+                ("audio", input_data.transcribed_audio),
+                ("image", input_data.extracted_text_from_images),
+                ("compare", previous is not None)
+            ) if present
+        }
+        values: Dict[str, Dict[str, Any]] = {}
+        if result.error is None:
+            try:
+                values = EncounterExtraction.model_validate(result.value).stage_results()
+            except Exception as e:
+                result.error = e
+        for name, stage in stages.items():
+            stage.error = result.error
+
+        texts = {"audio": input_data.transcribed_audio, "image": input_data.extracted_text_from_images}
+        for name in ("audio", "image"):
+            if name in stages and stages[name].error is None:
+                value = values[name]
+                if self.config.clinical_note.rule_based_extraction:
+                    value = extract_structured(texts[name]).merge_into(value)
+                stages[name].value = value
+        self._merge_stage_results(note, {name: stage for name, stage in stages.items() if name != "compare"})
+
+        if "compare" in stages and result.error is None:
+            try:
+                diff = self._diff_with_previous(previous, note)
+                value = diff.merge_into(values["compare"]) if diff is not None else values["compare"]
+                stages["compare"].value = self._with_history_trends(input_data, note, value)
+            except Exception as e:
+                stages["compare"].error = e
+        if "compare" in stages:
+            self._merge_stage_results(note, {"compare": stages["compare"]})
+
+    def _counted(self, usage: TokenUsage, call: Callable[..., Dict[str, Any]], *texts: str, trimmed: int = 0) -> Dict[str, Any]:
+        """Call the model, adding the tokens in and out to usage"""
+        result = call(*texts)
+        usage.add(self._tokens(*texts), self._tokens(json.dumps(result, default=str)), trimmed)
+        return result
+
+    async def _acounted(self, usage: TokenUsage, call: Callable[..., Awaitable[Dict[str, Any]]], *texts: str, trimmed: int = 0) -> Dict[str, Any]:
+        """Async version of _counted"""
+        result = await call(*texts)
+        usage.add(self._tokens(*texts), self._tokens(json.dumps(result, default=str)), trimmed)
+        return result
+
+    def _tokens(self, *texts: str) -> int:
+        return sum(self.packer.counter.count(text) for text in texts)
+
+    def _pack_previous_note(self, input_data: ClinicalInput, previous: Union[str, ProgressNote]) -> PackedText:
+        """The previous note as sent for a full comparison, compressed to its token budget"""
+        mrn = input_data.patient_info.get("mrn") if input_data.patient_info else None
+        return self.packer.pack_previous_note(
+            self._previous_note_text(previous), self.config.clinical_note.previous_note_tokens, mrn
+        )
+
+    def _previous_note(self, input_data: ClinicalInput) -> Optional[Union[str, ProgressNote]]:
+        """
+        The note to compare against: the one sent with the request, else the patient's
+        latest complete stored note
+        """
         if input_data.previous_note:
-            self._compare_with_previous_note(input_data.previous_note, note)
-        
-        # Create final progress note
-        return ProgressNote(
+            return input_data.previous_note
+        mrn = input_data.patient_info.get("mrn") if input_data.patient_info else None
+        if self.note_store is None or not mrn:
+            return None
+        stored = self.note_store.latest(mrn)
+        return ProgressNote.model_validate(stored) if stored else None
+
+    def _previous_note_text(self, previous: Union[str, ProgressNote]) -> str:
+        return previous if isinstance(previous, str) else self._render_note(previous)
+
+    def _diff_with_previous(self, previous: Union[str, ProgressNote], draft: Dict[str, Any]) -> Optional[NoteDiff]:
+        """
+        Diff the draft against the previous note locally; None means the model must compare
+        the whole notes, because the diff is disabled or the previous note is not Leo's format
+        """
+        if not self.config.clinical_note.local_note_diff:
+            return None
+        if isinstance(previous, ProgressNote):
+            return NoteDiff(previous.model_dump(), draft)
+        return diff_notes(previous, draft)
+
+    def _with_history_trends(self, input_data: ClinicalInput, draft: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Replace the comparison's trends with ones computed over the patient's stored notes
+        and this draft, if there are any
+        """
+        mrn = input_data.patient_info.get("mrn") if input_data.patient_info else None
+        if self.note_store is None or not mrn or not self.config.clinical_note.history_trends:
+            return result
+        since = datetime.now() - timedelta(days=self.config.clinical_note.trend_window_days)
+        history = self.note_store.history(mrn, start=since)
+        history.append({"date": datetime.now(), "objective": draft["objective"]})
+        trends = analyze_trends({mrn: history})[mrn]
+        return {**result, "trends": trends} if trends else result
+
+    def _build_progress_note(
+        self,
+        input_data: ClinicalInput,
+        note: Dict[str, Any],
+        results: Dict[str, StageResult],
+        usage: TokenUsage,
+        routes: List[Dict[str, Any]]
+    ) -> ProgressNote:
+        """
+        Create the final progress note from the working note dict, saving it to the patient's
+        history; marked partial there if a stage failed, so it is not compared against next
+        """
+        for name, result in results.items():
+            STAGE_SECONDS.observe(result.duration, name)
+        progress_note = ProgressNote(
             patient_name=input_data.patient_info.get("name") if input_data.patient_info else None,
             mrn=input_data.patient_info.get("mrn") if input_data.patient_info else None,
             date=datetime.now(),
@@ -83,91 +655,119 @@ class Leo:
             plan=note["plan"],
             changes_since_last_note=note["changes_since_last_note"],
             action_items=note["action_items"],
-            discrepancies=note["discrepancies"]
+            discrepancies=note["discrepancies"],
+            stage_timings={name: result.duration for name, result in results.items()},
+            token_usage=usage.as_dict(),
+            llm_routes=list(routes)
         )
+        if self.note_store is not None and progress_note.mrn:
+            partial = any(result.error is not None for result in results.values())
+            self.note_store.save(progress_note.mrn, progress_note.date, progress_note.model_dump(mode="json"), partial=partial)
+        return progress_note
 
-    def _process_audio_transcript(self, transcript: str, note: Dict[str, Any]) -> None:
+    def _draft_note(self, note: Dict[str, Any], results: Dict[str, StageResult]) -> Dict[str, Any]:
         """
-        Process transcribed audio and extract relevant clinical information
+        Return a copy of note with the given stage results merged in
         """
-        try:
-            # Process transcript using LLM
-            result = self.llm.process_clinical_conversation(transcript)
-            
-            # Update note with extracted information
-            note["subjective"] = result.get("subjective", "")
-            note["objective"]["vitals"] = result.get("vitals", [])
-            note["objective"]["labs"] = result.get("labs", [])
-            note["assessment"] = result.get("assessment", "")
-            note["plan"] = result.get("plan", "")
-            
-            # Add any medications to action items
-            for med in result.get("medications", []):
-                note["action_items"].append(f"Review medication: {med}")
-                
-        except Exception as e:
-            note["discrepancies"].append(f"Error processing audio transcript: {str(e)}")
-
-    def _process_image_text(self, image_text: str, note: Dict[str, Any]) -> None:
-        """
-        Process extracted text from images and extract relevant clinical information
+        draft = copy.deepcopy(note)
+        self._merge_stage_results(draft, results)
+        return draft
+
+    def _merge_stage_results(self, note: Dict[str, Any], results: Dict[str, StageResult]) -> None:
         """
-        try:
-            # Process image text using LLM
-            result = self.llm.process_clinical_image(image_text)
-            
-            # Update note with extracted information
-            note["objective"]["vitals"] = result.get("vitals", [])
-            note["objective"]["labs"] = result.get("labs", [])
-            note["objective"]["other_data"] = result.get("other_data", [])
-            
-            # Add any medications to action items
-            for med in result.get("medications", []):
-                note["action_items"].append(f"Review medication: {med}")
-                
-        except Exception as e:
-            note["discrepancies"].append(f"Error processing image text: {str(e)}")
-
-    def _compare_with_previous_note(self, previous_note: str, current_note: Dict[str, Any]) -> None:
-        """
-        Compare current note with previous note to identify changes
+        Apply stage results to note in pipeline order; failed stages become discrepancies
         """
-        try:
-            # Convert current note to string for comparison
-            current_note_str = self.format_note(ProgressNote(
-                date=datetime.now(),
-                subjective=current_note["subjective"],
-                objective=current_note["objective"],
-                assessment=current_note["assessment"],
-                plan=current_note["plan"],
-                changes_since_last_note="",
-                action_items=current_note["action_items"],
-                discrepancies=current_note["discrepancies"]
-            ))
-            
-            # Compare notes using LLM
-            result = self.llm.compare_notes(previous_note, current_note_str)
-            
-            # Update note with comparison results
-            changes = []
-            if result.get("new_findings"):
-                changes.append("New findings: " + ", ".join(result["new_findings"]))
-            if result.get("resolved_issues"):
-                changes.append("Resolved issues: " + ", ".join(result["resolved_issues"]))
-            if result.get("trends"):
-                changes.append("Trends: " + ", ".join(result["trends"]))
-            if result.get("significant_changes"):
-                changes.append("Significant changes: " + ", ".join(result["significant_changes"]))
-            
-            current_note["changes_since_last_note"] = "\n".join(changes)
-            
-        except Exception as e:
-            current_note["discrepancies"].append(f"Error comparing notes: {str(e)}")
+        appliers = {
+            "audio": self._apply_audio_result,
+            "image": self._apply_image_result,
+            "compare": self._apply_comparison_result
+        }
+        for name in STAGE_ORDER:
+            if name not in results:
+                continue
+            result = results[name]
+            try:
+                if result.error is not None:
+                    raise result.error
+                appliers[name](result.value, note)
+            except Exception as e:
+                if isinstance(e, (TimeoutError, CircuitOpenError)):
+                    # The note goes out without this stage's work rather than waiting for it
+                    missing = ", ".join(STAGE_SECTIONS[name])
+                    note["discrepancies"].append(f"{STAGE_ERRORS[name]}: {str(e)} (missing: {missing})")
+                else:
+                    note["discrepancies"].append(f"{STAGE_ERRORS[name]}: {str(e)}")
+
+    def _apply_audio_result(self, result: Dict[str, Any], note: Dict[str, Any]) -> None:
+        """
+        Update note with information extracted from the transcript
+        """
+        note["subjective"] = result.get("subjective", "")
+        note["objective"]["vitals"] = result.get("vitals", [])
+        note["objective"]["labs"] = result.get("labs", [])
+        note["assessment"] = result.get("assessment", "")
+        note["plan"] = result.get("plan", "")
+        if "physical_exam" in result:
+            note["objective"]["physical_exam"] = result["physical_exam"]
+        
+        # Add any medications to action items
+        for med in result.get("medications", []):
+            note["action_items"].append(f"Review medication: {med}")
+
+    def _apply_image_result(self, result: Dict[str, Any], note: Dict[str, Any]) -> None:
+        """
+        Update note with information extracted from image text
+        """
+        note["objective"]["vitals"] = result.get("vitals", [])
+        note["objective"]["labs"] = result.get("labs", [])
+        note["objective"]["other_data"] = result.get("other_data", [])
+        
+        # Add any medications to action items
+        for med in result.get("medications", []):
+            note["action_items"].append(f"Review medication: {med}")
+
+    def _format_working_note(self, current_note: Dict[str, Any]) -> str:
+        """
+        Convert the working note dict to a string for comparison
+        """
+        return self._render_note(ProgressNote(
+            date=datetime.now(),
+            subjective=current_note["subjective"],
+            objective=current_note["objective"],
+            assessment=current_note["assessment"],
+            plan=current_note["plan"],
+            changes_since_last_note="",
+            action_items=current_note["action_items"],
+            discrepancies=current_note["discrepancies"]
+        ))
+
+    def _apply_comparison_result(self, result: Dict[str, Any], current_note: Dict[str, Any]) -> None:
+        """
+        Update note with comparison results
+        """
+        changes = []
+        if result.get("new_findings"):
+            changes.append("New findings: " + ", ".join(result["new_findings"]))
+        if result.get("resolved_issues"):
+            changes.append("Resolved issues: " + ", ".join(result["resolved_issues"]))
+        if result.get("trends"):
+            changes.append("Trends: " + ", ".join(result["trends"]))
+        if result.get("significant_changes"):
+            changes.append("Significant changes: " + ", ".join(result["significant_changes"]))
+        
+        current_note["changes_since_last_note"] = "\n".join(changes)
 
     def format_note(self, note: ProgressNote) -> str:
         """
         Format the progress note according to the specified template
         """
+        start = time.perf_counter()
+        formatted_note = self._render_note(note)
+        STAGE_SECONDS.observe(time.perf_counter() - start, "format_note")
+        return formatted_note
+
+    def _render_note(self, note: ProgressNote) -> str:
+        """format_note without timing it, for notes formatted inside the pipeline"""
         header = f"---\n"
         if note.patient_name or note.mrn:
             header += f"**{note.patient_name or 'Unknown'} / {note.mrn or 'N/A'} / {note.date.strftime('%Y-%m-%d')}**\n\n"
@@ -0,0 +1,232 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from config import LLMConfig
+from delegating_llm import DelegatingLLM
+from llm_interface import LLMInterface
+
+logger = logging.getLogger(__name__)
+
+# Sampling parameters that change what the model returns, and so belong in the cache key
+SAMPLING_FIELDS = ("temperature", "top_p", "max_tokens", "frequency_penalty", "presence_penalty")
+
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+@contextmanager
+def bypass_llm_cache(enabled: bool = True) -> Iterator[None]:
+    """Skip cache reads for LLM calls made in this context; fresh responses are still stored"""
+    token = _bypass.set(enabled or _bypass.get())
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace so trivially reformatted inputs share a cache entry"""
+    return " ".join(text.split())
+
+class LLMResponseCache:
+    """
+    Two-tier cache of LLM responses: an in-memory LRU in front of a SQLite store.
+
+    Entries expire after ttl_seconds in both tiers; expired rows are never served, and are
+    deleted every sweep_seconds. The memory tier holds at most memory_entries responses; the
+    disk tier is trimmed least-recently-used first once its responses exceed max_bytes. The
+    disk tier's size is kept in memory, recounted at each sweep, so a put costs one lookup
+    and one write unless the cache is over its limit. Values are stored as JSON so callers
+    always get a fresh copy.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        ttl_seconds: float = 7 * 24 * 3600,
+        memory_entries: int = 1024,
+        max_bytes: int = 256 * 1024 * 1024,
+        sweep_seconds: float = 600.0
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.sweep_seconds = sweep_seconds
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bytes = 0  # Size of the disk tier's responses
+        self._swept = 0.0
+
+    def _db(self) -> sqlite3.Connection:
+        # Connect lazily so constructing a Leo never touches the disk
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)")
+            self._sweep(time.time())
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(entry[1])
+            self._memory.pop(key, None)
+
+            row = self._db().execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db().execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            self._remember(key, row[1], row[0])
+            self.disk_hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        encoded = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, encoded)
+            db = self._db()
+            replaced = db.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), now, now)
+            )
+            self._bytes += len(encoded) - (replaced[0] if replaced else 0)
+            if now - self._swept >= self.sweep_seconds:
+                self._sweep(now)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _remember(self, key: str, created_at: float, encoded: str) -> None:
+        self._memory[key] = (created_at, encoded)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _sweep(self, now: float) -> None:
+        """Drop expired rows and recount the disk tier's size, which other processes may share"""
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        self._swept = now
+
+    def _evict(self) -> None:
+        """Drop least recently used rows until under max_bytes"""
+        db = self._db()
+        excess = self._bytes - self.max_bytes
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM llm_cache ORDER BY last_used"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self._bytes = excess + self.max_bytes
+        for (key,) in victims:
+            self._memory.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class CachedLLM(DelegatingLLM):
+    """
+    LLMInterface wrapper that serves repeated calls from an LLMResponseCache.
+
+    Keys cover the method, the model and sampling parameters from LLMConfig, and a hash of
+    the whitespace-normalised inputs. Inside bypass_llm_cache() the cache is not read, but
+    the fresh response replaces the stored one. Lookups are blocking SQLite reads, so async
+    callers reach it only through ExecutorLLM's threads, never on the event loop.
+    """
+
+    def __init__(self, llm: LLMInterface, config: LLMConfig, cache: LLMResponseCache):
+        super().__init__(llm)
+        self.config = config
+        self.cache = cache
+
+    def cache_key(self, method: str, *inputs: str) -> str:
+        payload = {
+            "method": method,
+            "provider": self.config.provider,
+            "model": self.config.model,
+            "sampling": {field: getattr(self.config, field) for field in SAMPLING_FIELDS},
+            "inputs": [normalize_prompt(text) for text in inputs]
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _call(self, method: str, *inputs: str) -> Dict[str, Any]:
+        key = self.cache_key(method, *inputs)
+        if _bypass.get():
+            self.cache.bypassed += 1
+        else:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        result = super()._call(method, *inputs)
+        self.cache.put(key, result)
+        return result
+
+    def _stream(self, transcript: str) -> Iterator[str]:
+        """Replay a cached transcript extraction, or stream and cache a fresh one"""
+        key = self.cache_key("process_clinical_conversation", transcript)
+        if _bypass.get():
+            self.cache.bypassed += 1
+        else:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield json.dumps(cached)
+                return
+        chunks = []
+        for chunk in super()._stream(transcript):
+            chunks.append(chunk)
+            yield chunk
+        try:
+            self.cache.put(key, json.loads(_strip_fence("".join(chunks))))
+        except ValueError:
+            logger.warning("Not caching unparseable streamed response")
+
+def _strip_fence(text: str) -> str:
+    """Trim anything around the outermost JSON object, such as a ```json fence"""
+    start, end = text.find("{"), text.rfind("}")
+    return text[start:end + 1] if start != -1 else text
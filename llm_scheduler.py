@@ -0,0 +1,297 @@
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, Mapping, Optional
+import json
+import logging
+import threading
+import time
+from llm_interface import LLMInterface
+from context_packer import TokenCounter
+from delegating_llm import DelegatingLLM
+from metrics import LLM_QUEUE_WAIT_SECONDS
+from resilience import QueueTimeout, remaining_time
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BATCH, BACKGROUND)
+
+class CallContext:
+    """Who a model call is for: its priority class, the patient and the requesting user"""
+
+    def __init__(self, priority: str = INTERACTIVE, mrn: Optional[str] = None, user: Optional[str] = None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.priority = priority
+        self.mrn = mrn
+        self.user = user
+
+_call_context: ContextVar[CallContext] = ContextVar("llm_call_context", default=CallContext())
+
+@contextmanager
+def llm_priority(priority: Optional[str] = None, mrn: Optional[str] = None, user: Optional[str] = None) -> Iterator[None]:
+    """Schedule model calls made inside the block with the given context; unset values are inherited"""
+    current = _call_context.get()
+    token = _call_context.set(CallContext(priority or current.priority, mrn or current.mrn, user or current.user))
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+def current_call() -> CallContext:
+    return _call_context.get()
+
+class TokenBucket:
+    """
+    A per-minute limit as a bucket holding burst_seconds of it. An amount larger than the
+    bucket waits for a full one and leaves it in debt, so big calls are slowed, not refused.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        self.burst_seconds = burst_seconds
+        self.set_limit(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def set_limit(self, per_minute: float) -> None:
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * self.burst_seconds, 1.0)
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self.refill(now)
+        needed = min(amount, self.capacity) - self.level
+        return needed / self.rate if needed > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+class _Waiter:
+    def __init__(self, context: CallContext, tokens: int):
+        self.context = context
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.admitted = False
+
+# Rate limit headers sent by OpenAI-compatible providers
+LIMIT_REQUESTS = "x-ratelimit-limit-requests"
+LIMIT_TOKENS = "x-ratelimit-limit-tokens"
+REMAINING_REQUESTS = "x-ratelimit-remaining-requests"
+REMAINING_TOKENS = "x-ratelimit-remaining-tokens"
+
+class LLMScheduler:
+    """
+    Admits model calls under request and token rate limits, highest priority class first.
+
+    Within a class, calls are admitted round-robin across users and, for each user,
+    across patients (MRNs), so one clinician's or one patient's burst cannot hold up
+    everyone else's notes. At most max_in_flight admitted calls run at once. Limits start
+    from the configured values and follow the provider's rate limit headers once seen.
+    Each admitted call's wait is observed into the leo_llm_queue_wait_seconds histogram,
+    labelled by its class.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_in_flight: int = 32,
+        burst_seconds: float = 10.0
+    ):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # priority -> user -> mrn -> waiters, in round-robin order
+        self._queues: Dict[str, "OrderedDict[Optional[str], OrderedDict[Optional[str], Deque[_Waiter]]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self.queued = {priority: 0 for priority in PRIORITIES}
+        self.admitted = {priority: 0 for priority in PRIORITIES}
+        self.wait_seconds = {priority: 0.0 for priority in PRIORITIES}
+        self.max_wait_seconds = {priority: 0.0 for priority in PRIORITIES}
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens: int, context: Optional[CallContext] = None) -> float:
+        """
+        Block until a call of about this many tokens may start; returns the seconds waited.
+        Raises QueueTimeout if the current deadline passes first.
+        """
+        waiter = _Waiter(context or current_call(), tokens)
+        with self._cond:
+            users = self._queues[waiter.context.priority]
+            users.setdefault(waiter.context.user, OrderedDict()).setdefault(waiter.context.mrn, deque()).append(waiter)
+            self.queued[waiter.context.priority] += 1
+            while True:
+                retry_in = self._dispatch()
+                if waiter.admitted:
+                    return time.monotonic() - waiter.enqueued
+                remaining = remaining_time()
+                if remaining is not None:
+                    if remaining <= 0:
+                        self._remove(waiter)
+                        raise QueueTimeout("Deadline exceeded waiting for the provider's rate limits")
+                    retry_in = min(retry_in, remaining) if retry_in is not None else remaining
+                self._cond.wait(retry_in)
+
+    def release(self, reserved_tokens: int, used_tokens: Optional[int] = None) -> None:
+        """A call finished; tokens reserved but not used go back to the bucket"""
+        with self._cond:
+            self.in_flight -= 1
+            if used_tokens is not None and used_tokens < reserved_tokens:
+                self.tokens.give(reserved_tokens - used_tokens)
+            self._cond.notify_all()
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Adopt the limits and remaining allowance from a provider response's headers"""
+        try:
+            limits = {
+                name: float(headers[name])
+                for name in (LIMIT_REQUESTS, LIMIT_TOKENS, REMAINING_REQUESTS, REMAINING_TOKENS)
+                if name in headers
+            }
+        except ValueError:
+            return
+        if not limits:
+            return
+        with self._cond:
+            now = time.monotonic()
+            for bucket, limit, remaining in (
+                (self.requests, LIMIT_REQUESTS, REMAINING_REQUESTS),
+                (self.tokens, LIMIT_TOKENS, REMAINING_TOKENS)
+            ):
+                bucket.refill(now)
+                if limits.get(limit, 0) > 0 and limits[limit] != bucket.per_minute:
+                    logger.info("Provider %s is %s, was %s", limit, limits[limit], bucket.per_minute)
+                    bucket.set_limit(limits[limit])
+                if remaining in limits:
+                    bucket.level = min(bucket.level, limits[remaining])
+            self._cond.notify_all()
+
+    def _head(self) -> Optional[_Waiter]:
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            if users:
+                mrns = next(iter(users.values()))
+                return next(iter(mrns.values()))[0]
+        return None
+
+    def _dispatch(self) -> Optional[float]:
+        """Admit waiting calls while limits allow; returns how long until the next might fit"""
+        while True:
+            head = self._head()
+            if head is None or self.in_flight >= self.max_in_flight:
+                return None
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(head.tokens, now))
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(head.tokens)
+            self.in_flight += 1
+            self._pop(head)
+            head.admitted = True
+            waited = now - head.enqueued
+            priority = head.context.priority
+            self.queued[priority] -= 1
+            self.admitted[priority] += 1
+            self.wait_seconds[priority] += waited
+            self.max_wait_seconds[priority] = max(self.max_wait_seconds[priority], waited)
+            LLM_QUEUE_WAIT_SECONDS.observe(waited, priority)
+            self._cond.notify_all()
+
+    def _pop(self, waiter: _Waiter) -> None:
+        """Remove the head waiter, moving its patient and user to the back of the rotation"""
+        users = self._queues[waiter.context.priority]
+        mrns = users[waiter.context.user]
+        waiters = mrns[waiter.context.mrn]
+        waiters.popleft()
+        if waiters:
+            mrns.move_to_end(waiter.context.mrn)
+        else:
+            del mrns[waiter.context.mrn]
+        if mrns:
+            users.move_to_end(waiter.context.user)
+        else:
+            del users[waiter.context.user]
+
+    def _remove(self, waiter: _Waiter) -> None:
+        """Take a waiter that gave up out of its queue, leaving the rotation as it was"""
+        users = self._queues[waiter.context.priority]
+        mrns = users[waiter.context.user]
+        mrns[waiter.context.mrn].remove(waiter)
+        if not mrns[waiter.context.mrn]:
+            del mrns[waiter.context.mrn]
+        if not mrns:
+            del users[waiter.context.user]
+        self.queued[waiter.context.priority] -= 1
+        # The next waiter may fit where this one did not
+        self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "requests_per_minute": self.requests.per_minute,
+                "tokens_per_minute": self.tokens.per_minute,
+                "classes": {
+                    priority: {
+                        "queued": self.queued[priority],
+                        "admitted": self.admitted[priority],
+                        "wait_seconds_total": self.wait_seconds[priority],
+                        "wait_seconds_mean": self.wait_seconds[priority] / self.admitted[priority] if self.admitted[priority] else 0.0,
+                        "wait_seconds_max": self.max_wait_seconds[priority]
+                    }
+                    for priority in PRIORITIES
+                }
+            }
+
+class ScheduledLLM(DelegatingLLM):
+    """
+    LLMInterface wrapper that waits for the scheduler before each provider call.
+
+    A call reserves its prompt tokens plus max_output_tokens, the most it can generate;
+    what the response did not use is returned to the token bucket afterwards.
+    """
+
+    def __init__(self, llm: LLMInterface, scheduler: LLMScheduler, counter: TokenCounter, max_output_tokens: int):
+        super().__init__(llm)
+        self.scheduler = scheduler
+        self.counter = counter
+        self.max_output_tokens = max_output_tokens
+
+    def _reserve(self, *inputs: str) -> int:
+        return sum(self.counter.count(text) for text in inputs) + self.max_output_tokens
+
+    def _call(self, method: str, *inputs: str) -> Dict[str, Any]:
+        reserved = self._reserve(*inputs)
+        self.scheduler.acquire(reserved)
+        used = None
+        try:
+            result = super()._call(method, *inputs)
+            used = reserved - self.max_output_tokens + self.counter.count(json.dumps(result, default=str))
+            return result
+        finally:
+            self.scheduler.release(reserved, used)
+
+    def _stream(self, transcript: str) -> Iterator[str]:
+        reserved = self._reserve(transcript)
+        self.scheduler.acquire(reserved)
+        output = []
+        try:
+            for chunk in super()._stream(transcript):
+                output.append(chunk)
+                yield chunk
+        finally:
+            self.scheduler.release(reserved, reserved - self.max_output_tokens + self.counter.count("".join(output)))
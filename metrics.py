@@ -0,0 +1,280 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import re
+import threading
+import time
+from delegating_llm import DelegatingLLM
+from llm_interface import LLMInterface
+
+# Seconds; model calls and transcriptions run to tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), registry: Optional["Registry"] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """A count that only goes up; label values are passed positionally, in declaration order"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set(self, value: float, *labels: str) -> None:
+        """Copy in a count kept elsewhere, from a collect callback"""
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+class Gauge(Counter):
+    """A level that goes up and down"""
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(name, help, labels, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (the last for +Inf), sum]
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+class Registry:
+    """
+    Metrics served in Prometheus' text format, without the client library.
+
+    Recording is a dict lookup and an addition under the metric's lock. Levels and counts
+    kept elsewhere, such as queue depths and cache statistics, are copied in by collect
+    callbacks when /metrics is scraped rather than tracked on the hot path.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def on_collect(self, callback: Callable[[], None]) -> None:
+        """Call callback before each scrape, to copy in levels and counts kept elsewhere"""
+        self._collectors.append(callback)
+
+    def render(self) -> str:
+        """Every metric in Prometheus' text exposition format"""
+        for callback in self._collectors:
+            callback()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Served as the /metrics response's content type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "leo_http_request_duration_seconds", "Time to respond to HTTP requests", ("method", "path", "status")
+)
+HTTP_IN_FLIGHT = Gauge("leo_http_requests_in_flight", "HTTP requests being handled")
+STAGE_SECONDS = Histogram(
+    "leo_stage_duration_seconds",
+    "Time spent in each pipeline stage: transcription, Leo's audio, image, compare and encounter stages, and format_note",
+    ("stage",)
+)
+LLM_CALL_SECONDS = Histogram("leo_llm_call_duration_seconds", "Time taken by provider model calls", ("model", "method"))
+LLM_CALL_ERRORS = Counter("leo_llm_call_errors_total", "Provider model calls that raised", ("model", "method"))
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "leo_llm_queue_wait_seconds", "Time model calls waited for the rate limit scheduler before starting", ("priority",)
+)
+LLM_TOKENS = Counter("leo_llm_tokens_total", "Tokens sent to (in) and received from (out) each model", ("model", "direction"))
+
+# Copied in from the components' own statistics when /metrics is scraped
+LLM_QUEUED = Gauge("leo_llm_queued_calls", "Model calls waiting for the rate limit scheduler", ("priority",))
+LLM_IN_FLIGHT = Gauge("leo_llm_calls_in_flight", "Model calls admitted by the scheduler and not yet finished")
+PROVIDER_IN_FLIGHT = Gauge("leo_provider_requests_in_flight", "HTTP requests to the model and transcription providers in progress")
+JOB_QUEUE_DEPTH = Gauge("leo_job_queue_depth", "Background jobs waiting for a worker")
+COALESCED_IN_FLIGHT = Gauge("leo_coalesced_in_flight", "Transcriptions and notes in flight that duplicates may join", ("kind",))
+COALESCED = Counter("leo_coalesced_requests_total", "Requests that joined an identical one already in flight", ("kind",))
+CACHE_LOOKUPS = Counter("leo_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+CACHE_HIT_RATIO = Gauge("leo_cache_hit_ratio", "Share of lookups served from each cache since start", ("cache",))
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request until the last of its response body is sent, so
+    streamed responses count for as long as they stream, labelled by the route's path
+    template so IDs in paths do not add series
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_timed(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Set on the scope by the router once the request is matched
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, scope["method"], route.path if route is not None else "unmatched", str(status)
+            )
+
+# The usage object of a chat completion response body
+USAGE = re.compile(rb'"usage"\s*:\s*(\{[^{}]*\})')
+
+_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("provider_usage", default=None)
+
+def record_provider_usage(response: Any) -> None:
+    """
+    Provider response hook (ProviderClient.on_response): keep the token usage the provider
+    reported for the model call being metered on this thread, if any. Streamed responses
+    are left unread.
+    """
+    usage = _usage.get()
+    if usage is None or "text/event-stream" in response.headers.get("Content-Type", ""):
+        return
+    match = USAGE.search(response.content)
+    if match is None:
+        return
+    try:
+        reported = json.loads(match.group(1))
+    except ValueError:
+        return
+    usage["in"] = reported.get("prompt_tokens", 0)
+    usage["out"] = reported.get("completion_tokens", 0)
+
+class MeteredLLM(DelegatingLLM):
+    """
+    LLMInterface wrapper that records the duration and tokens of each call to one model.
+
+    Tokens are those the provider reports in the response's usage, picked up by
+    record_provider_usage, so nothing is tokenised or serialised on the call's path. Streamed
+    responses report no usage; their output is counted a token per chunk and their input
+    not at all.
+    """
+
+    def __init__(self, llm: LLMInterface, model: str):
+        super().__init__(llm)
+        self.model = model
+
+    def _record(self, method: str, start: float, usage: Dict[str, int], failed: bool) -> None:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - start, self.model, method)
+        if failed:
+            LLM_CALL_ERRORS.inc(self.model, method)
+        for direction in ("in", "out"):
+            if usage.get(direction):
+                LLM_TOKENS.inc(self.model, direction, amount=usage[direction])
+
+    def _call(self, method: str, *inputs: str) -> Dict[str, Any]:
+        usage: Dict[str, int] = {}
+        token = _usage.set(usage)
+        start = time.perf_counter()
+        try:
+            result = super()._call(method, *inputs)
+        except Exception:
+            self._record(method, start, usage, True)
+            raise
+        finally:
+            _usage.reset(token)
+        self._record(method, start, usage, False)
+        return result
+
+    def _stream(self, transcript: str) -> Iterator[str]:
+        start = time.perf_counter()
+        chunks = 0
+        try:
+            for chunk in super()._stream(transcript):
+                chunks += 1
+                yield chunk
+        except Exception:
+            self._record("stream_clinical_conversation", start, {"out": chunks}, True)
+            raise
+        self._record("stream_clinical_conversation", start, {"out": chunks}, False)
@@ -0,0 +1,213 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+import logging
+import threading
+import time
+from llm_interface import LLMInterface
+from delegating_llm import DelegatingLLM, stream_from, supports_encounter
+from config import ModelRoute, ModelRoutingConfig
+from context_packer import TokenCounter
+from resilience import DeadlineExceeded, remaining_time
+
+logger = logging.getLogger(__name__)
+
+# Kinds of model call, each with its own route
+EXTRACTION = "extraction"
+COMPARISON = "comparison"
+NARRATIVE = "narrative"
+METHOD_ROUTES = {
+    "process_clinical_image": EXTRACTION,
+    "compare_notes": COMPARISON,
+    "process_clinical_conversation": NARRATIVE,
+    "stream_clinical_conversation": NARRATIVE,
+    "process_clinical_encounter": NARRATIVE
+}
+
+_routes: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("model_routes", default=None)
+
+@contextmanager
+def recording_routes() -> Iterator[List[Dict[str, Any]]]:
+    """Collect the model chosen for each call made inside the block, and why"""
+    routes: List[Dict[str, Any]] = []
+    token = _routes.set(routes)
+    try:
+        yield routes
+    finally:
+        _routes.reset(token)
+
+class LatencyTracker:
+    """
+    The latencies of each model's most recent calls. Samples older than max_age_seconds are
+    ignored, so a model that was passed over for being slow is tried again once its slow
+    calls have aged out, rather than being judged on them for good.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20, max_age_seconds: float = 300.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.max_age_seconds = max_age_seconds
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}  # Model -> (when, seconds)
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append((time.monotonic(), seconds))
+
+    def recent(self, model: str) -> List[float]:
+        """The model's call latencies within max_age_seconds"""
+        oldest = time.monotonic() - self.max_age_seconds
+        with self._lock:
+            return [seconds for when, seconds in self._samples.get(model, ()) if when >= oldest]
+
+    def p95(self, model: str) -> Optional[float]:
+        """None until the model has min_samples recent calls"""
+        return self._p95(self.recent(model))
+
+    def _p95(self, samples: List[float]) -> Optional[float]:
+        if len(samples) < self.min_samples:
+            return None
+        return sorted(samples)[min(int(len(samples) * 0.95), len(samples) - 1)]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            models = list(self._samples)
+        samples = {model: self.recent(model) for model in models}
+        return {model: {"calls": len(recent), "p95_seconds": self._p95(recent)} for model, recent in samples.items()}
+
+class ModelRouter:
+    """
+    Chooses the model for a call from its route. Short inputs go to the fast model, as do
+    calls the route's model has recently been too slow for: its p95 is over the call's
+    budget, the route's SLO or the time left before the deadline if sooner.
+
+    Near the deadline this deliberately sends calls to the fast model even when the route's
+    model meets its SLO, since a call that cannot finish in time fails the request anyway.
+    Requests without a deadline are routed on the SLO alone.
+    """
+
+    def __init__(self, config: ModelRoutingConfig, default_model: str, tracker: Optional[LatencyTracker] = None):
+        self.config = config
+        self.default_model = default_model
+        self.tracker = tracker or LatencyTracker(config.window, config.min_samples, config.sample_seconds)
+        self.chosen: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def route(self, kind: str) -> ModelRoute:
+        return getattr(self.config, kind)
+
+    def models(self) -> List[str]:
+        """Every model a route may choose"""
+        models = [self.default_model]
+        for kind in (EXTRACTION, COMPARISON, NARRATIVE):
+            route = self.route(kind)
+            for model in (route.model, route.fast_model):
+                if model and model not in models:
+                    models.append(model)
+        return models
+
+    def choose(self, kind: str, tokens: int) -> Tuple[str, str]:
+        """The model for a call of this kind with this many input tokens, and the reason for it"""
+        route = self.route(kind)
+        model = route.model or self.default_model
+        budget = route.slo_seconds
+        remaining = remaining_time()
+        if remaining is not None:
+            budget = min(budget, remaining)
+
+        p95 = self.tracker.p95(model)
+        if route.fast_model is None or route.fast_model == model:
+            choice, reason = model, "no fallback model"
+        elif tokens <= route.fast_below_tokens:
+            choice, reason = route.fast_model, f"short input: {tokens} tokens"
+        elif p95 is None:
+            choice, reason = model, "no recent latency"
+        elif p95 <= budget:
+            choice, reason = model, f"p95 {p95:.1f}s within {budget:.1f}s budget"
+        else:
+            fast_p95 = self.tracker.p95(route.fast_model)
+            if fast_p95 is not None and fast_p95 >= p95:
+                choice, reason = model, f"p95 {p95:.1f}s over {budget:.1f}s budget, {route.fast_model} no faster"
+            else:
+                choice, reason = route.fast_model, f"{model} p95 {p95:.1f}s over {budget:.1f}s budget"
+        with self._lock:
+            self.chosen[(kind, choice)] = self.chosen.get((kind, choice), 0) + 1
+        return choice, reason
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            chosen = dict(self.chosen)
+        return {
+            "models": self.tracker.stats(),
+            "chosen": {
+                kind: {model: count for (k, model), count in chosen.items() if k == kind}
+                for kind in (EXTRACTION, COMPARISON, NARRATIVE)
+            }
+        }
+
+class TimedLLM(DelegatingLLM):
+    """
+    LLMInterface wrapper that records how long each call to one model takes, for its
+    router's later choices. It goes under the response cache, so cache hits are not timed.
+    """
+
+    def __init__(self, llm: LLMInterface, model: str, tracker: LatencyTracker):
+        super().__init__(llm)
+        self.model = model
+        self.tracker = tracker
+
+    def _observe(self, start: float) -> None:
+        self.tracker.observe(self.model, time.monotonic() - start)
+
+    def _call(self, method: str, *inputs: str) -> Dict[str, Any]:
+        start = time.monotonic()
+        try:
+            result = super()._call(method, *inputs)
+        except DeadlineExceeded:
+            # At least this slow; other failures, such as an open circuit, say nothing of latency
+            self._observe(start)
+            raise
+        self._observe(start)
+        return result
+
+    def _stream(self, transcript: str) -> Iterator[str]:
+        start = time.monotonic()
+        try:
+            yield from super()._stream(transcript)
+        except DeadlineExceeded:
+            self._observe(start)
+            raise
+        self._observe(start)
+
+class RoutedLLM(DelegatingLLM):
+    """
+    LLMInterface over one LLM per model that sends each call to the model its route
+    chooses, recording the choice for the note. Each model's LLM times its own calls
+    (TimedLLM) and is cached under its own model. There is no single wrapped LLM: _call
+    picks one for each call, and a stream keeps the one chosen when it starts.
+    """
+
+    def __init__(self, llms: Dict[str, LLMInterface], router: ModelRouter, counter: TokenCounter):
+        self.llms = llms
+        self.router = router
+        self.counter = counter
+
+    def _choose(self, method: str, *inputs: str) -> str:
+        kind = METHOD_ROUTES[method]
+        tokens = sum(self.counter.count(text) for text in inputs)
+        model, reason = self.router.choose(kind, tokens)
+        routes = _routes.get()
+        if routes is not None:
+            routes.append({"call": kind, "model": model, "reason": reason})
+        logger.debug("%s call with %d tokens routed to %s: %s", kind, tokens, model, reason)
+        return model
+
+    def _call(self, method: str, *inputs: str) -> Dict[str, Any]:
+        return getattr(self.llms[self._choose(method, *inputs)], method)(*inputs)
+
+    def handles_encounter(self) -> bool:
+        return all(supports_encounter(llm) for llm in self.llms.values())
+
+    def stream_clinical_conversation(self, transcript: str) -> Iterator[str]:
+        yield from stream_from(self.llms[self._choose("stream_clinical_conversation", transcript)], transcript)
@@ -0,0 +1,183 @@
+from typing import Any, Dict, List, Optional, Tuple
+import re
+from structured_extraction import canonical_name
+
+# Headings format_note writes, and the working-note sections they hold
+SECTION_HEADINGS = {
+    "Subjective": "subjective",
+    "Objective": "objective",
+    "Assessment": "assessment",
+    "Plan": "plan",
+    "Changes Since Last Note": "changes_since_last_note",
+    "Action Items / To-Do": "action_items",
+    "Discrepancies/Conflicts": "discrepancies",
+}
+OBJECTIVE_HEADINGS = {
+    "Vitals": "vitals",
+    "Physical Exam Findings": "physical_exam",
+    "Labs": "labs",
+    "Other Data (images)": "other_data",
+}
+# Free-text sections only a model can compare; everything else is diffed locally
+NARRATIVE_SECTIONS = ("subjective", "assessment")
+NARRATIVE_HEADINGS = {"subjective": "Subjective", "assessment": "Assessment"}
+# A reading that moves by at least this fraction counts as a significant change, otherwise a trend
+SIGNIFICANT_CHANGE = 0.10
+
+_HEADING = re.compile(r"^\*\*(" + "|".join(re.escape(h) for h in SECTION_HEADINGS) + r"):\*\*[ \t]*$", re.M)
+_OBJECTIVE_LINE = re.compile(r"^- \*\*(" + "|".join(re.escape(h) for h in OBJECTIVE_HEADINGS) + r"):\*\*[ \t]?(.*)$", re.M)
+_HEADER = re.compile(r"^\*\*(?P<name>.*) / (?P<mrn>.*) / (?P<date>\d{4}-\d{2}-\d{2})\*\*$", re.M)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_PLAN_ITEM = re.compile(r"(?<=[.;])\s+|\n+")
+
+def _split_list(text: str) -> List[str]:
+    return [item.strip() for item in text.split(", ") if item.strip()]
+
+def parse_note(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a note written by Leo.format_note back into the working-note dict.
+
+    Returns None for text that is not in that format, e.g. a note from another system.
+    """
+    headings = list(_HEADING.finditer(text))
+    found = {match.group(1) for match in headings}
+    if "Subjective" not in found or "Objective" not in found:
+        return None
+
+    note: Dict[str, Any] = {
+        "subjective": "",
+        "objective": {"vitals": [], "physical_exam": [], "labs": [], "other_data": []},
+        "assessment": "",
+        "plan": "",
+        "changes_since_last_note": "",
+        "action_items": [],
+        "discrepancies": []
+    }
+    header = _HEADER.search(text, 0, headings[0].start())
+    if header:
+        note["patient_name"] = header.group("name")
+        note["mrn"] = header.group("mrn")
+        note["date"] = header.group("date")
+
+    for i, match in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        body = text[match.end():end].strip("\n")
+        if body.endswith("---"):
+            body = body[:-3]
+        body = body.strip()
+        section = SECTION_HEADINGS[match.group(1)]
+        if section == "objective":
+            for line in _OBJECTIVE_LINE.finditer(body):
+                note["objective"][OBJECTIVE_HEADINGS[line.group(1)]] = _split_list(line.group(2))
+        elif section in ("action_items", "discrepancies"):
+            note[section] = [line[2:].strip() for line in body.splitlines() if line.startswith("- ")]
+        else:
+            note[section] = body
+    return note
+
+def _readings(entries: List[str]) -> Dict[str, Tuple[str, str]]:
+    """Map each measurement to its label and latest value, e.g. {"HR": ("HR", "72")}"""
+    readings = {}
+    for entry in entries:
+        label, _, value = entry.partition(":")
+        if not value:
+            continue
+        label = label.strip()
+        readings[canonical_name(label) or label] = (label, value.strip())
+    return readings
+
+def _relative_change(before: str, after: str) -> Optional[float]:
+    """Largest relative change across the numbers in two readings, e.g. both parts of a BP"""
+    old, new = _NUMBER.findall(before), _NUMBER.findall(after)
+    if not old or len(old) != len(new):
+        return None
+    changes = [abs(float(b) - float(a)) / abs(float(a)) if float(a) else float(b != a) for a, b in zip(old, new)]
+    return max(changes)
+
+def _plan_items(plan: str) -> List[str]:
+    items = []
+    for item in _PLAN_ITEM.split(plan):
+        item = item.strip().lstrip("-*• ").strip()
+        if item:
+            items.append(item)
+    return items
+
+def _normalized(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+class NoteDiff:
+    """Section-by-section differences between two working notes"""
+
+    def __init__(self, previous: Dict[str, Any], current: Dict[str, Any]):
+        self.previous = previous
+        self.current = current
+        self.new_findings: List[str] = []
+        self.resolved_issues: List[str] = []
+        self.trends: List[str] = []
+        self.significant_changes: List[str] = []
+        self.changed_narrative = [
+            section for section in NARRATIVE_SECTIONS
+            if _normalized(previous.get(section, "")) != _normalized(current.get(section, ""))
+        ]
+        self._diff_readings()
+        self._diff_action_items()
+        self._diff_plan()
+
+    def _diff_readings(self) -> None:
+        for kind in ("vitals", "labs"):
+            before = _readings(self.previous["objective"].get(kind, []))
+            after = _readings(_split_list(", ".join(self.current["objective"].get(kind, []))))
+            for name, (label, value) in after.items():
+                if name not in before:
+                    self.new_findings.append(f"{label}: {value}")
+                    continue
+                old_value = before[name][1]
+                if _normalized(old_value) == _normalized(value):
+                    continue
+                change = _relative_change(old_value, value)
+                summary = f"{label} {old_value} → {value}"
+                if change is None or change >= SIGNIFICANT_CHANGE:
+                    self.significant_changes.append(summary)
+                else:
+                    self.trends.append(summary)
+
+    def _diff_action_items(self) -> None:
+        before = {_normalized(item): item for item in self.previous.get("action_items", [])}
+        after = {_normalized(item): item for item in self.current.get("action_items", [])}
+        self.new_findings.extend(f"New action item: {after[key]}" for key in after if key not in before)
+        self.resolved_issues.extend(before[key] for key in before if key not in after)
+
+    def _diff_plan(self) -> None:
+        before = {_normalized(item): item for item in _plan_items(self.previous.get("plan", ""))}
+        after = {_normalized(item): item for item in _plan_items(self.current.get("plan", ""))}
+        self.significant_changes.extend(f"Plan added: {after[key]}" for key in after if key not in before)
+        self.significant_changes.extend(f"Plan removed: {before[key]}" for key in before if key not in after)
+
+    def narrative(self, note: Dict[str, Any]) -> str:
+        """The changed narrative sections of note, in format_note's markdown, for the model"""
+        return "\n\n".join(
+            f"**{NARRATIVE_HEADINGS[section]}:**\n{note.get(section, '')}" for section in self.changed_narrative
+        )
+
+    def as_result(self) -> Dict[str, Any]:
+        """The diff in the shape LLMInterface.compare_notes returns"""
+        return {
+            "new_findings": list(self.new_findings),
+            "resolved_issues": list(self.resolved_issues),
+            "trends": list(self.trends),
+            "significant_changes": list(self.significant_changes)
+        }
+
+    def merge_into(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine with a model comparison of the narrative sections, local findings first"""
+        merged = dict(result)
+        for key, values in self.as_result().items():
+            merged[key] = values + [value for value in result.get(key, []) if value not in values]
+        return merged
+
+def diff_notes(previous_note: str, current: Dict[str, Any]) -> Optional[NoteDiff]:
+    """Diff a working note against the formatted previous note, or None if it can't be parsed"""
+    previous = parse_note(previous_note)
+    if previous is None:
+        return None
+    return NoteDiff(previous, current)
@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import json
+import sqlite3
+import threading
+
+class NoteStore:
+    """
+    Generated progress notes stored per patient in SQLite, keyed by MRN.
+
+    Notes are kept whole, as the structured dict ProgressNote dumps to. Notes generated with
+    a stage missing are stored marked partial: they stay in the history, but are never the
+    latest note the next one is compared with.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mrn TEXT NOT NULL,
+                date TEXT NOT NULL,
+                note TEXT NOT NULL,
+                partial INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS notes_mrn_date ON notes (mrn, date)")
+
+    def save(self, mrn: str, date: datetime, note: Dict[str, Any], partial: bool = False) -> int:
+        """Append a note to the patient's history and return its id"""
+        encoded = json.dumps(note, default=str)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO notes (mrn, date, note, partial) VALUES (?, ?, ?, ?)",
+                (mrn, date.isoformat(), encoded, int(partial))
+            )
+            return cursor.lastrowid
+
+    def latest(self, mrn: str) -> Optional[Dict[str, Any]]:
+        """The patient's most recent complete note, or None if there is none"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT note FROM notes WHERE mrn = ? AND partial = 0 ORDER BY date DESC, id DESC LIMIT 1", (mrn,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def history(self, mrn: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """The patient's notes dated from start to end inclusive, oldest first"""
+        query = "SELECT note FROM notes WHERE mrn = ?"
+        params: List[Any] = [mrn]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(start.isoformat())
+        if end is not None:
+            query += " AND date <= ?"
+            params.append(end.isoformat())
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY date, id", params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,294 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import functools
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Request IDs safe to use as file names
+REQUEST_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+MAX_DEPTH = 128
+
+class Profile:
+    """Stack samples of one request, counted per distinct stack"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.started = time.monotonic()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Tasks and threads working for the request: the event loop's tasks it created, and
+        # executor threads while they run a call for it (thread ID -> nesting depth)
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self.threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def add_task(self, task: asyncio.Task) -> None:
+        with self._lock:
+            self.tasks.add(task)
+
+    def enter_thread(self, ident: int) -> None:
+        with self._lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+
+    def exit_thread(self, ident: int) -> None:
+        with self._lock:
+            if self.threads[ident] == 1:
+                del self.threads[ident]
+            else:
+                self.threads[ident] -= 1
+
+    def workers(self) -> Tuple[List[asyncio.Task], List[int]]:
+        """The tasks and thread IDs working for the request now"""
+        with self._lock:
+            return [task for task in self.tasks if not task.done()], list(self.threads)
+
+    def add(self, stacks: List[str]) -> None:
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def folded(self) -> str:
+        """The samples as folded stacks, one "frame;frame;frame count" line per stack, as flamegraph.pl and speedscope read"""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+_profile: ContextVar[Optional[Profile]] = ContextVar("profile", default=None)
+
+def current_profile() -> Optional[Profile]:
+    """The profile of the request being handled, if it is being profiled"""
+    return _profile.get()
+
+def new_profile_id(request_id: Optional[str] = None) -> str:
+    """
+    A name for one profile: request_id, if it is a valid ID, with a random suffix, so a
+    client reusing an ID cannot overwrite another request's profile
+    """
+    suffix = uuid.uuid4().hex[:16]
+    if request_id and REQUEST_ID.match(request_id):
+        return f"{request_id[:47]}-{suffix}"
+    return uuid.uuid4().hex
+
+def bind(func: Callable) -> Callable:
+    """
+    func, marked as working for the request being profiled, if any, while it runs in another
+    thread; for calls handed to executors
+    """
+    profile = _profile.get()
+    if profile is None:
+        return func
+
+    @functools.wraps(func)
+    def bound(*args, **kwargs):
+        ident = threading.get_ident()
+        profile.enter_thread(ident)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.exit_thread(ident)
+    return bound
+
+def _label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def _thread_stack(frame: Any) -> str:
+    frames = []
+    while frame is not None and len(frames) < MAX_DEPTH:
+        frames.append(_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+def _task_stack(task: asyncio.Task) -> Optional[str]:
+    """Where a task is, outermost coroutine first, following what each coroutine awaits"""
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None and len(frames) < MAX_DEPTH:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(_label(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return ";".join(frames) if frames else None
+
+class SamplingProfiler:
+    """
+    Wall-clock stack sampling of the requests being profiled.
+
+    While a request is profiled, a sampler thread records every interval_seconds where each
+    of its tasks is waiting, following their chains of awaits, and the stack of each
+    executor thread running a call bound to it (bind()), such as model and transcription
+    calls. Finished profiles are stored as folded stacks under directory, named by request
+    ID. When nothing is being profiled no thread samples and no task factory is installed,
+    so requests pay only for a context variable lookup when handing work to an executor.
+    """
+
+    def __init__(self, directory: str, interval_seconds: float = 0.01, max_profiles: int = 200):
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self.max_profiles = max_profiles
+        self._active: Dict[int, Profile] = {}
+        self._factories: Dict[asyncio.AbstractEventLoop, Any] = {}  # Loop -> the task factory it had
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def profile(self, request_id: str) -> Iterator[Profile]:
+        """Profile the work done inside the block, on this thread or event loop task and those it starts"""
+        if not REQUEST_ID.match(request_id):
+            raise ValueError(f"Invalid request ID: {request_id!r}")
+        profile = Profile(request_id)
+        token = _profile.set(profile)
+        try:
+            profile.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            profile.loop = None
+        if profile.loop is not None:
+            task = asyncio.current_task()
+            if task is not None:
+                profile.add_task(task)
+            self._install_task_factory(profile.loop)
+        else:
+            profile.enter_thread(threading.get_ident())
+        with self._cond:
+            self._active[id(profile)] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        try:
+            yield profile
+        finally:
+            with self._cond:
+                del self._active[id(profile)]
+                loop_in_use = any(other.loop is profile.loop for other in self._active.values())
+            if profile.loop is not None and not loop_in_use:
+                self._restore_task_factory(profile.loop)
+            _profile.reset(token)
+            self._save(profile)
+
+    def path(self, request_id: str) -> Optional[str]:
+        """The stored profile for request_id, if there is one"""
+        if not REQUEST_ID.match(request_id):
+            return None
+        path = os.path.join(self.directory, f"{request_id}.folded")
+        return path if os.path.exists(path) else None
+
+    def _install_task_factory(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Have the loop add tasks created for a profiled request to its profile"""
+        if loop in self._factories:
+            return
+        previous = loop.get_task_factory()
+        self._factories[loop] = previous
+
+        def factory(loop, coro, **kwargs):
+            task = previous(loop, coro, **kwargs) if previous is not None else asyncio.Task(coro, loop=loop, **kwargs)
+            profile = _profile.get()
+            if profile is not None:
+                profile.add_task(task)
+            return task
+        loop.set_task_factory(factory)
+
+    def _restore_task_factory(self, loop: asyncio.AbstractEventLoop) -> None:
+        if loop in self._factories:
+            loop.set_task_factory(self._factories.pop(loop))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            time.sleep(self.interval_seconds)
+            try:
+                self._sample()
+            except Exception:
+                logger.exception("Error sampling stacks")
+
+    def _sample(self) -> None:
+        with self._cond:
+            profiles = list(self._active.values())
+        if not profiles:
+            return
+        frames = sys._current_frames()
+        for profile in profiles:
+            tasks, threads = profile.workers()
+            stacks = []
+            for task in tasks:
+                stack = _task_stack(task)
+                if stack:
+                    stacks.append(stack)
+            for ident in threads:
+                if ident in frames:
+                    stacks.append(_thread_stack(frames[ident]))
+            profile.add(stacks)
+
+    def _save(self, profile: Profile) -> None:
+        path = os.path.join(self.directory, f"{profile.request_id}.folded")
+        with open(path, "w") as f:
+            f.write(profile.folded())
+        logger.info(
+            "Profiled request %s: %d samples over %.2fs, saved to %s",
+            profile.request_id, profile.samples, time.monotonic() - profile.started, path
+        )
+        stored = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".folded")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in stored[:max(len(stored) - self.max_profiles, 0)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests sent with an X-Profile: 1 header, and a sampled share
+    of the rest, until the last of the response body is sent, so streamed responses are
+    profiled for as long as they stream. The response's X-Profile-URL fetches the profile,
+    named by the request's X-Request-ID if valid (new_profile_id).
+    """
+
+    def __init__(self, app: Callable, profiler: SamplingProfiler, header_enabled: bool = True, sample_rate: float = 0.0):
+        self.app = app
+        self.profiler = profiler
+        self.header_enabled = header_enabled
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {name.lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        if not (
+            (self.header_enabled and headers.get(b"x-profile", "").lower() in ("1", "true"))
+            or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        ):
+            await self.app(scope, receive, send)
+            return
+        client_id = headers.get(b"x-request-id", "")
+        profile_id = new_profile_id(client_id)
+        request_id = client_id if REQUEST_ID.match(client_id) else profile_id
+
+        async def send_with_ids(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + [
+                    (b"x-request-id", request_id.encode("latin-1")),
+                    (b"x-profile-url", f"/profiles/{profile_id}".encode("latin-1"))
+                ]
+            await send(message)
+
+        with self.profiler.profile(profile_id):
+            await self.app(scope, receive, send_with_ids)
@@ -0,0 +1,183 @@
+from typing import Any, Callable, Dict, List, Optional
+import email.utils
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import ProviderConfig
+from resilience import check_deadline, remaining_time
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: rate limited, or a server error that may be transient
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+def retry_delay(attempt: int, base: float, cap: float, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to wait before retry number attempt (from 0): the provider's Retry-After if it
+    sent one, else exponential backoff with full jitter, so clients that failed together do
+    not retry together
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+        try:
+            # An HTTP date rather than seconds
+            return min(max(email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0), cap)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter over a bounded keep-alive pool that retries 429 and 5xx responses with
+    jittered backoff and counts what goes through it.
+
+    Closing the adapter is a no-op: openai recycles its sessions every few minutes, and the
+    pool should outlive them. ProviderClient.close shuts it down.
+    """
+
+    def __init__(self, config: ProviderConfig):
+        # Not self.config, which HTTPAdapter uses for its own
+        self.settings = config
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0  # Requests still failing after the last retry
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        super().__init__(
+            pool_connections=config.pool_hosts,
+            pool_maxsize=config.pool_size,
+            # Callers wait for a free connection rather than opening ones that are never reused
+            pool_block=True,
+            max_retries=Retry(total=config.max_retries, connect=config.max_retries, read=False, status=0, redirect=0)
+        )
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        # The request's deadline caps the socket timeout, so a slow provider cannot hold a worker past it
+        check_deadline("provider call")
+        remaining = remaining_time()
+        if remaining is not None:
+            timeout = kwargs.get("timeout")
+            if isinstance(timeout, tuple):
+                kwargs["timeout"] = tuple(min(t, remaining) if t is not None else remaining for t in timeout)
+            else:
+                kwargs["timeout"] = min(timeout, remaining) if timeout is not None else remaining
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            attempt = 0
+            while True:
+                response = super().send(request, **kwargs)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = retry_delay(
+                    attempt, self.settings.retry_base_delay, self.settings.retry_max_delay,
+                    response.headers.get("Retry-After")
+                )
+                remaining = remaining_time()
+                if attempt >= self.settings.max_retries or (remaining is not None and delay >= remaining):
+                    with self._lock:
+                        self.failures += 1
+                    return response
+                logger.warning("%s from %s, retrying in %.2fs", response.status_code, request.url, delay)
+                # Read the error body so the connection goes back to the pool for the retry
+                response.raw.drain_conn()
+                response.raw.release_conn()
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def close(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        super().close()
+
+    def connection_counts(self) -> Dict[str, int]:
+        """Connections opened so far and those idle in the pool now, over all hosts"""
+        opened = idle = 0
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            # Unused pool slots are held as None
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+        return {"opened": opened, "idle": idle}
+
+class ProviderClient:
+    """
+    Shared HTTP client for the model and transcription providers.
+
+    One requests.Session over a PooledAdapter, installed as openai's session so every
+    provider call from any thread reuses the same keep-alive connections instead of a
+    handshake per call. base_url points openai at another server, such as a local stub.
+    """
+
+    def __init__(self, config: ProviderConfig):
+        self.config = config
+        self.adapter = PooledAdapter(config)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._callbacks: List[Callable[[requests.Response], None]] = []
+
+    def install(self) -> None:
+        """Route openai's calls through this client"""
+        import openai
+        openai.requestssession = self.session
+        if self.config.base_url:
+            openai.api_base = self.config.base_url
+
+    def on_response(self, callback: Callable[[requests.Response], None]) -> None:
+        """
+        Call callback with every provider response, e.g. to read its rate limit headers; a
+        callback already registered is not added again
+        """
+        if callback in self._callbacks:
+            return
+        self._callbacks.append(callback)
+        self.session.hooks["response"].append(lambda response, *args, **kwargs: callback(response))
+
+    def stats(self) -> Dict[str, Any]:
+        connections = self.adapter.connection_counts()
+        return {
+            "pool_size": self.config.pool_size,
+            "in_flight": self.adapter.in_flight,
+            "peak_in_flight": self.adapter.peak_in_flight,
+            "utilisation": self.adapter.in_flight / self.config.pool_size,
+            "requests": self.adapter.requests,
+            "retries": self.adapter.retries,
+            "failures": self.adapter.failures,
+            "connections_opened": connections["opened"],
+            "connections_idle": connections["idle"]
+        }
+
+    def close(self) -> None:
+        self.adapter.shutdown()
+
+_shared: Optional[ProviderClient] = None
+_shared_lock = threading.Lock()
+
+def shared_client(config: ProviderConfig) -> ProviderClient:
+    """The process-wide client, created and installed on first use; later configs are ignored"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ProviderClient(config)
+            _shared.install()
+        return _shared
@@ -0,0 +1,194 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+import logging
+import threading
+import time
+from delegating_llm import DelegatingLLM
+from llm_interface import LLMInterface
+
+logger = logging.getLogger(__name__)
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline, or a stage's budget within it, ran out"""
+
+class QueueTimeout(DeadlineExceeded):
+    """The deadline passed while a call was still waiting to be sent to the provider"""
+
+class CircuitOpenError(RuntimeError):
+    """A provider and model failed repeatedly and calls to it are failing fast"""
+
+class Deadline:
+    """A point in time, on the monotonic clock, by which work must be finished"""
+
+    def __init__(self, seconds: float):
+        self.at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.at
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Deadline]:
+    """
+    Work inside the block must finish within seconds, or by the enclosing deadline if that
+    is sooner. Like other context variables, the deadline follows calls into stage threads
+    and executor workers.
+    """
+    current = _deadline.get()
+    deadline = Deadline(seconds) if seconds is not None else current
+    if deadline is None or (current is not None and current.at < deadline.at):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current deadline, or None if there is none"""
+    deadline = _deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+def check_deadline(what: str) -> None:
+    deadline = _deadline.get()
+    if deadline is not None and deadline.expired:
+        raise DeadlineExceeded(f"Deadline exceeded before {what}")
+
+def deadline_expired(error: BaseException) -> bool:
+    """
+    True if error came from running out of the caller's time, such as a call still queued
+    at the deadline or cut off by it, rather than from the provider failing
+    """
+    if isinstance(error, QueueTimeout):
+        return True
+    deadline = _deadline.get()
+    return deadline is not None and deadline.expired
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """
+    Fails calls fast once a provider and model have failed failure_threshold times in a row.
+
+    After reset_seconds one trial call is let through; its success closes the circuit and
+    its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} is unavailable after {self.failures} failures")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def cancel_trial(self) -> None:
+        """A call let through ended without a verdict on the provider's health"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning("Opening circuit for %s after %d failures", self.name, self.failures)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def circuit_breaker(provider: str, model: str, failure_threshold: int = 5, reset_seconds: float = 30.0) -> CircuitBreaker:
+    """The process-wide breaker for a provider and model"""
+    with _breakers_lock:
+        key = (provider, model)
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(f"{provider}/{model}", failure_threshold, reset_seconds)
+        return _breakers[key]
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        return {breaker.name: breaker.stats() for breaker in _breakers.values()}
+
+class GuardedLLM(DelegatingLLM):
+    """
+    LLMInterface wrapper that checks the deadline and the provider's circuit breaker before
+    each call, and reports the outcome to the breaker. A call cut short by the caller's
+    deadline says nothing about the provider's health, so it is not counted as a failure;
+    the provider's own timeouts and errors are.
+    """
+
+    def __init__(self, llm: LLMInterface, breaker: CircuitBreaker):
+        super().__init__(llm)
+        self.breaker = breaker
+
+    def _call(self, method: str, *inputs: str) -> Dict[str, Any]:
+        check_deadline(method)
+        self.breaker.before_call()
+        try:
+            result = super()._call(method, *inputs)
+        except Exception as e:
+            if not deadline_expired(e):
+                self.breaker.record_failure()
+                raise
+            self.breaker.cancel_trial()
+            if isinstance(e, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded(f"Deadline exceeded during {method}") from e
+        self.breaker.record_success()
+        return result
+
+    def _stream(self, transcript: str) -> Iterator[str]:
+        check_deadline("stream_clinical_conversation")
+        self.breaker.before_call()
+        try:
+            yield from super()._stream(transcript)
+        except GeneratorExit:
+            # The consumer stopped reading
+            self.breaker.cancel_trial()
+            raise
+        except Exception as e:
+            if deadline_expired(e):
+                self.breaker.cancel_trial()
+            else:
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
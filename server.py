@@ -1,24 +1,47 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
 from datetime import datetime
 import uuid
 import logging
-import aiofiles
+import time
 from leo import Leo, ClinicalInput
 from config import Config
-import traceback
+from upload_stream import spool_upload, UploadTooLargeError
+from transcription import OpenAITranscriber, GuardedTranscriber
+from provider_client import shared_client
+from llm_scheduler import llm_priority, BATCH, BACKGROUND
+from resilience import CircuitOpenError, breaker_stats, circuit_breaker, deadline_scope
+from transcription_cache import TranscriptionCache, CachedTranscriber
+from audio_pipeline import ChunkedTranscriber, PreprocessingTranscriber, preprocessing_report, reset_preprocessing_report
+from note_store import NoteStore
+from jobs import JobStore, JobQueue, FINISHED_STATUSES
+from image_pipeline import ImageTextExtractor, OCR_BACKENDS
+from singleflight import SingleFlight, canonical_key
+import metrics
+from profiler import SamplingProfiler, ProfilingMiddleware, current_profile, new_profile_id
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    image_extractor.shutdown()
+
 app = FastAPI(
     title="Leo Clinical Documentation Assistant",
     description="AI-powered clinical documentation assistant for hospital in-patient rounds",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -32,134 +55,563 @@ app.add_middleware(
 
 # Initialize Leo with configuration
 config = Config()
-leo = Leo(config)
+# Off until a request asks to be profiled
+profiler = SamplingProfiler(
+    config.profiling.profile_dir,
+    interval_seconds=config.profiling.interval_seconds,
+    max_profiles=config.profiling.max_profiles
+)
+
+# Profiles requests sent with an X-Profile: 1 header, and a sampled share of the rest
+app.add_middleware(
+    ProfilingMiddleware,
+    profiler=profiler,
+    header_enabled=config.profiling.header_enabled,
+    sample_rate=config.profiling.sample_rate
+)
+
+@app.middleware("http")
+async def schedule_by_user(request: Request, call_next):
+    """Model calls made for a request are shared out fairly by the X-User-ID header's user"""
+    with llm_priority(user=request.headers.get("X-User-ID")):
+        return await call_next(request)
+
+# Outermost, and plain ASGI rather than call_next, so streamed bodies are timed to their last byte
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
+# One keep-alive connection pool for every call to the model and transcription providers
+provider_client = shared_client(config.provider)
+transcriber = OpenAITranscriber(
+    model=config.transcription.model,
+    max_workers=config.transcription.max_concurrent_requests,
+    client=provider_client
+)
+# Each call to the provider is bounded by the request's deadline and fails fast while it is down
+transcriber = GuardedTranscriber(transcriber, circuit_breaker(
+    "openai",
+    config.transcription.model,
+    failure_threshold=config.deadlines.breaker_failures,
+    reset_seconds=config.deadlines.breaker_reset_seconds
+))
 
 # Create upload directories if they don't exist
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = config.upload.upload_dir
 AUDIO_DIR = os.path.join(UPLOAD_DIR, "audio")
 IMAGE_DIR = os.path.join(UPLOAD_DIR, "images")
 
 for directory in [UPLOAD_DIR, AUDIO_DIR, IMAGE_DIR]:
     os.makedirs(directory, exist_ok=True)
 
+# Generated notes are kept per patient, so the latest one need not be sent with each request
+note_store = NoteStore(config.note_store.db_path) if config.note_store.enabled else None
+leo = Leo(config, note_store=note_store)
+
+# Long recordings are split at pauses and transcribed in parallel
+if config.transcription.chunking_enabled:
+    transcriber = ChunkedTranscriber(
+        transcriber,
+        max_chunk_seconds=config.transcription.chunk_max_seconds,
+        overlap_seconds=config.transcription.chunk_overlap_seconds,
+        search_seconds=config.transcription.chunk_search_seconds,
+        parallelism=config.transcription.chunk_parallelism
+    )
+
+# Silence and noise gaps are dropped and audio downsampled before anything is sent
+if config.transcription.preprocessing_enabled:
+    transcriber = PreprocessingTranscriber(
+        transcriber,
+        threshold_ratio=config.transcription.vad_threshold_ratio,
+        hangover_ms=config.transcription.vad_hangover_ms
+    )
+
+# Repeat uploads of the same audio reuse the cached transcript
+transcription_cache: Optional[TranscriptionCache] = None
+if config.transcription.cache_enabled:
+    transcription_cache = TranscriptionCache(
+        config.transcription.cache_path,
+        max_bytes=config.transcription.cache_max_bytes
+    )
+    transcriber = CachedTranscriber(transcriber, transcription_cache, config.transcription.model)
+
+# OCR runs in worker processes, off the event loop and outside the GIL
+image_extractor = ImageTextExtractor(
+    backend=OCR_BACKENDS[config.images.ocr_backend](),
+    max_workers=config.images.max_workers,
+    max_side=config.images.max_side,
+    dedup_distance=config.images.dedup_distance
+)
+
+# Identical requests in flight at the same time share one transcription or note
+transcription_flights = SingleFlight("transcription")
+note_flights = SingleFlight("note")
+
+# Background note generation jobs, persisted so a restart does not lose queued work
+job_store = JobStore(config.jobs.db_path)
+job_queue = JobQueue(job_store, concurrency=config.jobs.concurrency, lease_seconds=config.jobs.lease_seconds)
+
+def _collect_metrics() -> None:
+    """Copy queue depths, in-flight counts and cache statistics into the metrics before a scrape"""
+    if leo.scheduler is not None:
+        scheduler = leo.scheduler.stats()
+        metrics.LLM_IN_FLIGHT.set(scheduler["in_flight"])
+        for priority, stats in scheduler["classes"].items():
+            metrics.LLM_QUEUED.set(stats["queued"], priority)
+    metrics.PROVIDER_IN_FLIGHT.set(provider_client.adapter.in_flight)
+    metrics.JOB_QUEUE_DEPTH.set(job_queue.depth)
+    for kind, flights in (("transcription", transcription_flights), ("note", note_flights)):
+        stats = flights.stats()
+        metrics.COALESCED_IN_FLIGHT.set(stats["in_flight"], kind)
+        metrics.COALESCED.set(stats["coalesced"], kind)
+    if leo.llm_cache is not None:
+        stats = leo.llm_cache.stats()
+        for result in ("memory_hits", "disk_hits", "misses"):
+            metrics.CACHE_LOOKUPS.set(stats[result], "llm", result)
+        metrics.CACHE_HIT_RATIO.set(stats["hit_rate"], "llm")
+    if transcription_cache is not None:
+        lookups = transcription_cache.hits + transcription_cache.misses
+        metrics.CACHE_LOOKUPS.set(transcription_cache.hits, "transcription", "hits")
+        metrics.CACHE_LOOKUPS.set(transcription_cache.misses, "transcription", "misses")
+        metrics.CACHE_HIT_RATIO.set(transcription_cache.hits / lookups if lookups else 0.0, "transcription")
+
+metrics.REGISTRY.on_collect(_collect_metrics)
+
 class NoteRequest(BaseModel):
     transcribed_audio: Optional[str] = None
     extracted_text_from_images: Optional[str] = None
     previous_note: Optional[str] = None
     patient_info: Optional[Dict[str, Any]] = None
+    bypass_cache: bool = False
 
-@app.post("/generate-note")
-async def generate_note(request: NoteRequest):
+def _upload_path(directory: str, original_filename: Optional[str]) -> str:
+    """Build a unique, safe path for an uploaded file"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    safe_ext = os.path.splitext(original_filename or "")[1]
+    return os.path.join(directory, f"{timestamp}_{uuid.uuid4().hex}{safe_ext}")
+
+def _error_status(error: Exception, endpoint: str) -> int:
     """
-    Generate a structured progress note from clinical input data
+    Log a failed request and return its HTTP status: 504 when it ran out of time, 503 while
+    the provider's circuit is open, 500 otherwise
     """
-    try:
+    if isinstance(error, (TimeoutError, CircuitOpenError)):
+        status = 504 if isinstance(error, TimeoutError) else 503
+        logging.warning("%s failed with %d: %s", endpoint, status, error)
+        return status
+    logging.exception("Error in %s", endpoint)
+    return 500
+
+def _http_error(error: Exception, endpoint: str) -> HTTPException:
+    return HTTPException(status_code=_error_status(error, endpoint), detail=str(error))
+
+def _sse(event: str, data: Any) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _has_content(value: Any) -> bool:
+    """Whether a streamed section value holds anything beyond empty strings and containers"""
+    if isinstance(value, str):
+        return bool(value.strip())
+    if isinstance(value, dict):
+        return any(_has_content(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_content(item) for item in value)
+    return value is not None
+
+async def _generate_formatted_note(request: NoteRequest) -> Dict[str, Any]:
+    """
+    Run Leo on a note request and return the formatted note and its token usage; an
+    identical request already in flight is waited for instead
+    """
+    async def generate() -> Dict[str, Any]:
         input_data = ClinicalInput(
             transcribed_audio=request.transcribed_audio,
             extracted_text_from_images=request.extracted_text_from_images,
             previous_note=request.previous_note,
-            patient_info=request.patient_info
+            patient_info=request.patient_info,
+            bypass_cache=request.bypass_cache
         )
-        note = leo.process_input(input_data)
-        formatted_note = leo.format_note(note)
-        return {"note": formatted_note}
+        note = await leo.aprocess_input(input_data)
+        return {"note": leo.format_note(note), "token_usage": note.token_usage}
+    return await note_flights.do(canonical_key(request.model_dump()), generate)
+
+async def _transcribe(audio_path: str, audio_sha256: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Transcribe the stored audio file at audio_path, or wait for the transcription of the
+    same audio already in flight; returns the transcript and the preprocessing report
+    """
+    async def transcribe() -> Tuple[str, Optional[Dict[str, Any]]]:
+        reset_preprocessing_report()
+        start = time.perf_counter()
+        # Opened by the shared task, so it does not depend on a handle of whichever caller started it
+        with open(audio_path, "rb") as audio_file:
+            transcript = await transcriber.transcribe(audio_file, audio_sha256)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, "transcription")
+        # The report is set in this task's context, so it is returned with the transcript
+        return transcript, preprocessing_report()
+    return await transcription_flights.do(audio_sha256, transcribe)
+
+async def _transcribe_and_generate(
+    audio_path: str,
+    audio_sha256: str,
+    patient_info: Dict[str, Any],
+    background: bool = False
+) -> Dict[str, Any]:
+    """
+    Transcribe a stored audio file and generate a formatted note from the transcript, within the
+    deadlines for requests or, if background, for background jobs
+    """
+    deadlines = config.deadlines
+    with deadline_scope(deadlines.background_request_seconds if background else deadlines.request_seconds):
+        # Transcribe audio off the event loop
+        with deadline_scope(deadlines.background_transcription_seconds if background else deadlines.transcription_seconds):
+            transcript, preprocessing = await _transcribe(audio_path, audio_sha256)
+        # Only its size and the audio's hash: transcripts are patient data
+        logging.info("Transcribed audio %s: %d characters", audio_sha256, len(transcript))
+
+        # Generate note using Leo, in what is left of the request's time
+        generated = await _generate_formatted_note(NoteRequest(
+            transcribed_audio=transcript,
+            patient_info=patient_info
+        ))
+    return {
+        "transcript": transcript,
+        "preprocessing": preprocessing,
+        **generated
+    }
+
+async def _run_audio_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler for uploads accepted with background=true, profiled if the upload was"""
+    if payload.get("profile_id"):
+        with profiler.profile(payload["profile_id"]):
+            return await _audio_job(payload)
+    return await _audio_job(payload)
+
+async def _audio_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    with llm_priority(BACKGROUND):
+        generated = await _transcribe_and_generate(payload["file_path"], payload["sha256"], payload["patient_info"], background=True)
+    return {
+        "message": "Audio file transcribed and note generated successfully.",
+        "filename": payload["filename"],
+        "size": payload["size"],
+        "sha256": payload["sha256"],
+        "patient_info": payload["patient_info"],
+        **generated
+    }
+
+job_queue.register("upload-audio", _run_audio_job)
+
+@app.post("/generate-note")
+async def generate_note(request: NoteRequest):
+    """
+    Generate a structured progress note from clinical input data
+    """
+    try:
+        return await _generate_formatted_note(request)
     except Exception as e:
-        logging.exception("Error in /generate-note")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _http_error(e, "/generate-note")
+
+@app.post("/generate-note/stream")
+async def generate_note_stream(request: NoteRequest):
+    """
+    Generate a progress note, streaming it as server-sent events
+
+    'delta' events carry narrative text (subjective, assessment, plan) as the model writes it,
+    'section' events carry each ProgressNote section once final, and a closing 'done' event
+    carries the formatted note, stage timings, token usage and the measured time to first content.
+    """
+    input_data = ClinicalInput(
+        transcribed_audio=request.transcribed_audio,
+        extracted_text_from_images=request.extracted_text_from_images,
+        previous_note=request.previous_note,
+        patient_info=request.patient_info,
+        bypass_cache=request.bypass_cache
+    )
+
+    async def events():
+        start = time.perf_counter()
+        time_to_first_content = None
+        try:
+            async for event in leo.astream_input(input_data):
+                if event["event"] == "note":
+                    note = event["note"]
+                    elapsed = time.perf_counter() - start
+                    logging.info(
+                        "Streamed note in %.3fs, time to first content %s",
+                        elapsed,
+                        f"{time_to_first_content:.3f}s" if time_to_first_content is not None else "n/a"
+                    )
+                    yield _sse("done", {
+                        "note": leo.format_note(note),
+                        "stage_timings": note.stage_timings,
+                        "token_usage": note.token_usage,
+                        "time_to_first_content": time_to_first_content,
+                        "total_time": elapsed
+                    })
+                    continue
+                if time_to_first_content is None and _has_content(event.get("text") or event.get("content")):
+                    time_to_first_content = time.perf_counter() - start
+                yield _sse(event["event"], event)
+        except Exception as e:
+            # The response has started, so the status goes in the event
+            yield _sse("error", {"status": _error_status(e, "/generate-note/stream"), "detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/generate-notes")
+async def generate_notes(requests: List[NoteRequest], concurrency: Optional[int] = None):
+    """
+    Generate notes for a batch of patients, streamed back as newline-delimited JSON
+
+    Each line is {"index", "mrn", "note", "token_usage"} or {"index", "mrn", "status", "error"}, with
+    the status the note would have failed with on its own, and is sent as soon as
+    that note is ready, so lines arrive in completion order rather than input order. A final
+    {"done": true, ...} line summarises the batch.
+    """
+    if len(requests) > config.batch.max_notes:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds maximum of {config.batch.max_notes} notes")
+    limit = min(max(concurrency or config.batch.default_concurrency, 1), config.batch.max_concurrency)
+    semaphore = asyncio.Semaphore(limit)
+
+    async def generate_one(index: int, request: NoteRequest) -> Dict[str, Any]:
+        mrn = request.patient_info.get("mrn") if request.patient_info else None
+        async with semaphore:
+            try:
+                # Batch notes yield to interactive requests for the provider's rate limits
+                with llm_priority(BATCH):
+                    return {"index": index, "mrn": mrn, **await _generate_formatted_note(request)}
+            except Exception as e:
+                status = _error_status(e, f"/generate-notes index {index}")
+                return {"index": index, "mrn": mrn, "status": status, "error": str(e)}
+
+    async def lines():
+        tasks = [asyncio.ensure_future(generate_one(i, request)) for i, request in enumerate(requests)]
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                failed += "error" in result
+                yield json.dumps(result) + "\n"
+            yield json.dumps({"done": True, "total": len(tasks), "failed": failed}) + "\n"
+        finally:
+            # Client went away: stop generating notes nobody will read
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.post("/upload-audio")
 async def upload_audio(
     file: UploadFile = File(...),
-    patient_info: str = Form(...)
+    patient_info: str = Form(...),
+    background: bool = False
 ):
     """
     Upload and process audio file
+
+    With background=true the upload is queued as a job and its ID returned immediately;
+    poll /jobs/{job_id} or subscribe to /jobs/{job_id}/events for the result.
     """
     try:
-        # Save audio file with safe filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_ext = os.path.splitext(file.filename)[1]
-        filename = f"{timestamp}_{uuid.uuid4().hex}{safe_ext}"
-        file_path = os.path.join(AUDIO_DIR, filename)
-
-        async with aiofiles.open(file_path, "wb") as buffer:
-            content = await file.read()
-            await buffer.write(content)
-
-        # Validate patient_info JSON
+        # Validate patient_info JSON before accepting the body
         try:
             patient_info_json = json.loads(patient_info)
         except json.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid JSON in patient_info")
 
-        # Transcribe audio using OpenAI Whisper
-        import openai
-        with open(file_path, "rb") as audio_file:
-            print("Transcribing audio file...")
-            transcript_response = openai.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="text"
+        # Stream audio file to disk with safe filename
+        try:
+            spooled = await spool_upload(
+                file,
+                _upload_path(AUDIO_DIR, file.filename),
+                chunk_size=config.upload.chunk_size,
+                max_bytes=config.upload.max_audio_bytes
             )
-            transcript = transcript_response
-            print("Transcription completed. Transcript:", transcript)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
 
-        # Generate note using Leo
-        input_data = ClinicalInput(
-            transcribed_audio=transcript,
-            patient_info=patient_info_json
-        )
-        note = leo.process_input(input_data)
-        formatted_note = leo.format_note(note)
+        # Store under its content hash so repeat uploads share one file
+        safe_ext = os.path.splitext(file.filename or "")[1]
+        duplicate = spooled.store_as(os.path.join(AUDIO_DIR, f"{spooled.sha256}{safe_ext}"))
+        file_path = spooled.path
+        filename = os.path.basename(file_path)
+
+        # The stored file is reopened wherever it is read, so the spooled handle is done with
+        spooled.close()
+        if background:
+            payload = {
+                "file_path": file_path,
+                "filename": filename,
+                "size": spooled.size,
+                "sha256": spooled.sha256,
+                "patient_info": patient_info_json
+            }
+            links = {}
+            profile = current_profile()
+            if profile is not None:
+                # The work happens in the job, so profile it too, under a name of its own
+                payload["profile_id"] = new_profile_id(profile.request_id)
+                links["profile_url"] = f"/profiles/{payload['profile_id']}"
+            job_id = await job_queue.submit("upload-audio", payload)
+            return JSONResponse(status_code=202, content={
+                "message": "Audio file uploaded and queued for processing.",
+                "job_id": job_id,
+                "duplicate": duplicate,
+                "status": "queued",
+                "status_url": f"/jobs/{job_id}",
+                "events_url": f"/jobs/{job_id}/events",
+                **links
+            })
+
+        logging.info("Transcribing audio file %s (%d bytes)", spooled.sha256, spooled.size)
+        generated = await _transcribe_and_generate(file_path, spooled.sha256, patient_info_json)
 
         return {
             "message": "Audio file uploaded, transcribed, and note generated successfully.",
             "filename": filename,
+            "size": spooled.size,
+            "sha256": spooled.sha256,
+            "duplicate": duplicate,
             "patient_info": patient_info_json,
-            "transcript": transcript,
-            "note": formatted_note
+            **generated
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.exception("Error in /upload-audio")
-        print('Exception:', e)
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _http_error(e, "/upload-audio")
 
 @app.post("/upload-image")
 async def upload_image(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    files: List[UploadFile] = File([]),
     patient_info: str = Form(...)
 ):
     """
-    Upload and process image file
+    Upload images, extract their text and generate a note from it
+
+    Accepts a single `file` or a batch of `files` (e.g. whiteboard, monitor and lab printout
+    photos for one patient). Near-identical photos are only OCR'd once.
     """
     try:
-        # Save image file with safe filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_ext = os.path.splitext(file.filename)[1]
-        filename = f"{timestamp}_{uuid.uuid4().hex}{safe_ext}"
-        file_path = os.path.join(IMAGE_DIR, filename)
-
-        async with aiofiles.open(file_path, "wb") as buffer:
-            content = await file.read()
-            await buffer.write(content)
+        uploads = ([file] if file else []) + (files or [])
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No image files uploaded")
+        if len(uploads) > config.images.max_images_per_request:
+            raise HTTPException(
+                status_code=413,
+                detail=f"At most {config.images.max_images_per_request} images per request"
+            )
 
-        # Validate patient_info JSON
+        # Validate patient_info JSON before accepting the body
         try:
             patient_info_json = json.loads(patient_info)
         except json.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid JSON in patient_info")
 
-        # TODO: Implement image text extraction
-        # For now, return a placeholder
+        # Stream image files to disk, stored under their content hash
+        stored = []
+        for upload in uploads:
+            try:
+                spooled = await spool_upload(
+                    upload,
+                    _upload_path(IMAGE_DIR, upload.filename),
+                    chunk_size=config.upload.chunk_size,
+                    max_bytes=config.upload.max_image_bytes
+                )
+            except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            safe_ext = os.path.splitext(upload.filename or "")[1]
+            spooled.store_as(os.path.join(IMAGE_DIR, f"{spooled.sha256}{safe_ext}"))
+            spooled.close()
+            stored.append(spooled)
+
+        # Extract text in the OCR process pool, then generate the note
+        extraction = await image_extractor.extract([spooled.path for spooled in stored])
+        input_data = ClinicalInput(
+            extracted_text_from_images=extraction.combined_text,
+            patient_info=patient_info_json
+        )
+        note = await leo.aprocess_input(input_data)
+
         return {
-            "message": "Image file uploaded successfully",
-            "filename": filename,
-            "patient_info": patient_info_json
+            "message": "Image files uploaded, text extracted, and note generated successfully.",
+            "files": [
+                {
+                    "filename": os.path.basename(spooled.path),
+                    "size": spooled.size,
+                    "sha256": spooled.sha256,
+                    "duplicate_of": extraction.duplicates.get(i)
+                }
+                for i, spooled in enumerate(stored)
+            ],
+            "patient_info": patient_info_json,
+            "extracted_text": extraction.combined_text,
+            "note": leo.format_note(note)
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.exception("Error in /upload-image")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _http_error(e, "/upload-image")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Get the status, and once finished the result, of a background job
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream a background job's status as server-sent events until it finishes
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        current = job
+        yield _sse("status", current)
+        while current["status"] not in FINISHED_STATUSES:
+            try:
+                current = await job_queue.wait(job_id, timeout=config.jobs.heartbeat_seconds)
+            except asyncio.TimeoutError:
+                # Comment line keeps idle proxies from dropping the connection
+                yield ": keep-alive\n\n"
+        yield _sse("done", current)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/patients/{mrn}/notes")
+async def patient_notes(mrn: str, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """
+    Get a patient's stored notes, oldest first, optionally limited to the dates of a stay
+    """
+    if note_store is None:
+        raise HTTPException(status_code=404, detail="Note history is disabled")
+    notes = await asyncio.get_running_loop().run_in_executor(None, note_store.history, mrn, start, end)
+    return {"mrn": mrn, "notes": notes}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Request latencies, stage timings, token counts, cache hit rates, queue depths and
+    in-flight counts in Prometheus' text format
+    """
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/profiles/{request_id}")
+async def get_profile(request_id: str):
+    """
+    A profiled request's stack samples as folded stacks, for flamegraph.pl, speedscope or
+    inferno
+    """
+    path = profiler.path(request_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain; charset=utf-8")
 
 @app.get("/health")
 async def health_check():
@@ -171,7 +623,15 @@ async def health_check():
             "status": "healthy",
             "version": "1.0.0",
             "llm_provider": getattr(config.llm, "provider", "unknown"),
-            "llm_model": getattr(config.llm, "model", "unknown")
+            "llm_model": getattr(config.llm, "model", "unknown"),
+            "provider_pool": provider_client.stats(),
+            "llm_scheduler": leo.scheduler.stats() if leo.scheduler is not None else None,
+            "model_routing": leo.router.stats() if leo.router is not None else None,
+            "circuit_breakers": breaker_stats(),
+            "coalescing": {
+                "transcriptions": transcription_flights.stats(),
+                "notes": note_flights.stats()
+            }
         }
     except Exception as e:
         logging.exception("Error in /health")
@@ -0,0 +1,59 @@
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+import asyncio
+import hashlib
+import json
+import logging
+from resilience import DeadlineExceeded, remaining_time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+def canonical_key(data: Any) -> str:
+    """A digest of JSON-like data that does not depend on key order or formatting"""
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first starts the work as a task, and
+    calls made before it finishes wait for that task and get its result or exception.
+
+    The task runs with the first caller's context (priority, user and deadline), and keeps
+    running if that caller is cancelled, as others may be waiting for it. Each caller stops
+    waiting at its own deadline.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = 0
+        self.coalesced = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+            logger.info("Joined in-flight %s %s", self.name, key[:12])
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), remaining_time())
+        except asyncio.TimeoutError:
+            if task.done():
+                # The work itself timed out
+                raise
+            raise DeadlineExceeded(f"Deadline exceeded waiting for {self.name}")
+
+    def _finished(self, key: str, task: asyncio.Future) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Retrieved here so a failure nobody waited for is not reported as never retrieved
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._in_flight), "started": self.started, "coalesced": self.coalesced}
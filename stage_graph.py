@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import asyncio
+import contextvars
+import threading
+import time
+from profiler import bind
+
+class StageResult:
+    """Outcome of a single stage: its value or the error it raised, plus timing"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+class StageGraph:
+    """
+    A small dependency graph of pipeline stages.
+
+    Each stage is a callable taking the results of the stages it depends on. Stages without
+    a dependency between them run concurrently. A stage that raises records its error in its
+    StageResult instead of cancelling the rest of the graph; dependents still run and can
+    inspect the failure.
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, Callable] = {}
+        self._deps: Dict[str, List[str]] = {}
+
+    def add(self, name: str, func: Callable, depends_on: Sequence[str] = ()) -> None:
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        self._stages[name] = func
+        # Dependencies on stages that were never added are ignored
+        self._deps[name] = [dep for dep in depends_on if dep in self._stages]
+
+    def __len__(self) -> int:
+        return len(self._stages)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._stages
+
+    def run(self, timeout: Optional[float] = None) -> Dict[str, StageResult]:
+        """
+        Run synchronous stages, one thread per stage. Stages still running after timeout
+        seconds are recorded as timed out and left to finish in the background.
+        """
+        results = {name: StageResult(name) for name in self._stages}
+        if not self._stages:
+            return results
+
+        executor = ThreadPoolExecutor(max_workers=len(self._stages), thread_name_prefix="leo-stage")
+        futures = {}
+        finished = set()
+        lock = threading.Lock()
+
+        def run_stage(name: str) -> None:
+            for dep in self._deps[name]:
+                futures[dep].result()
+            deps = {dep: results[dep] for dep in self._deps[name]}
+            start = time.perf_counter()
+            value, error = None, None
+            try:
+                value = self._stages[name](deps)
+            except Exception as e:
+                error = e
+            with lock:
+                # A stage that outlived the timeout must not change results already returned
+                if not abandoned.is_set():
+                    results[name].value, results[name].error = value, error
+                    results[name].duration = time.perf_counter() - start
+                    finished.add(name)
+
+        abandoned = threading.Event()
+        start = time.perf_counter()
+        # Stages are submitted in insertion order, so dependencies always exist first
+        for name in self._stages:
+            ctx = contextvars.copy_context()
+            futures[name] = executor.submit(ctx.run, bind(run_stage), name)
+        wait(futures.values(), timeout=timeout)
+        with lock:
+            abandoned.set()
+            for name in self._stages:
+                if name not in finished:
+                    results[name].error = TimeoutError(f"Stage {name} timed out after {timeout:.1f}s")
+                    results[name].duration = time.perf_counter() - start
+        executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    async def arun(self, on_complete: Optional[Callable[[StageResult], None]] = None) -> Dict[str, StageResult]:
+        """Run coroutine stages as concurrent tasks, calling on_complete as each one finishes"""
+        results = {name: StageResult(name) for name in self._stages}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str) -> None:
+            if self._deps[name]:
+                await asyncio.wait([tasks[dep] for dep in self._deps[name]])
+            deps = {dep: results[dep] for dep in self._deps[name]}
+            start = time.perf_counter()
+            try:
+                results[name].value = await self._stages[name](deps)
+            except Exception as e:
+                results[name].error = e
+            results[name].duration = time.perf_counter() - start
+            if on_complete is not None:
+                on_complete(results[name])
+
+        for name in self._stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+        if tasks:
+            await asyncio.gather(*tasks.values())
+        return results
@@ -0,0 +1,47 @@
+from typing import Iterator
+from config import LLMConfig
+from delegating_llm import DelegatingLLM
+from llm_interface import LLMInterface
+
+# Narrative sections first, so they start streaming as soon as the model starts writing
+CONVERSATION_PROMPT = (
+    "You are a clinical documentation assistant writing a nurse's progress note from a "
+    "transcript of the encounter. Use only facts in the transcript. Respond with only a JSON "
+    "object with these keys, in this order: \"subjective\" (string: patient-reported symptoms "
+    "and history), \"assessment\" (string), \"plan\" (string), \"vitals\" (array of strings "
+    "as 'Name: value', e.g. 'BP: 120/80'), \"labs\" (array of strings as 'Name: value unit'), "
+    "\"physical_exam\" (array of strings) and \"medications\" (array of strings with dose)."
+)
+
+class OpenAIStreamingLLM(DelegatingLLM):
+    """
+    LLMInterface wrapper adding stream_clinical_conversation: the transcript extraction as a
+    streamed chat completion, yielding the model's JSON output as its tokens arrive. The
+    other methods are passed through to the wrapped LLM.
+    """
+
+    def __init__(self, llm: LLMInterface, config: LLMConfig):
+        super().__init__(llm)
+        self.config = config
+
+    def stream_clinical_conversation(self, transcript: str) -> Iterator[str]:
+        import openai
+        response = openai.ChatCompletion.create(
+            model=self.config.model,
+            api_key=self.config.api_key,
+            messages=[
+                {"role": "system", "content": CONVERSATION_PROMPT},
+                {"role": "user", "content": transcript}
+            ],
+            temperature=self.config.temperature,
+            max_tokens=self.config.max_tokens,
+            top_p=self.config.top_p,
+            frequency_penalty=self.config.frequency_penalty,
+            presence_penalty=self.config.presence_penalty,
+            stream=True
+        )
+        for chunk in response:
+            choices = chunk.get("choices") or [{}]
+            content = choices[0].get("delta", {}).get("content")
+            if content:
+                yield content
@@ -0,0 +1,227 @@
+from typing import Any, Dict, List, Optional, Tuple
+import re
+
+# Canonical vital and lab names with the spellings that refer to them. Lowercase aliases
+# match in any case; aliases containing capitals are ambiguous in prose ("K", "P", "Mg")
+# and only match exactly as written. Lowercase aliases in AMBIGUOUS_ALIASES are also
+# ordinary words ("sat", "bun") and need a unit or a ":" or "=" to count as a reading.
+VITALS = {
+    "BP": ("bp", "blood pressure", "b/p", "NIBP"),
+    "HR": ("hr", "heart rate", "pulse", "P"),
+    "RR": ("rr", "resp rate", "respiratory rate", "respirations", "resp"),
+    "Temp": ("temp", "temperature", "tmax", "T"),
+    "SpO2": ("spo2", "sao2", "o2 sat", "o2 sats", "oxygen saturation", "pulse ox", "sat", "sats"),
+    "Weight": ("weight", "wt"),
+}
+LABS = {
+    "WBC": ("wbc", "white count", "white blood cells"),
+    "Hgb": ("hgb", "hemoglobin", "haemoglobin", "Hb"),
+    "Hct": ("hct", "hematocrit"),
+    "Plt": ("plt", "plts", "platelets"),
+    "Na": ("sodium", "Na"),
+    "K": ("potassium", "K"),
+    "Cl": ("chloride", "Cl"),
+    "CO2": ("co2", "hco3", "bicarb", "bicarbonate"),
+    "BUN": ("BUN", "bun"),
+    "Cr": ("creatinine", "creat", "Cr"),
+    "Glucose": ("glucose", "blood glucose", "blood sugar", "glu", "BG"),
+    "Ca": ("calcium", "Ca"),
+    "Mg": ("magnesium", "mag", "Mg"),
+    "Phos": ("phosphorus", "phosphate", "phos"),
+    "Lactate": ("lactate", "lactic acid"),
+    "Troponin": ("troponin", "trop", "tni", "hs-tnt"),
+    "INR": ("inr",),
+    "BNP": ("bnp", "nt-probnp"),
+    "A1c": ("a1c", "hba1c", "hemoglobin a1c"),
+    "ALT": ("ALT", "alt"),
+    "AST": ("ast",),
+    "Alk Phos": ("alk phos", "alkaline phosphatase", "alp"),
+    "T Bili": ("t bili", "tbili", "total bilirubin", "bilirubin"),
+    "Albumin": ("albumin", "alb"),
+    "CRP": ("crp",),
+    "TSH": ("tsh",),
+}
+AMBIGUOUS_ALIASES = ("sat", "sats", "alt", "bun", "mag", "alb", "glu")
+# Unit spellings mapped to their canonical form
+UNITS = {
+    "mmhg": "mmHg",
+    "bpm": "bpm",
+    "breaths/min": "/min",
+    "/min": "/min",
+    "°f": "°F",
+    "degf": "°F",
+    "f": "°F",
+    "°c": "°C",
+    "degc": "°C",
+    "c": "°C",
+    "%": "%",
+    "kg": "kg",
+    "lbs": "lb",
+    "lb": "lb",
+    "k/ul": "K/uL",
+    "k/µl": "K/uL",
+    "x10^3/ul": "K/uL",
+    "x10^9/l": "K/uL",
+    "10^3/ul": "K/uL",
+    "g/dl": "g/dL",
+    "mg/dl": "mg/dL",
+    "mg/l": "mg/L",
+    "mmol/l": "mmol/L",
+    "µmol/l": "µmol/L",
+    "umol/l": "µmol/L",
+    "g/l": "g/L",
+    "mmol/mol": "mmol/mol",
+    "meq/l": "mEq/L",
+    "ng/ml": "ng/mL",
+    "ng/l": "ng/L",
+    "pg/ml": "pg/mL",
+    "u/l": "U/L",
+    "iu/l": "U/L",
+    "miu/l": "mIU/L",
+    "uiu/ml": "mIU/L",
+}
+# A number followed by one of these, but not "/L" etc., is a dose ("vitamin K 10 mg",
+# "K 20 mEq"), not a reading
+DOSE_UNITS = ("mg", "mcg", "g", "units?", "tabs?", "tablets?", "ml", "puffs?", "meq", "mmol")
+# Readings outside these ranges are taken to be something else, e.g. a dose or a date
+PLAUSIBLE_RANGES = {
+    "HR": (20, 250),
+    "RR": (4, 80),
+    "Temp": (30, 110),
+    "SpO2": (50, 100),
+    "Weight": (1, 700),
+}
+# Lab readings outside these ranges are taken to be something else too, e.g. a dose given
+# ("K 20"). The range is in the lab's usual unit, and only readings written in that unit or
+# without one are checked. (unit, low, high); INR has no unit.
+LAB_PLAUSIBLE_RANGES = {
+    "K": ("mEq/L", 1.0, 10.0),
+    "Na": ("mEq/L", 100, 190),
+    "Cl": ("mEq/L", 60, 150),
+    "CO2": ("mEq/L", 3, 60),
+    "BUN": ("mg/dL", 1, 300),
+    "Cr": ("mg/dL", 0.1, 25),
+    "Glucose": ("mg/dL", 10, 2000),
+    "Ca": ("mg/dL", 2, 20),
+    "Mg": ("mg/dL", 0.3, 10),
+    "Phos": ("mg/dL", 0.3, 20),
+    "Lactate": ("mmol/L", 0.1, 30),
+    "Hgb": ("g/dL", 2, 25),
+    "WBC": ("K/uL", 0.1, 500),
+    "Plt": ("K/uL", 1, 2000),
+    "INR": (None, 0.5, 20),
+}
+# At most this many words outside recognised readings, per reading, for text to count as purely structured
+STRUCTURED_WORDS_PER_READING = 0.5
+
+def _alternation(aliases) -> str:
+    # Longest first, so "hemoglobin a1c" wins over "hemoglobin"
+    parts = []
+    for alias in sorted(aliases, key=len, reverse=True):
+        escaped = re.escape(alias).replace(r"\ ", r"\s+")
+        parts.append(escaped if alias != alias.lower() else f"(?i:{escaped})")
+    return "|".join(parts)
+
+_ALIASES = {
+    alias.lower() if alias == alias.lower() else alias: name
+    for table in (VITALS, LABS)
+    for name, aliases in table.items()
+    for alias in aliases
+}
+_CAPITALISED = {alias for alias in _ALIASES if alias != alias.lower()}
+_READING = re.compile(
+    r"(?<![\w/])(?P<name>" + _alternation(_ALIASES) + r")(?![\w/])"
+    r"(?P<separator>[\s:=]*)(?:(?i:is|was|of|at)\s+)?"
+    r"(?P<value>\d{2,3}\s*/\s*\d{2,3}|\d+(?:\.\d+)?|\.\d+)"
+    r"(?!\.?\d)(?!\s*(?i:" + "|".join(DOSE_UNITS) + r")(?![\w/]))"
+    # Not a decade or a range, as in "80s" or "80-90"
+    r"(?!'?s(?![A-Za-z]))(?!\s*(?:-|–|(?i:to)\s)\s*\.?\d)"
+    r"(?:\s*(?P<unit>(?i:" + "|".join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True)) + r"))(?![A-Za-z]))?"
+)
+_WORD = re.compile(r"[A-Za-z]{2,}")
+
+def canonical_name(label: str) -> Optional[str]:
+    """The canonical vital or lab name for a label such as "Blood pressure", if known"""
+    label = " ".join(label.split())
+    return _ALIASES.get(label) or _ALIASES.get(label.lower())
+
+class StructuredExtraction:
+    """Vitals and labs read from text by pattern matching"""
+
+    def __init__(self, vitals: List[str], labs: List[str], residual_words: int):
+        self.vitals = vitals
+        self.labs = labs
+        self.residual_words = residual_words
+
+    @property
+    def is_structured(self) -> bool:
+        """True if the text is essentially nothing but readings, e.g. an OCR'd lab sheet"""
+        readings = len(self.vitals) + len(self.labs)
+        return readings > 0 and self.residual_words <= readings * STRUCTURED_WORDS_PER_READING
+
+    def as_result(self) -> Dict[str, Any]:
+        """The extraction in the shape LLMInterface returns"""
+        return {"vitals": list(self.vitals), "labs": list(self.labs)}
+
+    def merge_into(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return result with these vitals and labs filling in the measurements the model left
+        out or left empty; readings the model gave are kept as they are
+        """
+        merged = dict(result)
+        for key, found in (("vitals", self.vitals), ("labs", self.labs)):
+            ours = {entry.split(":", 1)[0]: entry for entry in found}
+            entries = []
+            for entry in result.get(key) or []:
+                label, _, value = str(entry).partition(":")
+                name = canonical_name(label)
+                if name in ours and not value.strip():
+                    entry = ours[name]
+                entries.append(entry)
+                ours.pop(name, None)
+            merged[key] = entries + list(ours.values())
+        return merged
+
+def extract_structured(text: str) -> StructuredExtraction:
+    """Find vitals and labs in free text or OCR output"""
+    vitals: List[str] = []
+    labs: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    for match in _READING.finditer(text):
+        alias = match.group("name")
+        name = canonical_name(alias)
+        value = re.sub(r"\s+", "", match.group("value"))
+        if (
+            alias.lower() in AMBIGUOUS_ALIASES and alias not in _CAPITALISED
+            and match.group("unit") is None and not set(match.group("separator")) & {":", "="}
+        ):
+            continue
+        if ("/" in value) != (name == "BP"):
+            continue
+        if name in PLAUSIBLE_RANGES:
+            low, high = PLAUSIBLE_RANGES[name]
+            if not low <= float(value) <= high:
+                continue
+        unit = UNITS.get(match.group("unit").lower()) if match.group("unit") else None
+        if name in LAB_PLAUSIBLE_RANGES:
+            usual, low, high = LAB_PLAUSIBLE_RANGES[name]
+            if unit in (None, usual) and not low <= float(value) <= high:
+                continue
+        if unit is None:
+            entry = f"{name}: {value}"
+        elif unit in ("%", "°F", "°C"):
+            entry = f"{name}: {value}{unit}"
+        else:
+            entry = f"{name}: {value} {unit}"
+        target = vitals if name in VITALS else labs
+        if entry not in target:
+            target.append(entry)
+        spans.append(match.span())
+
+    residual = []
+    position = 0
+    for start, end in spans:
+        residual.append(text[position:start])
+        position = end
+    residual.append(text[position:])
+    return StructuredExtraction(vitals, labs, len(_WORD.findall(" ".join(residual))))
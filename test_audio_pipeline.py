@@ -0,0 +1,189 @@
+import pytest
+import asyncio
+import wave
+import numpy as np
+from unittest.mock import Mock
+from transcription import Transcriber
+from audio_pipeline import (
+    ChunkedTranscriber, FrameEnergyScanner, PreprocessingTranscriber, decode_to_pcm, find_split_points, frame_energy,
+    merge_transcripts, preprocess_audio, preprocessing_report, resample
+)
+
+SAMPLE_RATE = 16000
+WORDS = 40
+
+def tone_speech(words: int = WORDS) -> np.ndarray:
+    """Synthetic 'speech': word i is a 0.3s tone at (3 + i) * 100 Hz, followed by a pause"""
+    rng = np.random.default_rng(0)
+    parts = []
+    for i in range(words):
+        t = np.arange(int(0.3 * SAMPLE_RATE)) / SAMPLE_RATE
+        parts.append(8000 * np.sin(2 * np.pi * (3 + i) * 100 * t))
+        parts.append(np.zeros(int(rng.uniform(0.2, 0.4) * SAMPLE_RATE)))
+    return np.concatenate(parts).astype(np.int16)
+
+def expected_transcript(words: int = WORDS) -> str:
+    return " ".join(f"w{3 + i}" for i in range(words))
+
+class ToneTranscriber(Transcriber):
+    """Local stub: 'hears' each tone burst in a WAV chunk as the word w<frequency / 100>"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def transcribe(self, audio_file, audio_sha256=None):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        with wave.open(audio_file, "rb") as wav:
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+        voiced = np.repeat(frame_energy(samples, SAMPLE_RATE, 10) > 100, SAMPLE_RATE // 100)
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+        words = []
+        for start, end in zip(edges[::2], edges[1::2]):
+            if end - start < 0.1 * SAMPLE_RATE:
+                continue  # Too little of the word to recognise
+            spectrum = np.abs(np.fft.rfft(samples[start:end]))
+            freq = np.argmax(spectrum) * SAMPLE_RATE / (end - start)
+            words.append(f"w{round(freq / 100)}")
+        return " ".join(words)
+
+@pytest.fixture
+def speech_wav(tmp_path):
+    """Write the synthetic recording to a WAV file"""
+    path = str(tmp_path / "round.wav")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(tone_speech().tobytes())
+    return path
+
+def test_split_points_fall_in_pauses():
+    """Test chunks are bounded and every split lands in silence"""
+    samples = tone_speech()
+    splits = find_split_points(samples, SAMPLE_RATE, max_chunk_seconds=5, search_seconds=2)
+    bounds = [0] + splits + [len(samples)]
+    
+    assert len(splits) >= 4
+    assert max(b - a for a, b in zip(bounds, bounds[1:])) <= 5 * SAMPLE_RATE
+    assert all(np.abs(samples[s - 80:s + 80]).max() == 0 for s in splits)
+
+def test_merge_transcripts_drops_boundary_repeats():
+    """Test words heard by two overlapping chunks appear once"""
+    assert merge_transcripts(["BP is 120 over", "over 80, heart rate 72.", "Rate 72. Plan: continue"]) == \
+        "BP is 120 over 80, heart rate 72. Plan: continue"
+
+@pytest.mark.asyncio
+async def test_chunked_transcription_matches_whole_file(speech_wav):
+    """Test chunks are transcribed concurrently and stitched back in order without losing words"""
+    stub = ToneTranscriber()
+    with open(speech_wav, "rb") as audio_file:
+        whole = await stub.transcribe(audio_file)
+    
+    chunked = ChunkedTranscriber(stub, max_chunk_seconds=5, overlap_seconds=1, search_seconds=2, parallelism=2)
+    stub.calls = stub.peak = 0
+    with open(speech_wav, "rb") as audio_file:
+        transcript = await chunked.transcribe(audio_file)
+    
+    assert whole == expected_transcript()
+    assert transcript == expected_transcript()
+    assert stub.calls >= 4
+    assert stub.peak == 2
+
+@pytest.mark.asyncio
+async def test_short_recordings_are_not_chunked(speech_wav):
+    """Test recordings under the chunk limit go to the transcriber whole"""
+    stub = ToneTranscriber()
+    chunked = ChunkedTranscriber(stub, max_chunk_seconds=600)
+    with open(speech_wav, "rb") as audio_file:
+        assert await chunked.transcribe(audio_file) == expected_transcript()
+    assert stub.calls == 1
+    samples, sample_rate = decode_to_pcm(speech_wav)
+    assert sample_rate == SAMPLE_RATE and len(samples) > 0
+
+def write_wav(path, samples, sample_rate, channels=1):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+
+@pytest.fixture
+def sparse_recording(tmp_path):
+    """Stereo 48 kHz recording: five words separated by 3s of faint room noise"""
+    rate = 48000
+    rng = np.random.default_rng(1)
+    parts, onsets = [], []
+    for i in range(5):
+        parts.append(rng.normal(0, 20, 3 * rate))
+        onsets.append(sum(len(p) for p in parts) / rate)
+        t = np.arange(int(0.3 * rate)) / rate
+        parts.append(8000 * np.sin(2 * np.pi * (3 + i) * 100 * t))
+    parts.append(rng.normal(0, 20, 3 * rate))
+    mono = np.concatenate(parts)
+    path = str(tmp_path / "bedside.wav")
+    write_wav(path, np.repeat(mono, 2), rate, channels=2)
+    return path, onsets
+
+def test_resample_preserves_pitch():
+    """Test downsampling keeps duration and frequency"""
+    t = np.arange(48000) / 48000
+    samples = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+    down = resample(samples, 48000, 16000)
+    assert len(down) == 16000
+    assert np.argmax(np.abs(np.fft.rfft(down))) == 440
+
+def test_preprocess_drops_silence_and_maps_timestamps(sparse_recording):
+    """Test non-speech is removed and processed offsets map back to the original"""
+    path, onsets = sparse_recording
+    prepared = preprocess_audio(path)
+    report = prepared.report()
+    
+    assert prepared.sample_rate == 16000
+    assert report["original_seconds"] == pytest.approx(19.5, abs=0.01)
+    assert report["processed_seconds"] < 5
+    assert report["bytes_saved"] > 0.9 * report["original_bytes"]
+    assert len(report["timestamp_map"]) == 5
+    # Each kept segment starts shortly before its word; map those offsets back
+    for (processed_start, original_start, _), onset in zip(prepared.segments, onsets):
+        assert prepared.to_original_time(processed_start + 0.35) == pytest.approx(original_start + 0.35)
+        assert onset - 0.35 <= original_start <= onset
+
+@pytest.mark.asyncio
+async def test_preprocessing_transcriber_reports_savings(sparse_recording):
+    """Test the trimmed audio transcribes the same and the savings are reported"""
+    path, _ = sparse_recording
+    stub = ToneTranscriber()
+    transcriber = PreprocessingTranscriber(stub)
+    with open(path, "rb") as audio_file:
+        transcript = await transcriber.transcribe(audio_file)
+    
+    assert transcript == expected_transcript(5)
+    assert preprocessing_report()["seconds_saved"] > 10
+
+def test_block_energies_match_whole_recording():
+    """Test frame energies taken a block at a time match those of the whole recording"""
+    samples = tone_speech(5)
+    scanner = FrameEnergyScanner(SAMPLE_RATE, 30)
+    for start in range(0, len(samples), 7001):
+        scanner.feed(samples[start:start + 7001])
+    assert scanner.total_samples == len(samples)
+    assert np.allclose(scanner.energy(), frame_energy(samples, SAMPLE_RATE, 30))
+
+@pytest.mark.asyncio
+async def test_preprocessed_pcm_is_chunked_without_decoding_again(sparse_recording, monkeypatch):
+    """Test trimmed audio goes to the chunker as PCM rather than through a file it decodes again"""
+    path, _ = sparse_recording
+    stub = ToneTranscriber()
+    transcriber = PreprocessingTranscriber(ChunkedTranscriber(stub, max_chunk_seconds=1.5, overlap_seconds=0.2, search_seconds=0.5))
+    monkeypatch.setattr("audio_pipeline.decode_to_pcm", Mock(side_effect=AssertionError("decoded again")))
+    with open(path, "rb") as audio_file:
+        transcript = await transcriber.transcribe(audio_file)
+
+    assert transcript == expected_transcript(5)
+    assert stub.calls >= 2
@@ -0,0 +1,104 @@
+import pytest
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput
+from combined_extraction import build_encounter_prompt
+from metrics import MeteredLLM
+
+ENCOUNTER = {
+    "subjective": "Patient reports improved breathing",
+    "vitals": ["BP: 120/80", "HR: 72"],
+    "labs": ["WBC: 8.5"],
+    "physical_exam": ["Lungs clear"],
+    "other_data": ["Whiteboard: Room 302"],
+    "assessment": "Improving respiratory status",
+    "plan": "Continue current treatment",
+    "medications": ["Lisinopril 10mg"],
+    "new_findings": ["Improved breathing"],
+    "resolved_issues": ["Fever resolved"]
+}
+
+@pytest.fixture
+def single_pass_config():
+    config = Config()
+    config.clinical_note.single_pass_extraction = True
+    return config
+
+@pytest.fixture
+def input_data():
+    return ClinicalInput(
+        transcribed_audio="Doctor: Patient reports improved breathing.",
+        extracted_text_from_images="Whiteboard: Room 302",
+        previous_note="Previous note content",
+        patient_info={"name": "John Doe", "mrn": "12345"}
+    )
+
+def test_prompt_marks_missing_inputs():
+    """Test a missing input is marked rather than left out"""
+    prompt = build_encounter_prompt("Doctor: hello", "", "")
+    assert "## Transcript\nDoctor: hello" in prompt
+    assert "## Previous note\n(none)" in prompt
+
+def test_single_call_maps_onto_note(single_pass_config, input_data):
+    """Test one call replaces the three stages and fills every section"""
+    llm = Mock()
+    llm.process_clinical_encounter.return_value = ENCOUNTER
+    note = Leo(single_pass_config, llm=llm).process_input(input_data)
+
+    llm.process_clinical_encounter.assert_called_once()
+    llm.process_clinical_conversation.assert_not_called()
+    llm.process_clinical_image.assert_not_called()
+    llm.compare_notes.assert_not_called()
+    assert note.subjective == "Patient reports improved breathing"
+    assert note.objective["vitals"] == ["BP: 120/80", "HR: 72"]
+    assert note.objective["physical_exam"] == ["Lungs clear"]
+    assert note.objective["other_data"] == ["Whiteboard: Room 302"]
+    assert note.action_items == ["Review medication: Lisinopril 10mg"]
+    assert note.changes_since_last_note == "New findings: Improved breathing\nResolved issues: Fever resolved"
+    assert list(note.stage_timings) == ["encounter"]
+    assert note.token_usage["tokens_in"] > 0
+
+def test_failed_call_is_a_discrepancy_per_stage(single_pass_config, input_data):
+    """Test a failed or malformed response leaves the note empty with the errors listed"""
+    llm = Mock()
+    llm.process_clinical_encounter.return_value = {"vitals": "not a list"}
+    note = Leo(single_pass_config, llm=llm).process_input(input_data)
+
+    assert note.subjective == ""
+    assert [d.split(":")[0] for d in note.discrepancies] == [
+        "Error processing audio transcript", "Error processing image text", "Error comparing notes"
+    ]
+
+def test_falls_back_without_provider_support(single_pass_config, input_data):
+    """Test an LLM without process_clinical_encounter keeps the three calls"""
+    llm = Mock(spec=["process_clinical_conversation", "process_clinical_image", "compare_notes"])
+    llm.process_clinical_conversation.return_value = {"subjective": "ok"}
+    llm.process_clinical_image.return_value = {}
+    llm.compare_notes.return_value = {}
+    note = Leo(single_pass_config, llm=llm).process_input(input_data)
+
+    assert note.subjective == "ok"
+    assert set(note.stage_timings) == {"audio", "image", "compare"}
+
+def test_wrappers_do_not_claim_provider_support(single_pass_config, input_data):
+    """Test a wrapper passing calls on does not make an LLM without the single call use it"""
+    llm = Mock(spec=["process_clinical_conversation", "process_clinical_image", "compare_notes"])
+    llm.process_clinical_conversation.return_value = {"subjective": "ok"}
+    llm.process_clinical_image.return_value = {}
+    llm.compare_notes.return_value = {}
+    note = Leo(single_pass_config, llm=MeteredLLM(llm, "gpt-4")).process_input(input_data)
+
+    assert note.subjective == "ok"
+    assert note.discrepancies == []
+    assert set(note.stage_timings) == {"audio", "image", "compare"}
+
+@pytest.mark.asyncio
+async def test_async_single_call(single_pass_config, input_data):
+    """Test aprocess_input makes the same single call"""
+    llm = Mock()
+    llm.process_clinical_encounter.return_value = ENCOUNTER
+    note = await Leo(single_pass_config, llm=llm).aprocess_input(input_data)
+
+    llm.process_clinical_encounter.assert_called_once()
+    assert note.plan == "Continue current treatment"
+    assert note.changes_since_last_note.startswith("New findings: Improved breathing")
@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput
+from context_packer import ContextPacker, TokenCounter, GAP_MARKER
+
+class WordCounter(TokenCounter):
+    """Counts one token per word, so budgets in tests are easy to reason about"""
+
+    def count(self, text):
+        return len(text.split())
+
+def transcript(turns: int) -> str:
+    return "\n".join(f"Doctor: small talk about the weather number {i}" for i in range(turns))
+
+def test_short_text_is_untouched():
+    """Test text within budget is sent as is"""
+    packed = ContextPacker(WordCounter()).pack("Doctor: hello", 100)
+    assert (packed.text, packed.tokens, packed.trimmed) == ("Doctor: hello", 2, 0)
+
+def test_keeps_recent_and_relevant_lines():
+    """Test packing keeps the latest turns plus older clinical lines, in order, within budget"""
+    text = transcript(20).replace(
+        "Doctor: small talk about the weather number 3",
+        "Doctor: potassium was K 5.9 so start kayexalate"
+    )
+    packed = ContextPacker(WordCounter()).pack(text, 40)
+
+    lines = packed.text.splitlines()
+    assert packed.tokens <= 40
+    assert packed.trimmed > 0
+    assert lines[:3] == [GAP_MARKER, "Doctor: potassium was K 5.9 so start kayexalate", GAP_MARKER]
+    assert lines[-1] == "Doctor: small talk about the weather number 19"
+
+def test_previous_note_summary_is_cached_per_mrn():
+    """Test a long previous note is compressed once and reused until it changes"""
+    leo = Leo(Config(), llm=Mock())
+    previous = leo.format_note(leo.process_input(ClinicalInput()).model_copy(update={
+        "subjective": "Patient reports chest pain. " + "More history. " * 200,
+        "plan": "Continue aspirin."
+    }))
+    packer = ContextPacker(WordCounter())
+
+    first = packer.pack_previous_note(previous, 100, mrn="12345")
+    assert first.tokens <= 100
+    assert "Patient reports chest pain." in first.text
+    assert "Continue aspirin." in first.text
+    assert "More history" not in first.text
+    assert packer.pack_previous_note(previous, 100, mrn="12345") is first
+    assert packer.pack_previous_note(previous + " ", 100, mrn="12345") is not first
+
+@pytest.mark.asyncio
+async def test_leo_enforces_budget_and_reports_tokens():
+    """Test the transcript sent to the model fits max_note_length and usage is reported"""
+    config = Config()
+    config.clinical_note.max_note_length = 50
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"subjective": "ok"}
+    leo = Leo(config, llm=llm)
+
+    note = await leo.aprocess_input(ClinicalInput(transcribed_audio=transcript(100)))
+
+    sent = llm.process_clinical_conversation.call_args[0][0]
+    assert leo.packer.counter.count(sent) <= 50
+    assert note.token_usage["tokens_in"] == leo.packer.counter.count(sent)
+    assert note.token_usage["tokens_out"] > 0
+    assert note.token_usage["tokens_trimmed"] > 0
@@ -0,0 +1,49 @@
+import pytest
+from image_pipeline import ImageTextExtractor, OCRBackend, dedupe_by_hash, dhash, hamming
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image, ImageDraw
+
+class SizeOCR(OCRBackend):
+    """Local OCR stub: 'reads' the image size, so tests need no OCR engine"""
+
+    def extract_text(self, image) -> str:
+        return f"{image.mode} {image.size[0]}x{image.size[1]}"
+
+def draw_photo(path, boxes, brightness=0, size=(800, 600)):
+    """Draw a synthetic 'whiteboard' photo with dark boxes at the given positions"""
+    image = Image.new("RGB", size, (230 + brightness, 230 + brightness, 225 + brightness))
+    draw = ImageDraw.Draw(image)
+    for x, y in boxes:
+        draw.rectangle((x, y, x + 150, y + 60), fill=(20, 20, 20))
+    image.save(path, quality=90)
+    return str(path)
+
+@pytest.fixture
+def photos(tmp_path):
+    """Two shots of the same whiteboard and one of a different monitor"""
+    return [
+        draw_photo(tmp_path / "board.jpg", [(50, 50), (400, 300)]),
+        draw_photo(tmp_path / "board_again.jpg", [(52, 50), (401, 302)], brightness=8),
+        draw_photo(tmp_path / "monitor.png", [(600, 40), (100, 450), (300, 200)], size=(2400, 1800))
+    ]
+
+def test_perceptual_hash_matches_near_duplicates(photos):
+    """Test retaken photos hash close together and different scenes far apart"""
+    board, board_again, monitor = (dhash(path) for path in photos)
+    assert hamming(board, board_again) <= 5
+    assert hamming(board, monitor) > 5
+    assert dedupe_by_hash([board, monitor, board_again], 5) == {2: 0}
+
+@pytest.mark.asyncio
+async def test_extractor_skips_duplicates_and_resizes(photos):
+    """Test OCR runs once per distinct photo, in worker processes, on downscaled images"""
+    extractor = ImageTextExtractor(backend=SizeOCR(), max_workers=2, max_side=1200)
+    try:
+        extraction = await extractor.extract(photos)
+    finally:
+        extractor.shutdown()
+    
+    assert extraction.duplicates == {1: 0}
+    assert extraction.texts == {0: "L 800x600", 2: "L 1200x900"}
+    assert extraction.combined_text == "[Image 1: board.jpg]\nL 800x600\n\n[Image 3: monitor.png]\nL 1200x900"
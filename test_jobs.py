@@ -0,0 +1,155 @@
+import pytest
+import asyncio
+import threading
+import time
+from config import Config, JobConfig, UploadConfig
+from jobs import JobStore, JobQueue, QUEUED, RUNNING, SUCCEEDED, FAILED
+
+@pytest.fixture
+def job_store(tmp_path):
+    """Create a job store in a temporary database"""
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+def test_job_store_round_trip(job_store):
+    """Test jobs are persisted with their payload and status"""
+    job_id = job_store.create("upload-audio", {"file_path": "a.mp4", "patient_info": {"mrn": "12345"}})
+    job = job_store.get(job_id)
+    assert job["status"] == QUEUED
+    assert job["payload"]["patient_info"] == {"mrn": "12345"}
+    
+    job_store.update(job_id, SUCCEEDED, result={"note": "..."})
+    assert job_store.get(job_id)["result"] == {"note": "..."}
+    assert job_store.unfinished() == []
+    assert job_store.get("missing") is None
+
+@pytest.mark.asyncio
+async def test_job_queue_bounds_concurrency(job_store):
+    """Test workers never run more jobs at once than configured"""
+    running = 0
+    peak = 0
+    
+    async def handler(payload):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        if payload.get("fail"):
+            raise RuntimeError("transcription failed")
+        return {"n": payload["n"]}
+    
+    queue = JobQueue(job_store, concurrency=2)
+    queue.register("note", handler)
+    await queue.start()
+    try:
+        job_ids = [await queue.submit("note", {"n": n}) for n in range(6)]
+        failed_id = await queue.submit("note", {"n": 6, "fail": True})
+        jobs = [await queue.wait(job_id, timeout=5) for job_id in job_ids]
+        failed = await queue.wait(failed_id, timeout=5)
+    finally:
+        await queue.stop()
+    
+    assert peak == 2
+    assert [job["result"]["n"] for job in jobs] == list(range(6))
+    assert all(job["status"] == SUCCEEDED for job in jobs)
+    assert failed["status"] == FAILED
+    assert failed["error"] == "transcription failed"
+
+@pytest.mark.asyncio
+async def test_job_queue_resumes_unfinished_jobs(tmp_path):
+    """Test queued and interrupted jobs are picked up after a restart"""
+    db_path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(db_path)
+    queued_id = store.create("note", {"n": 1})
+    interrupted_id = store.create("note", {"n": 2})
+    store.update(interrupted_id, RUNNING)
+    store.close()
+    
+    async def handler(payload):
+        return {"n": payload["n"]}
+    
+    restarted = JobStore(db_path)
+    queue = JobQueue(restarted, concurrency=1)
+    queue.register("note", handler)
+    await queue.start()
+    try:
+        assert (await queue.wait(queued_id, timeout=5))["status"] == SUCCEEDED
+        assert (await queue.wait(interrupted_id, timeout=5))["result"] == {"n": 2}
+    finally:
+        await queue.stop()
+        restarted.close()
+
+@pytest.mark.asyncio
+async def test_job_queue_store_access_is_off_the_event_loop(job_store):
+    """Test the queue reads and writes job state in executor threads"""
+    threads = []
+    for name in ("create", "get", "claim", "finish", "unfinished"):
+        method = getattr(job_store, name)
+        def recorded(*args, method=method, **kwargs):
+            threads.append(threading.current_thread())
+            return method(*args, **kwargs)
+        setattr(job_store, name, recorded)
+
+    async def handler(payload):
+        return {"n": payload["n"]}
+
+    queue = JobQueue(job_store, concurrency=1)
+    queue.register("note", handler)
+    await queue.start()
+    try:
+        job = await queue.wait(await queue.submit("note", {"n": 1}), timeout=5)
+    finally:
+        await queue.stop()
+
+    assert job["status"] == SUCCEEDED
+    assert len(threads) >= 5
+    assert threading.main_thread() not in threads
+
+@pytest.mark.asyncio
+async def test_processes_sharing_a_store_run_each_job_once(tmp_path):
+    """Test queues in two processes claim jobs, so neither runs one the other has"""
+    db_path = str(tmp_path / "jobs.sqlite3")
+    stores = [JobStore(db_path), JobStore(db_path)]
+    runs = []
+
+    async def handler(payload):
+        runs.append(payload["n"])
+        await asyncio.sleep(0.02)
+        return {"n": payload["n"]}
+
+    queues = [JobQueue(store, concurrency=2) for store in stores]
+    for queue in queues:
+        queue.register("note", handler)
+    job_ids = [stores[0].create("note", {"n": n}) for n in range(6)]
+    await asyncio.gather(*(queue.start() for queue in queues))
+    try:
+        jobs = [await queues[1].wait(job_id, timeout=5) for job_id in job_ids]
+    finally:
+        await asyncio.gather(*(queue.stop() for queue in queues))
+        for store in stores:
+            store.close()
+
+    assert sorted(runs) == list(range(6))
+    assert all(job["status"] == SUCCEEDED for job in jobs)
+
+def test_running_jobs_are_recovered_only_once_their_lease_lapses(job_store):
+    """Test a job held by a live process is not claimed again until its lease runs out"""
+    job_id = job_store.create("note", {"n": 1})
+    assert job_store.claim(job_id, "first", lease_seconds=0.05)["status"] == RUNNING
+    assert job_store.claim(job_id, "second", lease_seconds=60) is None
+    assert job_store.unfinished() == []
+
+    time.sleep(0.1)
+    assert [job["id"] for job in job_store.unfinished()] == [job_id]
+    assert job_store.claim(job_id, "second", lease_seconds=60)["owner"] == "second"
+    assert not job_store.renew(job_id, "first", lease_seconds=60)
+    assert not job_store.finish(job_id, "first", SUCCEEDED, result={})
+    assert job_store.finish(job_id, "second", SUCCEEDED, result={"n": 1})
+    assert job_store.get(job_id)["result"] == {"n": 1}
+
+def test_job_database_defaults_to_upload_dir():
+    """Test the job database follows the configured upload directory unless set"""
+    assert Config(upload=UploadConfig(upload_dir="/data/leo")).jobs.db_path == "/data/leo/jobs.sqlite3"
+    assert Config(jobs=JobConfig(db_path="/var/jobs.db")).jobs.db_path == "/var/jobs.db"
@@ -0,0 +1,46 @@
+import pytest
+import json
+from json_stream import IncrementalJSONParser, DELTA, VALUE
+
+SAMPLE = {
+    "subjective": "Patient says \"much better\"\nNo chest pain é",
+    "vitals": ["BP: 120/80", "HR: {72}"],
+    "score": 3.5,
+    "stable": True,
+    "notes": None,
+    "nested": {"a": [1, {"b": "}"}]},
+    "plan": "Continue current treatment"
+}
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 10000])
+def test_parser_handles_any_chunking(chunk_size):
+    """Test the parser rebuilds the object and streams string values regardless of chunk size"""
+    text = "```json\n" + json.dumps(SAMPLE, indent=2) + "\n```"
+    parser = IncrementalJSONParser()
+    deltas = {}
+    values = {}
+    for i in range(0, len(text), chunk_size):
+        for kind, key, value in parser.feed(text[i:i + chunk_size]):
+            if kind == DELTA:
+                deltas[key] = deltas.get(key, "") + value
+            elif kind == VALUE:
+                values[key] = value
+    
+    assert parser.done
+    assert parser.result == SAMPLE
+    assert values == SAMPLE
+    assert deltas == {"subjective": SAMPLE["subjective"], "plan": SAMPLE["plan"]}
+
+def test_parser_decodes_unicode_escapes():
+    """Test \\uXXXX escapes split across chunks"""
+    parser = IncrementalJSONParser()
+    for char in json.dumps({"subjective": "café"}, ensure_ascii=True):
+        parser.feed(char)
+    assert parser.result == {"subjective": "café"}
+
+def test_parser_reports_incomplete_output():
+    """Test a truncated stream is not marked done"""
+    parser = IncrementalJSONParser()
+    events = parser.feed('{"subjective": "Patient rep')
+    assert events == [(DELTA, "subjective", "Patient rep")]
+    assert not parser.done
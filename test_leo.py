@@ -3,6 +3,7 @@ from datetime import datetime
 from leo import Leo, ClinicalInput, ProgressNote
 from config import Config, LLMConfig
 from unittest.mock import Mock, patch
+from streamed_extraction import OpenAIStreamingLLM
 
 @pytest.fixture
 def mock_llm():
@@ -151,4 +152,158 @@ def test_format_note(test_config):
     assert "BP: 120/80" in formatted_note
     assert "HR: 72" in formatted_note
     assert "WBC: 8.5" in formatted_note
-    assert "Follow up in 24 hours" in formatted_note 
\ No newline at end of file
+    assert "Follow up in 24 hours" in formatted_note 
+
+@pytest.mark.asyncio
+async def test_aprocess_input_matches_sync(test_config, mock_llm):
+    """Test async pipeline produces the same note as the sync one"""
+    leo = Leo(test_config, llm=mock_llm)
+    input_data = ClinicalInput(
+        transcribed_audio="Doctor: Patient reports improved breathing.",
+        extracted_text_from_images="BP: 120/80, HR: 72, WBC: 8.5",
+        previous_note="Previous note content",
+        patient_info={"name": "John Doe", "mrn": "12345"}
+    )
+    sync_note = leo.process_input(input_data)
+    async_note = await leo.aprocess_input(input_data)
+    
+    exclude = {"date", "stage_timings"}
+    assert async_note.model_dump(exclude=exclude) == sync_note.model_dump(exclude=exclude)
+    # Template must not leak state between notes
+    assert leo.note_template["action_items"] == []
+
+@pytest.mark.asyncio
+async def test_aprocess_input_does_not_block_event_loop(test_config, mock_llm):
+    """Test slow LLM calls run concurrently off the event loop"""
+    import asyncio
+    import time
+    
+    def slow_conversation(transcript):
+        time.sleep(0.2)
+        return mock_llm.process_clinical_conversation.return_value
+    
+    mock_llm.process_clinical_conversation.side_effect = slow_conversation
+    leo = Leo(test_config, llm=mock_llm)
+    input_data = ClinicalInput(transcribed_audio="Doctor: Patient reports improved breathing.")
+    
+    start = time.perf_counter()
+    ticks = 0
+    
+    async def heartbeat():
+        nonlocal ticks
+        while time.perf_counter() - start < 0.3:
+            ticks += 1
+            await asyncio.sleep(0.01)
+    
+    notes = await asyncio.gather(heartbeat(), *(leo.aprocess_input(input_data) for _ in range(20)))
+    elapsed = time.perf_counter() - start
+    
+    assert all(note.subjective == "Patient reports improved breathing" for note in notes[1:])
+    assert elapsed < 1.0  # 20 serial calls would take 4s
+    assert ticks > 10
+
+def test_process_input_runs_extractions_concurrently(test_config, mock_llm):
+    """Test audio and image extraction overlap and each stage records its timing"""
+    import time
+    
+    def delayed(value):
+        def call(*args):
+            time.sleep(0.2)
+            return value
+        return call
+    
+    mock_llm.process_clinical_conversation.side_effect = delayed(mock_llm.process_clinical_conversation.return_value)
+    mock_llm.process_clinical_image.side_effect = delayed(mock_llm.process_clinical_image.return_value)
+    leo = Leo(test_config, llm=mock_llm)
+    input_data = ClinicalInput(
+        transcribed_audio="Doctor: Patient reports improved breathing.",
+        extracted_text_from_images="BP: 120/80, HR: 72, WBC: 8.5",
+        previous_note="Previous note content"
+    )
+    
+    start = time.perf_counter()
+    note = leo.process_input(input_data)
+    elapsed = time.perf_counter() - start
+    
+    assert elapsed < 0.35  # Serial extraction would take at least 0.4s
+    assert set(note.stage_timings) == {"audio", "image", "compare"}
+    assert note.stage_timings["audio"] >= 0.2
+    # Image results are applied after audio, as in the serial pipeline
+    assert "Whiteboard: Room 302" in note.objective["other_data"]
+    assert note.subjective == "Patient reports improved breathing"
+
+def test_process_input_stage_failure_adds_discrepancy(test_config, mock_llm):
+    """Test a failing stage is reported without cancelling the others"""
+    mock_llm.process_clinical_image.side_effect = RuntimeError("OCR text unreadable")
+    leo = Leo(test_config, llm=mock_llm)
+    input_data = ClinicalInput(
+        transcribed_audio="Doctor: Patient reports improved breathing.",
+        extracted_text_from_images="???",
+        previous_note="Previous note content"
+    )
+    note = leo.process_input(input_data)
+    
+    assert note.discrepancies == ["Error processing image text: OCR text unreadable"]
+    assert note.subjective == "Patient reports improved breathing"
+    assert "Fever resolved" in note.changes_since_last_note
+    # The comparison saw the audio results and the image failure
+    current_note_str = mock_llm.compare_notes.call_args[0][1]
+    assert "Patient reports improved breathing" in current_note_str
+    assert "OCR text unreadable" in current_note_str
+
+@pytest.mark.asyncio
+async def test_astream_input_streams_sections(test_config, mock_llm):
+    """Test streamed narrative deltas and final sections match the generated note"""
+    leo = Leo(test_config, llm=mock_llm)
+    input_data = ClinicalInput(
+        transcribed_audio="Doctor: Patient reports improved breathing.",
+        extracted_text_from_images="BP: 120/80, HR: 72, WBC: 8.5",
+        previous_note="Previous note content"
+    )
+    events = [event async for event in leo.astream_input(input_data)]
+    note = events[-1]["note"]
+    
+    assert events[-1]["event"] == "note"
+    deltas = "".join(e["text"] for e in events if e["event"] == "delta" and e["section"] == "subjective")
+    assert deltas == note.subjective
+    sections = {e["section"]: e["content"] for e in events if e["event"] == "section"}
+    assert sections["objective"] == note.objective
+    assert sections["action_items"] == note.action_items
+    assert sections["changes_since_last_note"] == note.changes_since_last_note
+    # Deltas for a section always come before that section is final
+    order = [(e["event"], e["section"]) for e in events if e["event"] != "note"]
+    assert order.index(("delta", "plan")) < order.index(("section", "plan"))
+
+@pytest.mark.asyncio
+async def test_astream_input_reports_failed_sections_as_missing(test_config, mock_llm):
+    """Test sections whose writers all failed are reported missing instead of sent empty"""
+    mock_llm.process_clinical_image.side_effect = RuntimeError("OCR text unreadable")
+    leo = Leo(test_config, llm=mock_llm)
+    input_data = ClinicalInput(extracted_text_from_images="???")
+
+    events = [event async for event in leo.astream_input(input_data)]
+
+    missing = {e["section"]: e["errors"] for e in events if e["event"] == "missing"}
+    assert missing == {
+        "objective": {"image": "OCR text unreadable"},
+        "action_items": {"image": "OCR text unreadable"}
+    }
+    assert not [e for e in events if e["event"] == "section"]
+    assert events[-1]["note"].discrepancies == ["Error processing image text: OCR text unreadable"]
+
+@pytest.mark.asyncio
+async def test_astream_input_streams_provider_tokens(test_config, mock_llm):
+    """Test the transcript extraction is streamed from the provider's chat completion as tokens arrive"""
+    output = '{"subjective": "Patient reports improved breathing", "assessment": "Improving", "plan": "Continue"}'
+    tokens = [output[i:i + 4] for i in range(0, len(output), 4)]
+    chunks = [{"choices": [{"delta": {"role": "assistant"}}]}] + [{"choices": [{"delta": {"content": token}}]} for token in tokens]
+    leo = Leo(test_config, llm=OpenAIStreamingLLM(mock_llm, LLMConfig()))
+
+    with patch("openai.ChatCompletion.create", return_value=iter(chunks)) as create:
+        events = [event async for event in leo.astream_input(ClinicalInput(transcribed_audio="Doctor: Breathing is better."))]
+
+    assert create.call_args.kwargs["stream"] is True
+    mock_llm.process_clinical_conversation.assert_not_called()
+    deltas = [e["text"] for e in events if e["event"] == "delta" and e["section"] == "subjective"]
+    assert len(deltas) > 1
+    assert "".join(deltas) == events[-1]["note"].subjective == "Patient reports improved breathing"
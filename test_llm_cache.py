@@ -0,0 +1,156 @@
+import pytest
+import threading
+import time
+from config import Config, LLMConfig, UploadConfig
+from leo import Leo, ClinicalInput
+from llm_interface import LLMInterface
+from llm_cache import LLMResponseCache, CachedLLM, bypass_llm_cache
+
+class CountingLLM(LLMInterface):
+    """LLM stub that records how often each method is called"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def process_clinical_conversation(self, transcript):
+        self.calls += 1
+        return {"subjective": transcript, "vitals": ["BP 120/80"]}
+
+    def process_clinical_image(self, image_text):
+        self.calls += 1
+        return {"labs": [image_text]}
+
+    def compare_notes(self, previous_note, current_note):
+        self.calls += 1
+        return {"changes": "None"}
+
+@pytest.fixture
+def cache(tmp_path):
+    """Create an LLM response cache in a temporary database"""
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite3"), memory_entries=2)
+    yield cache
+    cache.close()
+
+def test_repeat_prompt_skips_model(cache):
+    """Test identical prompts, up to whitespace, are served from the cache"""
+    inner = CountingLLM()
+    llm = CachedLLM(inner, LLMConfig(), cache)
+
+    first = llm.process_clinical_conversation("Patient  reports\nchest pain")
+    second = llm.process_clinical_conversation("Patient reports chest pain ")
+
+    assert first == second
+    assert inner.calls == 1
+    assert (cache.memory_hits, cache.misses) == (1, 1)
+
+def test_cached_values_are_copies(cache):
+    """Test mutating a returned response does not change the cached one"""
+    llm = CachedLLM(CountingLLM(), LLMConfig(), cache)
+    llm.process_clinical_conversation("hello")["vitals"].append("HR 80")
+    assert llm.process_clinical_conversation("hello")["vitals"] == ["BP 120/80"]
+
+def test_key_covers_model_and_sampling(cache):
+    """Test a different model or temperature does not reuse a response"""
+    inner = CountingLLM()
+    CachedLLM(inner, LLMConfig(), cache).process_clinical_image("Na 140")
+    CachedLLM(inner, LLMConfig(model="gpt-4o"), cache).process_clinical_image("Na 140")
+    CachedLLM(inner, LLMConfig(temperature=0.0), cache).process_clinical_image("Na 140")
+    assert inner.calls == 3
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Test responses persist in SQLite across cache instances"""
+    path = str(tmp_path / "llm_cache.sqlite3")
+    inner = CountingLLM()
+    first = LLMResponseCache(path)
+    CachedLLM(inner, LLMConfig(), first).compare_notes("old", "new")
+    first.close()
+
+    second = LLMResponseCache(path)
+    assert CachedLLM(inner, LLMConfig(), second).compare_notes("old", "new") == {"changes": "None"}
+    assert inner.calls == 1
+    assert second.disk_hits == 1
+    second.close()
+
+def test_expired_entries_are_not_served(cache):
+    """Test entries older than the TTL count as misses"""
+    cache.put("key", {"a": 1})
+    cache.ttl_seconds = 0.01
+    time.sleep(0.02)
+    assert cache.get("key") is None
+
+def test_size_eviction(tmp_path):
+    """Test least recently used responses are evicted once over max_bytes"""
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite3"), memory_entries=0, max_bytes=30)
+    cache.put("a", {"value": "x" * 10})
+    cache.put("b", {"value": "y" * 10})
+    assert cache.get("a") is None
+    assert cache.get("b") == {"value": "y" * 10}
+    cache.close()
+
+def test_size_is_tracked_and_expired_rows_swept(tmp_path):
+    """Test the disk tier's size is kept across replacements and evictions, and expired rows go at a sweep"""
+    path = str(tmp_path / "llm_cache.sqlite3")
+    cache = LLMResponseCache(path, memory_entries=0, max_bytes=60, sweep_seconds=3600)
+    for key, value in (("a", "x" * 10), ("b", "y" * 10), ("a", "z" * 5), ("c", "w" * 10)):
+        cache.put(key, {"value": value})
+    db = cache._db()
+    assert cache._bytes == db.execute("SELECT SUM(size) FROM llm_cache").fetchone()[0] <= 60
+    assert cache.get("b") is None
+
+    cache.ttl_seconds = 0.01
+    time.sleep(0.02)
+    cache.sweep_seconds = 0
+    cache.put("d", {"value": "v"})
+    assert [row[0] for row in db.execute("SELECT key FROM llm_cache")] == ["d"]
+    assert cache._bytes == len('{"value": "v"}')
+    cache.close()
+
+def test_bypass_refreshes_entry(cache):
+    """Test a bypassed call reaches the model and replaces the cached response"""
+    inner = CountingLLM()
+    llm = CachedLLM(inner, LLMConfig(), cache)
+    llm.process_clinical_conversation("hello")
+    with bypass_llm_cache():
+        llm.process_clinical_conversation("hello")
+    llm.process_clinical_conversation("hello")
+    assert inner.calls == 2
+    assert cache.bypassed == 1
+
+@pytest.mark.asyncio
+async def test_leo_bypass_flag_reaches_stages(tmp_path):
+    """Test ClinicalInput.bypass_cache applies to LLM calls made in executor threads"""
+    inner = CountingLLM()
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite3"))
+    leo = Leo(Config(), llm=CachedLLM(inner, LLMConfig(), cache))
+    input_data = ClinicalInput(transcribed_audio="hello", extracted_text_from_images="Na 140")
+
+    await leo.aprocess_input(input_data)
+    await leo.aprocess_input(input_data)
+    assert inner.calls == 2
+
+    await leo.aprocess_input(input_data.model_copy(update={"bypass_cache": True}))
+    assert inner.calls == 4
+    cache.close()
+
+@pytest.mark.asyncio
+async def test_async_pipeline_reads_and_writes_cache_off_the_event_loop(cache):
+    """Test the async pipeline's cache lookups and stores run in executor threads"""
+    threads = []
+    for name in ("get", "put"):
+        method = getattr(cache, name)
+        def recorded(*args, method=method, **kwargs):
+            threads.append(threading.current_thread())
+            return method(*args, **kwargs)
+        setattr(cache, name, recorded)
+    leo = Leo(Config(), llm=CachedLLM(CountingLLM(), LLMConfig(), cache))
+
+    await leo.aprocess_input(ClinicalInput(transcribed_audio="Patient reports chest pain"))
+    events = [event async for event in leo.astream_input(ClinicalInput(transcribed_audio="Patient reports chest pain"))]
+
+    assert events[-1]["event"] == "note"
+    assert len(threads) >= 3
+    assert threading.main_thread() not in threads
+
+def test_cache_defaults_to_upload_dir():
+    """Test the response cache follows the configured upload directory unless set"""
+    assert Config(upload=UploadConfig(upload_dir="/data/leo")).llm_cache.db_path == "/data/leo/llm_cache.sqlite3"
@@ -0,0 +1,135 @@
+import threading
+import time
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput
+from context_packer import TokenCounter
+import pytest
+from resilience import QueueTimeout, deadline_scope
+from metrics import LLM_QUEUE_WAIT_SECONDS
+from llm_scheduler import LLMScheduler, ScheduledLLM, CallContext, llm_priority, current_call, INTERACTIVE, BATCH, BACKGROUND
+
+def queue_in_order(scheduler, contexts):
+    """Queue one blocked call per context, in order, and return the order they are admitted in"""
+    admitted = []
+    threads = []
+    for i, context in enumerate(contexts):
+        def call(i=i, context=context):
+            scheduler.acquire(1, context)
+            admitted.append(i)
+        threads.append(threading.Thread(target=call))
+        threads[-1].start()
+        while sum(scheduler.queued.values()) < i + 1:
+            time.sleep(0.001)
+    return admitted, threads
+
+def release_all(scheduler, admitted, threads, count):
+    for released in range(1, count + 1):
+        scheduler.release(1)
+        deadline = time.monotonic() + 1
+        while len(admitted) < released and time.monotonic() < deadline:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(1)
+
+def test_higher_priority_goes_first():
+    """Test queued interactive calls are admitted before batch and background ones"""
+    scheduler = LLMScheduler(60_000, 10_000_000, max_in_flight=1)
+    scheduler.acquire(1)
+    admitted, threads = queue_in_order(scheduler, [
+        CallContext(BACKGROUND), CallContext(BATCH), CallContext(INTERACTIVE)
+    ])
+    release_all(scheduler, admitted, threads, 3)
+
+    assert admitted == [2, 1, 0]
+    stats = scheduler.stats()["classes"]
+    assert stats[BACKGROUND]["wait_seconds_max"] >= stats[INTERACTIVE]["wait_seconds_max"]
+    assert {priority: stats[priority]["admitted"] for priority in stats} == {INTERACTIVE: 2, BATCH: 1, BACKGROUND: 1}
+
+def test_queue_waits_are_exported_per_class():
+    """Test each class's queue waits are observed into the queue wait histogram"""
+    before = {priority: LLM_QUEUE_WAIT_SECONDS.count(priority) for priority in (INTERACTIVE, BATCH)}
+    scheduler = LLMScheduler(60_000, 10_000_000, max_in_flight=1)
+    scheduler.acquire(1)
+    admitted, threads = queue_in_order(scheduler, [CallContext(BATCH), CallContext(INTERACTIVE)])
+    release_all(scheduler, admitted, threads, 2)
+
+    assert LLM_QUEUE_WAIT_SECONDS.count(INTERACTIVE) == before[INTERACTIVE] + 2
+    assert LLM_QUEUE_WAIT_SECONDS.count(BATCH) == before[BATCH] + 1
+    assert 'leo_llm_queue_wait_seconds_count{priority="batch"}' in "\n".join(LLM_QUEUE_WAIT_SECONDS.render())
+
+def test_fair_across_users_and_patients():
+    """Test a user or patient with many queued calls does not hold up the others"""
+    scheduler = LLMScheduler(60_000, 10_000_000, max_in_flight=1)
+    scheduler.acquire(1)
+    admitted, threads = queue_in_order(scheduler, [
+        CallContext(mrn="A", user="nurse1"),
+        CallContext(mrn="A", user="nurse1"),
+        CallContext(mrn="B", user="nurse1"),
+        CallContext(mrn="C", user="nurse2"),
+    ])
+    release_all(scheduler, admitted, threads, 4)
+
+    assert admitted == [0, 3, 2, 1]
+
+def test_request_rate_is_limited():
+    """Test calls are spaced out once the burst allowance is used"""
+    scheduler = LLMScheduler(600, 10_000_000, burst_seconds=0.1)  # 10 requests/s, bursts of 1
+    start = time.monotonic()
+    for _ in range(4):
+        scheduler.acquire(1)
+        scheduler.release(1)
+    assert time.monotonic() - start >= 0.25
+
+def test_limits_follow_provider_headers():
+    """Test rate limit headers replace the configured limits and drain the allowance"""
+    scheduler = LLMScheduler(600, 100_000, burst_seconds=1)
+    scheduler.observe({
+        "x-ratelimit-limit-requests": "6000",
+        "x-ratelimit-limit-tokens": "60000",
+        "x-ratelimit-remaining-tokens": "0"
+    })
+    assert scheduler.requests.per_minute == 6000
+    assert scheduler.tokens.per_minute == 60000
+
+    waited = scheduler.acquire(500)
+    assert waited >= 0.4  # 500 tokens at 1000/s from empty
+
+def test_queued_call_gives_up_at_deadline():
+    """Test a call still queued at its deadline leaves the queue without being admitted"""
+    scheduler = LLMScheduler(60_000, 10_000_000, max_in_flight=1)
+    scheduler.acquire(1)
+    with deadline_scope(0.1):
+        with pytest.raises(QueueTimeout):
+            scheduler.acquire(1)
+    assert scheduler.queued[INTERACTIVE] == 0
+    assert scheduler.admitted[INTERACTIVE] == 1
+
+def test_unused_tokens_are_returned():
+    """Test a call reserves max_output_tokens and gives back what the response did not use"""
+    scheduler = LLMScheduler(60_000, 60_000, burst_seconds=60)
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"subjective": "ok"}
+    scheduled = ScheduledLLM(llm, scheduler, TokenCounter(), max_output_tokens=2000)
+
+    scheduled.process_clinical_conversation("Doctor: hello")
+    assert scheduler.tokens.capacity - scheduler.tokens.level < 100
+    assert scheduler.in_flight == 0
+
+def test_leo_schedules_by_patient():
+    """Test Leo's calls carry the request's priority, user and the patient's MRN"""
+    seen = []
+    scheduler = LLMScheduler(60_000, 10_000_000)
+    llm = Mock()
+
+    def extract(transcript):
+        seen.append(current_call())
+        return {"subjective": "ok"}
+    llm.process_clinical_conversation.side_effect = extract
+    leo = Leo(Config(), llm=ScheduledLLM(llm, scheduler, TokenCounter(), 100))
+
+    with llm_priority(BATCH, user="nurse1"):
+        leo.process_input(ClinicalInput(transcribed_audio="...", patient_info={"mrn": "12345"}))
+
+    assert [(c.priority, c.user, c.mrn) for c in seen] == [(BATCH, "nurse1", "12345")]
+    assert scheduler.stats()["classes"][BATCH]["admitted"] == 1
@@ -0,0 +1,97 @@
+import asyncio
+from unittest.mock import Mock
+import pytest
+from config import Config
+from leo import Leo, ClinicalInput
+from metrics import (
+    Registry, Counter, Gauge, Histogram, MeteredLLM, RequestMetricsMiddleware, record_provider_usage,
+    HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, LLM_TOKENS, LLM_CALL_ERRORS, LLM_CALL_SECONDS, STAGE_SECONDS
+)
+
+def test_text_format():
+    """Test metrics render in Prometheus' text exposition format"""
+    registry = Registry()
+    requests = Counter("requests_total", "Requests", ("path",), registry=registry)
+    queued = Gauge("queued", "Queued calls", registry=registry)
+    latency = Histogram("latency_seconds", "Latency", ("path",), buckets=(0.1, 1.0), registry=registry)
+    registry.on_collect(lambda: queued.set(3))
+
+    requests.inc('/notes/"a"')
+    latency.observe(0.05, "/notes")
+    latency.observe(0.1, "/notes")
+    latency.observe(5.0, "/notes")
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{path="/notes/\\"a\\""} 1',
+        "# HELP queued Queued calls",
+        "# TYPE queued gauge",
+        "queued 3",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{path="/notes",le="0.1"} 2',
+        'latency_seconds_bucket{path="/notes",le="1"} 2',
+        'latency_seconds_bucket{path="/notes",le="+Inf"} 3',
+        'latency_seconds_sum{path="/notes"} 5.15',
+        'latency_seconds_count{path="/notes"} 3',
+    ]
+    with pytest.raises(ValueError):
+        Counter("queued", "Duplicate", registry=registry)
+
+def test_metered_llm_counts_tokens_per_model():
+    """Test each call's duration and the tokens its provider response reported are recorded against its model"""
+    response = Mock(headers={"Content-Type": "application/json"})
+    response.content = b'{"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 5, "total_tokens": 17}}'
+    def call(text):
+        # As the provider client's response hook does during the call
+        record_provider_usage(response)
+        return {"other_data": ["Room 302"]}
+    llm = Mock()
+    llm.process_clinical_image.side_effect = call
+    llm.compare_notes.side_effect = ConnectionError("reset")
+    metered = MeteredLLM(llm, "metered-model")
+
+    metered.process_clinical_image("Whiteboard: Room 302")
+    with pytest.raises(ConnectionError):
+        metered.compare_notes("before", "after")
+    record_provider_usage(response)  # Outside a metered call
+
+    assert LLM_TOKENS.value("metered-model", "in") == 12
+    assert LLM_TOKENS.value("metered-model", "out") == 5
+    assert LLM_CALL_SECONDS.count("metered-model", "process_clinical_image") == 1
+    assert LLM_CALL_ERRORS.value("metered-model", "compare_notes") == 1
+
+def test_leo_records_stage_timings():
+    """Test each note adds its stage timings and formatting time to the stage histogram"""
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"subjective": "Feels better"}
+    leo = Leo(Config(), llm=llm)
+    before = {stage: STAGE_SECONDS.count(stage) for stage in ("audio", "format_note")}
+
+    note = leo.process_input(ClinicalInput(transcribed_audio="...", previous_note="Feels worse"))
+    leo.format_note(note)
+
+    # Formatting the working note for the comparison is part of the compare stage, not format_note
+    assert {stage: STAGE_SECONDS.count(stage) - count for stage, count in before.items()} == {"audio": 1, "format_note": 1}
+
+@pytest.mark.asyncio
+async def test_streamed_responses_are_timed_to_their_end():
+    """Test a request stays in flight, and is timed, until its body has finished streaming"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for _ in range(3):
+            await asyncio.sleep(0.05)
+            await send({"type": "http.response.body", "body": b"data", "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    in_flight = []
+    async def send(message):
+        in_flight.append(HTTP_IN_FLIGHT.value())
+    before = HTTP_REQUEST_SECONDS.count("GET", "unmatched", "200")
+
+    await RequestMetricsMiddleware(app)({"type": "http", "method": "GET"}, None, send)
+
+    assert min(in_flight) >= 1
+    assert HTTP_IN_FLIGHT.value() == min(in_flight) - 1
+    assert HTTP_REQUEST_SECONDS.count("GET", "unmatched", "200") == before + 1
+    assert HTTP_REQUEST_SECONDS._values[("GET", "unmatched", "200")][1][0] >= 0.15
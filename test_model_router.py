@@ -0,0 +1,104 @@
+import time
+from unittest.mock import Mock, patch
+from config import Config, ModelRoutingConfig, ModelRoute
+from leo import Leo, ClinicalInput
+from context_packer import TokenCounter
+from llm_cache import LLMResponseCache
+from model_router import LatencyTracker, ModelRouter, RoutedLLM, TimedLLM, recording_routes, EXTRACTION, NARRATIVE
+from resilience import deadline_scope
+
+def routing_config(**routes):
+    return ModelRoutingConfig(min_samples=3, **{
+        kind: ModelRoute(fast_model="fast", **settings) for kind, settings in routes.items()
+    })
+
+def observe(router, model, seconds, times=3):
+    for _ in range(times):
+        router.tracker.observe(model, seconds)
+
+def test_short_inputs_go_to_fast_model():
+    """Test inputs under the route's token threshold use the fast model"""
+    router = ModelRouter(routing_config(extraction={"fast_below_tokens": 100}), "slow")
+    assert router.choose(EXTRACTION, 50) == ("fast", "short input: 50 tokens")
+    assert router.choose(EXTRACTION, 500) == ("slow", "no recent latency")
+
+def test_falls_back_when_p95_exceeds_budget():
+    """Test a model whose recent p95 is over the SLO, or over the time left, is passed over"""
+    router = ModelRouter(routing_config(narrative={"slo_seconds": 10.0}), "slow")
+    observe(router, "slow", 4.0)
+    assert router.choose(NARRATIVE, 500) == ("slow", "p95 4.0s within 10.0s budget")
+
+    with deadline_scope(2.0):
+        model, reason = router.choose(NARRATIVE, 500)
+    assert model == "fast"
+    assert reason.startswith("slow p95 4.0s over")
+
+    observe(router, "fast", 5.0)
+    with deadline_scope(2.0):
+        assert router.choose(NARRATIVE, 500)[0] == "slow"
+    assert router.stats()["chosen"][NARRATIVE] == {"slow": 2, "fast": 1}
+
+def test_routed_llm_records_choice():
+    """Test calls go to the chosen model's LLM and are recorded for the note"""
+    slow, fast = Mock(), Mock()
+    fast.process_clinical_image.return_value = {"other_data": ["Room 302"]}
+    router = ModelRouter(routing_config(extraction={"fast_below_tokens": 100}), "slow")
+    llm = RoutedLLM({"slow": slow, "fast": TimedLLM(fast, "fast", router.tracker)}, router, TokenCounter())
+
+    with recording_routes() as routes:
+        assert llm.process_clinical_image("Whiteboard: Room 302") == {"other_data": ["Room 302"]}
+    assert not slow.process_clinical_image.called
+    assert routes[0]["call"] == EXTRACTION and routes[0]["model"] == "fast"
+    assert router.tracker.stats()["fast"]["calls"] == 1
+
+def test_old_latency_ages_out():
+    """Test a model passed over for slow calls is tried again once they are old"""
+    tracker = LatencyTracker(min_samples=3, max_age_seconds=0.05)
+    router = ModelRouter(routing_config(narrative={"slo_seconds": 1.0}), "slow", tracker)
+    observe(router, "slow", 5.0)
+    assert router.choose(NARRATIVE, 500)[0] == "fast"
+    time.sleep(0.06)
+    assert router.choose(NARRATIVE, 500) == ("slow", "no recent latency")
+    assert tracker.stats()["slow"]["calls"] == 0
+
+def test_cache_keyed_by_routed_model(tmp_path):
+    """Test a response from the fast model is not served for a call routed to the primary"""
+    config = Config()
+    config.llm_cache = config.llm_cache.model_copy(update={"db_path": str(tmp_path / "cache.sqlite3")})
+    config.routing = routing_config(extraction={"fast_below_tokens": 100})
+    leo = Leo(config, llm=Mock())
+    leo.router = ModelRouter(config.routing, "slow")
+    leo.llm_cache = LLMResponseCache(config.llm_cache.db_path)
+    provider = {"slow": Mock(), "fast": Mock()}
+    for model, llm in provider.items():
+        llm.process_clinical_image.return_value = {"other_data": [model]}
+    with patch("leo.OpenAILLM", side_effect=lambda llm_config: provider[llm_config.model]):
+        llm = RoutedLLM({model: leo._provider_llm(model) for model in provider}, leo.router, TokenCounter())
+
+    assert llm.process_clinical_image("Room 302") == {"other_data": ["fast"]}
+    leo.router.route(EXTRACTION).fast_below_tokens = 0
+    assert llm.process_clinical_image("Room 302") == {"other_data": ["slow"]}
+    assert llm.process_clinical_image("Room 302") == {"other_data": ["slow"]}
+    assert provider["slow"].process_clinical_image.call_count == 1
+    # Cache hits are not timed
+    assert leo.router.tracker.stats()["slow"]["calls"] == 1
+
+def test_note_records_routes():
+    """Test each note lists the model each of its calls went to"""
+    def delayed(value):
+        def call(*args):
+            time.sleep(0.01)
+            return value
+        return call
+    slow, fast = Mock(), Mock()
+    slow.process_clinical_conversation.side_effect = delayed({"subjective": "Feels better"})
+    fast.process_clinical_image.side_effect = delayed({"other_data": ["Room 302"]})
+    config = Config()
+    router = ModelRouter(routing_config(extraction={"fast_below_tokens": 100}), "slow")
+    leo = Leo(config, llm=RoutedLLM({"slow": slow, "fast": fast}, router, TokenCounter()))
+
+    note = leo.process_input(ClinicalInput(transcribed_audio="Patient feels better", extracted_text_from_images="Room 302"))
+
+    assert sorted((route["call"], route["model"]) for route in note.llm_routes) == [
+        ("extraction", "fast"), ("narrative", "slow")
+    ]
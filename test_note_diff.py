@@ -0,0 +1,101 @@
+import pytest
+import copy
+from datetime import datetime
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput, ProgressNote
+from note_diff import parse_note, diff_notes
+
+PREVIOUS = ProgressNote(
+    patient_name="John Doe",
+    mrn="12345",
+    date=datetime(2024, 3, 1),
+    subjective="Patient reports shortness of breath",
+    objective={
+        "vitals": ["BP: 140/90", "HR: 72", "SpO2: 91%"],
+        "physical_exam": ["Crackles at bases"],
+        "labs": ["WBC: 12.1", "Cr: 1.0"],
+        "other_data": []
+    },
+    assessment="CHF exacerbation",
+    plan="Continue furosemide. Daily weights.",
+    changes_since_last_note="",
+    action_items=["Review medication: Furosemide 40mg", "Repeat BMP"],
+    discrepancies=[]
+)
+
+def working_note(note: ProgressNote):
+    return {
+        "subjective": note.subjective,
+        "objective": copy.deepcopy(note.objective),
+        "assessment": note.assessment,
+        "plan": note.plan,
+        "changes_since_last_note": "",
+        "action_items": list(note.action_items),
+        "discrepancies": []
+    }
+
+def test_parse_round_trips_format_note():
+    """Test a formatted note parses back into the working-note sections"""
+    parsed = parse_note(Leo(Config(), llm=Mock()).format_note(PREVIOUS))
+    assert parsed["mrn"] == "12345"
+    assert parsed["date"] == "2024-03-01"
+    assert parsed["subjective"] == PREVIOUS.subjective
+    assert parsed["objective"] == PREVIOUS.objective
+    assert parsed["plan"] == PREVIOUS.plan
+    assert parsed["action_items"] == PREVIOUS.action_items
+    assert parse_note("Previous note content") is None
+
+def test_diff_classifies_changes():
+    """Test readings, action items and plan are diffed without a model"""
+    previous = Leo(Config(), llm=Mock()).format_note(PREVIOUS)
+    current = working_note(PREVIOUS)
+    current["objective"]["vitals"] = ["BP: 138/88", "HR: 110", "SpO2: 91%", "Temp: 101.2°F"]
+    current["action_items"] = ["Review medication: Furosemide 40mg", "Start antibiotics"]
+    current["plan"] = "Continue furosemide. Start ceftriaxone."
+
+    diff = diff_notes(previous, current)
+
+    assert diff.new_findings == ["Temp: 101.2°F", "New action item: Start antibiotics"]
+    assert diff.resolved_issues == ["Repeat BMP"]
+    assert diff.trends == ["BP 140/90 → 138/88"]
+    assert diff.significant_changes == ["HR 72 → 110", "Plan added: Start ceftriaxone.", "Plan removed: Daily weights."]
+    assert diff.changed_narrative == []
+
+def test_stable_patient_skips_llm_comparison():
+    """Test unchanged narrative sections need no compare_notes call"""
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {
+        "subjective": "Patient reports  shortness of breath",
+        "vitals": ["BP: 140/90", "HR: 74"],
+        "assessment": "CHF exacerbation",
+        "plan": "Continue furosemide. Daily weights.",
+        "medications": ["Furosemide 40mg"]
+    }
+    leo = Leo(Config(), llm=llm)
+
+    note = leo.process_input(ClinicalInput(transcribed_audio="...", previous_note=leo.format_note(PREVIOUS)))
+
+    llm.compare_notes.assert_not_called()
+    assert note.changes_since_last_note == "Resolved issues: Repeat BMP\nTrends: HR 72 → 74"
+
+@pytest.mark.asyncio
+async def test_changed_narrative_is_sent_alone():
+    """Test only the changed narrative sections go to the model, merged after local findings"""
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {
+        "subjective": "Breathing much better",
+        "vitals": ["HR: 72"],
+        "assessment": "CHF exacerbation",
+        "plan": "Continue furosemide. Daily weights.",
+        "medications": ["Furosemide 40mg"]
+    }
+    llm.compare_notes.return_value = {"new_findings": ["Dyspnea improved"]}
+    leo = Leo(Config(), llm=llm)
+
+    note = await leo.aprocess_input(ClinicalInput(transcribed_audio="...", previous_note=leo.format_note(PREVIOUS)))
+
+    previous_sent, current_sent = llm.compare_notes.call_args[0]
+    assert previous_sent == "**Subjective:**\nPatient reports shortness of breath"
+    assert current_sent == "**Subjective:**\nBreathing much better"
+    assert note.changes_since_last_note == "New findings: Dyspnea improved\nResolved issues: Repeat BMP"
@@ -0,0 +1,98 @@
+import pytest
+import threading
+from datetime import datetime
+from unittest.mock import Mock
+from config import Config, UploadConfig
+from leo import Leo, ClinicalInput
+from note_store import NoteStore
+
+@pytest.fixture
+def store(tmp_path):
+    """Create a note store in a temporary database"""
+    store = NoteStore(str(tmp_path / "notes.sqlite3"))
+    yield store
+    store.close()
+
+def test_latest_and_history(store, tmp_path):
+    """Test the latest note is by date and history filters to a stay"""
+    for day in (3, 1, 2):
+        store.save("12345", datetime(2024, 3, day), {"plan": f"day {day}"})
+    store.save("99999", datetime(2024, 3, 5), {"plan": "other patient"})
+
+    assert store.latest("12345") == {"plan": "day 3"}
+    assert store.latest("00000") is None
+    assert [n["plan"] for n in store.history("12345")] == ["day 1", "day 2", "day 3"]
+    assert [n["plan"] for n in store.history("12345", start=datetime(2024, 3, 2))] == ["day 2", "day 3"]
+    assert [n["plan"] for n in store.history("12345", end=datetime(2024, 3, 1, 23))] == ["day 1"]
+
+    reopened = NoteStore(str(tmp_path / "notes.sqlite3"))
+    assert reopened.latest("12345") == {"plan": "day 3"}
+    reopened.close()
+
+def test_latest_is_a_copy(store):
+    """Test callers cannot change the cached latest note"""
+    store.latest("12345")
+    store.save("12345", datetime(2024, 3, 1), {"action_items": ["Repeat BMP"]})
+    store.latest("12345")["action_items"].append("Extra")
+    assert store.latest("12345") == {"action_items": ["Repeat BMP"]}
+
+def test_leo_compares_with_stored_note(store):
+    """Test a note for a known MRN is compared with the last stored note, without previous_note"""
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {
+        "subjective": "Feels better",
+        "vitals": ["HR: 72"],
+        "assessment": "Improving",
+        "plan": "Continue"
+    }
+    leo = Leo(Config(), llm=llm, note_store=store)
+    input_data = ClinicalInput(transcribed_audio="...", patient_info={"mrn": "12345"})
+
+    first = leo.process_input(input_data)
+    assert "compare" not in first.stage_timings
+
+    llm.process_clinical_conversation.return_value = {**llm.process_clinical_conversation.return_value, "vitals": ["HR: 110"]}
+    second = leo.process_input(input_data)
+
+    llm.compare_notes.assert_not_called()
+    assert "Significant changes: HR 72 → 110" in second.changes_since_last_note
+    assert len(store.history("12345")) == 2
+
+def test_partial_notes_are_not_compared_against(store):
+    """Test a note missing a stage is kept in the history but not used as the previous note"""
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"subjective": "Feels better", "vitals": ["HR: 72"]}
+    leo = Leo(Config(), llm=llm, note_store=store)
+    input_data = ClinicalInput(transcribed_audio="...", patient_info={"mrn": "12345"})
+    leo.process_input(input_data)
+
+    llm.process_clinical_conversation.side_effect = ConnectionError("reset")
+    leo.process_input(input_data)
+
+    assert len(store.history("12345")) == 2
+    assert store.latest("12345")["subjective"] == "Feels better"
+
+@pytest.mark.asyncio
+async def test_async_note_store_access_is_off_the_event_loop(store):
+    """Test the async pipeline reads and saves notes in executor threads"""
+    threads = []
+    for name in ("latest", "save"):
+        method = getattr(store, name)
+        def recorded(*args, method=method, **kwargs):
+            threads.append(threading.current_thread())
+            return method(*args, **kwargs)
+        setattr(store, name, recorded)
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"subjective": "Feels better"}
+    leo = Leo(Config(), llm=llm, note_store=store)
+
+    await leo.aprocess_input(ClinicalInput(transcribed_audio="...", patient_info={"mrn": "12345"}))
+    events = [event async for event in leo.astream_input(ClinicalInput(transcribed_audio="...", patient_info={"mrn": "12345"}))]
+
+    assert events[-1]["event"] == "note"
+    assert len(threads) == 4
+    assert threading.main_thread() not in threads
+
+def test_note_database_defaults_to_upload_dir():
+    """Test the note database follows the configured upload directory unless set"""
+    assert Config(upload=UploadConfig(upload_dir="/data/leo")).note_store.db_path == "/data/leo/notes.sqlite3"
@@ -0,0 +1,82 @@
+import asyncio
+import time
+import pytest
+from async_llm import run_in_executor
+from config import Config, UploadConfig
+from profiler import SamplingProfiler, ProfilingMiddleware, bind
+
+def blocking_provider_call():
+    time.sleep(0.1)
+
+async def handler():
+    await asyncio.sleep(0.05)
+    await run_in_executor(None, blocking_provider_call)
+
+def test_bind_is_free_when_not_profiling():
+    """Test calls handed to executors are not wrapped unless a request is being profiled"""
+    assert bind(blocking_provider_call) is blocking_provider_call
+
+@pytest.mark.asyncio
+async def test_profiles_tasks_and_executor_threads(tmp_path):
+    """Test a profile samples where the request's tasks wait and what its executor threads run"""
+    profiler = SamplingProfiler(str(tmp_path), interval_seconds=0.005)
+    loop = asyncio.get_running_loop()
+
+    with profiler.profile("req-1"):
+        await asyncio.ensure_future(handler())
+
+    assert loop.get_task_factory() is None
+    folded = open(profiler.path("req-1")).read().splitlines()
+    stacks = {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in folded}
+    assert any(stack.startswith("handler (test_profiler.py") and "sleep (tasks.py" in stack for stack in stacks)
+    assert any(stack.endswith(";blocking_provider_call (test_profiler.py:9)") for stack in stacks)
+    assert sum(stacks.values()) >= 10
+
+def test_profile_ids_are_file_names(tmp_path):
+    """Test request IDs that are not plain names are neither used nor looked up"""
+    profiler = SamplingProfiler(str(tmp_path), max_profiles=1)
+    with pytest.raises(ValueError):
+        with profiler.profile("../notes"):
+            pass
+    assert profiler.path("../notes") is None
+
+    for request_id in ("first", "second"):
+        with profiler.profile(request_id):
+            blocking_provider_call()
+        time.sleep(0.01)
+    assert profiler.path("first") is None
+    assert "blocking_provider_call" in open(profiler.path("second")).read()
+
+async def streaming_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    for _ in range(3):
+        await run_in_executor(None, blocking_provider_call)
+        await send({"type": "http.response.body", "body": b"chunk", "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+@pytest.mark.asyncio
+async def test_middleware_profiles_streamed_bodies_under_unique_names(tmp_path):
+    """Test a streamed response is profiled to its end, and reused request IDs get profiles of their own"""
+    profiler = SamplingProfiler(str(tmp_path), interval_seconds=0.005)
+    middleware = ProfilingMiddleware(streaming_app, profiler)
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"x-profile", b"1"), (b"x-request-id", b"abc")]}
+
+    urls = []
+    for _ in range(2):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+        await middleware(scope, None, send)
+        headers = dict(sent[0]["headers"])
+        assert headers[b"x-request-id"] == b"abc"
+        urls.append(headers[b"x-profile-url"].decode())
+
+    assert urls[0] != urls[1] and all(url.startswith("/profiles/abc-") for url in urls)
+    folded = open(profiler.path(urls[0].rsplit("/", 1)[1])).read()
+    samples = sum(int(line.rsplit(" ", 1)[1]) for line in folded.splitlines() if "blocking_provider_call" in line)
+    assert samples >= 20
+
+def test_profiles_default_to_upload_dir():
+    """Test stored profiles follow the configured upload directory unless set"""
+    assert Config(upload=UploadConfig(upload_dir="/data/leo")).profiling.profile_dir == "/data/leo/profiles"
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from config import ProviderConfig
+from provider_client import ProviderClient, retry_delay
+from resilience import deadline_scope
+
+class StubProvider(BaseHTTPRequestHandler):
+    """Chat completions stub that rate limits the first `failures` requests and answers after `delay` seconds"""
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    failures = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.connections.add(self.client_address)
+        time.sleep(self.server.delay)
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            body, status = b'{"error": {"message": "Rate limited"}}', 429
+        else:
+            body, status = json.dumps({
+                "id": "stub", "object": "chat.completion", "model": "gpt-4",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}]
+            }).encode(), 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubProvider)
+    server.failures = 0
+    server.delay = 0
+    server.connections = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(stub_server):
+    client = ProviderClient(ProviderConfig(
+        base_url=f"http://127.0.0.1:{stub_server.server_address[1]}/v1",
+        retry_base_delay=0.01
+    ))
+    yield client
+    client.close()
+
+def test_retry_delay_is_jittered_and_capped():
+    """Test backoff grows with the attempt, is randomised, and honours Retry-After"""
+    delays = {retry_delay(3, 0.5, 8.0) for _ in range(20)}
+    assert len(delays) > 1
+    assert all(0 <= delay <= 4.0 for delay in delays)
+    assert retry_delay(10, 0.5, 8.0) <= 8.0
+    assert retry_delay(0, 0.5, 8.0, retry_after="2") == 2.0
+
+def test_reuses_connections(client, stub_server):
+    """Test sequential calls share one keep-alive connection"""
+    for _ in range(5):
+        assert client.session.post(client.config.base_url + "/chat/completions", json={}).status_code == 200
+
+    stats = client.stats()
+    assert stats["requests"] == 5
+    assert stats["connections_opened"] == 1
+    assert stats["connections_idle"] == 1
+    assert stats["in_flight"] == 0
+    assert len(stub_server.connections) == 1
+
+def test_retries_rate_limits(client, stub_server):
+    """Test 429 responses are retried until one succeeds, or returned after max_retries"""
+    stub_server.failures = 2
+    assert client.session.post(client.config.base_url + "/chat/completions", json={}).status_code == 200
+    assert client.stats()["retries"] == 2
+
+    stub_server.failures = 10
+    assert client.session.post(client.config.base_url + "/chat/completions", json={}).status_code == 429
+    assert client.stats()["failures"] == 1
+
+def test_deadline_caps_provider_calls(client, stub_server):
+    """Test a slow provider is given up on at the request's deadline, whatever timeout the caller set"""
+    stub_server.delay = 1.0
+    start = time.perf_counter()
+    with deadline_scope(0.2):
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            client.session.post(client.config.base_url + "/chat/completions", json={}, timeout=600)
+    assert time.perf_counter() - start < 0.5
+
+def test_openai_calls_go_through_pool(client, stub_server):
+    """Test an installed client carries openai's calls to the configured base URL"""
+    import openai
+    saved = (openai.requestssession, openai.api_base)
+    try:
+        client.install()
+        stub_server.failures = 1
+        response = openai.ChatCompletion.create(
+            model="gpt-4", api_key="test", messages=[{"role": "user", "content": "hi"}]
+        )
+    finally:
+        openai.requestssession, openai.api_base = saved
+
+    assert response["choices"][0]["message"]["content"] == "ok"
+    assert client.stats()["retries"] == 1
@@ -0,0 +1,148 @@
+import asyncio
+import io
+import time
+import pytest
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput
+from stage_graph import StageGraph
+from transcription import Transcriber, GuardedTranscriber
+from resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, GuardedLLM, QueueTimeout,
+    deadline_scope, remaining_time, CLOSED, OPEN
+)
+
+def slow(seconds, value):
+    def call(*args):
+        time.sleep(seconds)
+        return value
+    return call
+
+def test_nested_deadline_keeps_the_sooner():
+    """Test a stage budget cannot extend the request's deadline"""
+    assert remaining_time() is None
+    with deadline_scope(1.0):
+        with deadline_scope(10.0):
+            assert remaining_time() <= 1.0
+        with deadline_scope(0.1):
+            assert remaining_time() <= 0.1
+    assert remaining_time() is None
+
+def test_circuit_opens_and_recovers():
+    """Test repeated failures open the circuit, which lets one trial through after the reset time"""
+    breaker = CircuitBreaker("openai/gpt-4", failure_threshold=2, reset_seconds=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()  # Trial call
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+def test_guarded_llm_fails_fast_and_ignores_queue_timeouts():
+    """Test an open circuit skips the provider, and calls that never left the queue are not failures"""
+    llm = Mock()
+    llm.process_clinical_image.side_effect = QueueTimeout("queued too long")
+    breaker = CircuitBreaker("openai/gpt-4", failure_threshold=1)
+    guarded = GuardedLLM(llm, breaker)
+
+    with pytest.raises(QueueTimeout):
+        guarded.process_clinical_image("...")
+    assert breaker.state == CLOSED
+
+    llm.process_clinical_image.side_effect = ConnectionError("reset")
+    with pytest.raises(ConnectionError):
+        guarded.process_clinical_image("...")
+    with pytest.raises(CircuitOpenError):
+        guarded.process_clinical_image("...")
+    assert llm.process_clinical_image.call_count == 2
+
+def test_stage_graph_timeout():
+    """Test stages still running at the timeout are recorded as timed out"""
+    graph = StageGraph()
+    graph.add("fast", lambda deps: "done")
+    graph.add("slow", lambda deps: time.sleep(1))
+    start = time.perf_counter()
+    results = graph.run(timeout=0.1)
+
+    assert time.perf_counter() - start < 0.5
+    assert results["fast"].value == "done"
+    assert isinstance(results["slow"].error, TimeoutError)
+
+@pytest.fixture
+def slow_image_llm():
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"subjective": "Feels better", "plan": "Continue"}
+    llm.process_clinical_image.side_effect = slow(1.0, {"other_data": ["Room 302"]})
+    return llm
+
+@pytest.mark.asyncio
+async def test_async_stage_budget_returns_partial_note(slow_image_llm):
+    """Test a stage over its budget is dropped and the note lists what is missing"""
+    config = Config()
+    config.deadlines.extraction_seconds = 0.1
+    leo = Leo(config, llm=slow_image_llm)
+
+    start = time.perf_counter()
+    note = await leo.aprocess_input(ClinicalInput(transcribed_audio="...", extracted_text_from_images="..."))
+
+    assert time.perf_counter() - start < 0.5
+    assert note.subjective == "Feels better"
+    assert note.discrepancies == [
+        "Error processing image text: The image stage ran out of time (missing: vitals, labs, other data)"
+    ]
+
+def test_request_deadline_bounds_process_input(slow_image_llm):
+    """Test the synchronous pipeline returns at the request deadline"""
+    config = Config()
+    config.deadlines.request_seconds = 0.2
+    leo = Leo(config, llm=slow_image_llm)
+
+    start = time.perf_counter()
+    note = leo.process_input(ClinicalInput(transcribed_audio="...", extracted_text_from_images="..."))
+
+    assert time.perf_counter() - start < 0.6
+    assert note.plan == "Continue"
+    assert note.discrepancies[0].startswith("Error processing image text: Stage image timed out")
+    assert note.discrepancies[0].endswith("(missing: vitals, labs, other data)")
+
+class SlowTranscriber(Transcriber):
+    async def transcribe(self, audio_file, audio_sha256=None):
+        await asyncio.sleep(1)
+        return "late"
+
+@pytest.mark.asyncio
+async def test_transcription_deadline():
+    """Test transcription gives up at the deadline without counting it against the provider"""
+    breaker = CircuitBreaker("openai/whisper-1", failure_threshold=1)
+    transcriber = GuardedTranscriber(SlowTranscriber(), breaker)
+    with deadline_scope(0.1):
+        with pytest.raises(DeadlineExceeded):
+            await transcriber.transcribe(io.BytesIO(b"audio"))
+    assert breaker.state == CLOSED
+
+def test_guarded_llm_ignores_deadline_expiry():
+    """Test a call cut off by the caller's deadline is not a provider failure, and a provider timeout is"""
+    def cut_off(text):
+        # As the HTTP client does when the deadline passes mid-call
+        time.sleep(0.1)
+        raise TimeoutError("read timeout")
+    llm = Mock()
+    llm.process_clinical_image.side_effect = cut_off
+    breaker = CircuitBreaker("openai/gpt-4", failure_threshold=1)
+    guarded = GuardedLLM(llm, breaker)
+    with deadline_scope(0.05):
+        with pytest.raises(DeadlineExceeded):
+            guarded.process_clinical_image("...")
+    assert breaker.state == CLOSED
+
+    llm.process_clinical_image.side_effect = TimeoutError("read timeout")
+    with pytest.raises(TimeoutError):
+        guarded.process_clinical_image("...")
+    assert breaker.state == OPEN
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight, canonical_key
+from resilience import DeadlineExceeded, deadline_scope
+
+def test_canonical_key_ignores_key_order():
+    """Test equal requests hash alike however their JSON was written"""
+    assert canonical_key({"a": 1, "b": {"c": 2, "d": 3}}) == canonical_key({"b": {"d": 3, "c": 2}, "a": 1})
+    assert canonical_key({"a": 1}) != canonical_key({"a": 2})
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_call():
+    """Test calls made while one with the same key is in flight get its result without running again"""
+    flights = SingleFlight("note")
+    runs = []
+
+    async def generate(value):
+        runs.append(value)
+        await asyncio.sleep(0.05)
+        return {"note": value}
+
+    results = await asyncio.gather(
+        flights.do("a", lambda: generate("first")),
+        flights.do("a", lambda: generate("second")),
+        flights.do("b", lambda: generate("other"))
+    )
+
+    assert results == [{"note": "first"}, {"note": "first"}, {"note": "other"}]
+    assert runs == ["first", "other"]
+    assert flights.stats() == {"in_flight": 0, "started": 2, "coalesced": 1}
+
+    # Finished calls are not reused
+    assert await flights.do("a", lambda: generate("third")) == {"note": "third"}
+
+@pytest.mark.asyncio
+async def test_failures_are_shared_and_waiters_keep_their_deadline():
+    """Test every waiter gets the shared call's exception, and stops waiting at its own deadline"""
+    flights = SingleFlight("transcription")
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("bad audio")
+
+    results = await asyncio.gather(flights.do("a", fail), flights.do("a", fail), return_exceptions=True)
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+    async def slow():
+        await asyncio.sleep(0.2)
+        return "transcript"
+
+    async def impatient():
+        with deadline_scope(0.05):
+            return await flights.do("b", slow)
+
+    first = asyncio.ensure_future(flights.do("b", slow))
+    await asyncio.sleep(0)
+    with pytest.raises(DeadlineExceeded):
+        await impatient()
+    assert await first == "transcript"
@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput
+from structured_extraction import extract_structured, canonical_name
+
+def test_extracts_vitals_and_labs_with_units():
+    """Test common spellings are read into canonical names and units"""
+    result = extract_structured(
+        "Temp 101.2F, pulse 110, resp rate 22, O2 sat 91% on RA, blood pressure of 150 / 95. "
+        "CBC: WBC 11.2 k/ul, Hgb 9.8 g/dl, Plt 250"
+    )
+    assert result.vitals == ["Temp: 101.2°F", "HR: 110", "RR: 22", "SpO2: 91%", "BP: 150/95"]
+    assert result.labs == ["WBC: 11.2 K/uL", "Hgb: 9.8 g/dL", "Plt: 250"]
+
+def test_ignores_doses_and_lowercase_abbreviations():
+    """Test medication doses and ambiguous lowercase words are not read as labs"""
+    result = extract_structured("Give vitamin K 10mg and 2 mg of lorazepam, k 4.1, then recheck K 3.9")
+    assert result.labs == ["K: 3.9"]
+    assert not result.is_structured
+
+def test_potassium_doses_are_not_lab_values():
+    """Test replacement doses in mEq or mmol, or beyond any plausible level, are not read as potassium"""
+    for text in ("Gave K 20 mEq", "potassium 20 mEq replacement", "KCl given, K 40 mmol over 4h", "Gave K 20"):
+        assert extract_structured(text).labs == [], text
+    assert extract_structured("K 5.8 mEq/L, Na 128 mmol/L").labs == ["K: 5.8 mEq/L", "Na: 128 mmol/L"]
+
+def test_ignores_ordinary_words_and_ranges():
+    """Test aliases that are also words need a unit or separator, and ranges are not readings"""
+    result = extract_structured("She sat 90 minutes in the chair, bun 2 at lunch. HR 80s-90s, RR 16-20, sats 94%, BUN: 18, ALT 40")
+    assert result.vitals == ["SpO2: 94%"]
+    assert result.labs == ["BUN: 18", "ALT: 40"]
+
+def test_structured_detection():
+    """Test only text made of readings counts as structured"""
+    assert extract_structured("BMP\nNa 134 mEq/L\nK 5.6\nCr 1.4 mg/dL\nGlucose 210").is_structured
+    assert not extract_structured("Patient reports chest pain since yesterday. BP 120/80").is_structured
+    assert not extract_structured("No readings here").is_structured
+
+def test_merge_fills_only_missing_readings():
+    """Test rule readings fill measurements the model left out or empty, and never replace its own"""
+    rules = extract_structured("BP 118/76, HR 72, RR 18")
+    merged = rules.merge_into({"vitals": ["Blood pressure: 120/80", "HR:", "Pain: 3/10"], "plan": "Continue"})
+    assert merged["vitals"] == ["Blood pressure: 120/80", "HR: 72", "Pain: 3/10", "RR: 18"]
+    assert merged["plan"] == "Continue"
+    assert canonical_name("Blood  Pressure") == "BP"
+
+def test_structured_input_skips_llm():
+    """Test an OCR'd lab sheet is extracted without an LLM call when the mode is on"""
+    config = Config()
+    config.clinical_note.skip_llm_for_structured_input = True
+    llm = Mock()
+    leo = Leo(config, llm=llm)
+
+    note = leo.process_input(ClinicalInput(extracted_text_from_images="Na 140 K 4.1 WBC 8.5"))
+
+    llm.process_clinical_image.assert_not_called()
+    assert note.objective["labs"] == ["Na: 140", "K: 4.1", "WBC: 8.5"]
+    assert note.discrepancies == []
+
+@pytest.mark.asyncio
+async def test_narrative_input_still_calls_llm():
+    """Test free text still goes to the model, with rule readings filling in what it missed"""
+    config = Config()
+    config.clinical_note.skip_llm_for_structured_input = True
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"subjective": "Feels better", "vitals": ["HR: 70"]}
+    leo = Leo(config, llm=llm)
+
+    note = await leo.aprocess_input(ClinicalInput(transcribed_audio="Patient reports feeling better today, HR 72, BP 118/76"))
+
+    llm.process_clinical_conversation.assert_called_once()
+    assert note.subjective == "Feels better"
+    assert note.objective["vitals"] == ["HR: 70", "BP: 118/76"]
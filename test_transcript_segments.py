@@ -0,0 +1,87 @@
+import time
+import pytest
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput
+from transcript_segments import split_transcript, merge_extractions
+
+def words(text):
+    return len(text.split())
+
+def transcript(turns: int) -> str:
+    return "\n".join(f"Nurse: patient resting comfortably, turn number {i}" for i in range(turns))
+
+def test_split_on_turns_within_budget():
+    """Test segments end on speaker turns, stay within budget and keep every turn in order"""
+    text = transcript(30)
+    segments = split_transcript(text, 40, words)
+
+    assert len(segments) > 1
+    assert all(words(segment) <= 40 for segment in segments)
+    assert "\n".join(segments) == text
+
+def test_split_prefers_timestamps():
+    """Test a half full segment is ended at a timestamped turn"""
+    text = "\n".join([
+        "Doctor: how are you feeling today",
+        "Patient: a bit better than yesterday",
+        "[00:05:10] Nurse: next patient is in bed four",
+        "Doctor: thanks"
+    ])
+    segments = split_transcript(text, 20, words)
+    assert segments[1].startswith("[00:05:10] Nurse:")
+
+def test_split_long_turn_by_sentences():
+    """Test a turn longer than the budget is split between sentences"""
+    text = "Doctor: " + " ".join(f"Sentence number {i} here." for i in range(20))
+    segments = split_transcript(text, 20, words)
+    assert len(segments) > 1
+    assert all(words(segment) <= 20 for segment in segments)
+
+def test_merge_dedupes_readings_and_medications():
+    """Test merged results keep the latest reading per vital and list each medication once"""
+    merged = merge_extractions([
+        {"subjective": "Chest pain overnight.", "vitals": ["HR: 110", "BP: 150/90"], "medications": ["Lisinopril 10mg"]},
+        {"subjective": "Pain settled.", "vitals": ["Heart rate: 88"], "medications": ["lisinopril 10 mg", "Aspirin 81mg"]},
+    ])
+    assert merged["subjective"] == "Chest pain overnight. Pain settled."
+    assert merged["vitals"] == ["Heart rate: 88", "BP: 150/90"]
+    assert merged["medications"] == ["Lisinopril 10mg", "Aspirin 81mg"]
+
+def test_leo_extracts_segments_concurrently():
+    """Test a transcript over max_note_length is extracted per segment, concurrently, and merged"""
+    config = Config()
+    config.clinical_note.max_note_length = 200
+    config.clinical_note.map_reduce_segment_tokens = 100
+    llm = Mock()
+
+    def extract(text):
+        time.sleep(0.2)
+        return {"subjective": text.splitlines()[0], "vitals": ["HR: 80"]}
+    llm.process_clinical_conversation.side_effect = extract
+    leo = Leo(config, llm=llm)
+
+    start = time.perf_counter()
+    note = leo.process_input(ClinicalInput(transcribed_audio=transcript(200)))
+    elapsed = time.perf_counter() - start
+
+    calls = llm.process_clinical_conversation.call_count
+    assert calls > 3
+    assert elapsed < 0.2 * calls / 2
+    assert note.subjective.startswith("Nurse: patient resting comfortably, turn number 0")
+    assert note.objective["vitals"] == ["HR: 80"]
+    assert note.token_usage["tokens_trimmed"] == 0
+
+@pytest.mark.asyncio
+async def test_async_leo_extracts_segments():
+    """Test the async path splits and merges the same way"""
+    config = Config()
+    config.clinical_note.max_note_length = 200
+    config.clinical_note.map_reduce_segment_tokens = 100
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"medications": ["Aspirin 81mg"]}
+    leo = Leo(config, llm=llm)
+
+    note = await leo.aprocess_input(ClinicalInput(transcribed_audio=transcript(200)))
+    assert llm.process_clinical_conversation.call_count > 1
+    assert note.action_items == ["Review medication: Aspirin 81mg"]
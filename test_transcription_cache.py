@@ -0,0 +1,78 @@
+import pytest
+import io
+import hashlib
+import threading
+from config import Config, UploadConfig
+from transcription import Transcriber
+from transcription_cache import TranscriptionCache, CachedTranscriber
+
+class CountingTranscriber(Transcriber):
+    """Transcriber stub that records how often it is called"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def transcribe(self, audio_file, audio_sha256=None):
+        self.calls += 1
+        return f"transcript of {len(audio_file.read())} bytes"
+
+@pytest.fixture
+def cache(tmp_path):
+    """Create a transcription cache in a temporary database"""
+    cache = TranscriptionCache(str(tmp_path / "transcripts.sqlite3"), max_bytes=100)
+    yield cache
+    cache.close()
+
+@pytest.mark.asyncio
+async def test_repeat_audio_skips_transcription(cache):
+    """Test a second upload of the same audio is served from the cache"""
+    inner = CountingTranscriber()
+    transcriber = CachedTranscriber(inner, cache, model="whisper-1")
+    audio = b"\x00\x01" * 500
+    
+    first = await transcriber.transcribe(io.BytesIO(audio))
+    second = await transcriber.transcribe(io.BytesIO(audio), hashlib.sha256(audio).hexdigest())
+    
+    assert first == second == "transcript of 1000 bytes"
+    assert inner.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_cache_is_keyed_by_model(cache):
+    """Test transcripts from one model are not returned for another"""
+    cache.put("abc", "whisper-1", "hello")
+    assert cache.get("abc", "whisper-1") == "hello"
+    assert cache.get("abc", "whisper-2") is None
+
+def test_cache_evicts_least_recently_used(cache):
+    """Test the cache stays within max_bytes by dropping the least recently used entries"""
+    cache.put("a", "whisper-1", "x" * 40)
+    cache.put("b", "whisper-1", "y" * 40)
+    cache.get("a", "whisper-1")  # "b" is now least recently used
+    cache.put("c", "whisper-1", "z" * 40)
+    
+    assert cache.total_bytes <= 100
+    assert cache.get("b", "whisper-1") is None
+    assert cache.get("a", "whisper-1") == "x" * 40
+    assert cache.get("c", "whisper-1") == "z" * 40
+
+@pytest.mark.asyncio
+async def test_cache_access_is_off_the_event_loop(cache):
+    """Test hashing and the cache's reads and writes run in executor threads"""
+    threads = []
+    for name in ("get", "put"):
+        method = getattr(cache, name)
+        def recorded(*args, method=method, **kwargs):
+            threads.append(threading.current_thread())
+            return method(*args, **kwargs)
+        setattr(cache, name, recorded)
+    transcriber = CachedTranscriber(CountingTranscriber(), cache, model="whisper-1")
+
+    await transcriber.transcribe(io.BytesIO(b"\x00" * 10))
+    await transcriber.transcribe(io.BytesIO(b"\x00" * 10))
+
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+
+def test_cache_defaults_to_upload_dir():
+    """Test the transcript cache follows the configured upload directory unless set"""
+    assert Config(upload=UploadConfig(upload_dir="/data/leo")).transcription.cache_path == "/data/leo/transcripts.sqlite3"
@@ -0,0 +1,93 @@
+import numpy as np
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+from config import Config
+from leo import Leo, ClinicalInput, ProgressNote
+from note_store import NoteStore
+from trends import parse_readings, WardSeries, TrendStats, analyze
+
+def notes(readings, start=datetime(2024, 3, 1)):
+    """One note per day with the given vitals"""
+    return [
+        {"date": start + timedelta(days=day), "objective": {"vitals": vitals, "labs": []}}
+        for day, vitals in enumerate(readings)
+    ]
+
+def test_parse_readings():
+    """Test BP splits into systolic and diastolic, and Celsius is converted"""
+    assert parse_readings(["BP: 120/80", "Temp: 38.0°C", "Pain: 3", "HR: n/a"]) == [
+        ("SBP", 120.0), ("DBP", 80.0), ("Temp", 100.4)
+    ]
+
+def test_parse_readings_converts_units_or_leaves_readings_out():
+    """Test readings in other units are converted to one unit per measurement, or left out"""
+    readings = parse_readings([
+        "Glucose: 7.0 mmol/L", "Glucose: 126 mg/dL", "Cr: 88.42 µmol/L", "Hgb: 120 g/L",
+        "Temp: 38.0 C", "A1c: 48 mmol/mol", "HR: 80 regular"
+    ])
+    names = [name for name, _ in readings]
+    values = [value for _, value in readings]
+
+    assert names == ["Glucose", "Glucose", "Cr", "Hgb", "Temp", "HR"]
+    np.testing.assert_allclose(values, [126.112, 126.0, 1.0, 12.0, 100.4, 80.0])
+
+def test_stats_are_per_patient_rows():
+    """Test slopes, deltas and crossings are computed for every patient in one pass"""
+    day = 86400.0
+    series = WardSeries.from_readings("K", {
+        "a": [(0, 4.0), (day, 4.5), (2 * day, 5.0), (3 * day, 5.5)],
+        "b": [(0, 4.0), (day, 4.0)],
+        "c": [(0, 3.0)]
+    })
+    stats = TrendStats(series, window=2)
+
+    np.testing.assert_allclose(stats.slope[:2], [0.5, 0.0])
+    assert np.isnan(stats.slope[2])
+    np.testing.assert_allclose(stats.last_delta[:2], [0.5, 0.0])
+    np.testing.assert_allclose(stats.window_delta[0], 1.0)
+    assert stats.crossed.tolist() == [True, False, False]
+
+def test_analyze_describes_trends_and_crossings():
+    """Test a steady rise and a return to normal are reported, stable patients are not"""
+    ward = {
+        "rising": notes([["HR: 80"], ["HR: 92"], ["HR: 104"]]),
+        "stable": notes([["HR: 80"], ["HR: 81"], ["HR: 80"]]),
+        "recovered": notes([["SpO2: 88%"], ["SpO2: 95%"]])
+    }
+    assert analyze(ward) == {
+        "rising": [
+            "HR rising over 3 readings (80 → 104, +12.0/day)",
+            "HR now above normal (104 > 100, +12 since the last reading)"
+        ],
+        "stable": [],
+        "recovered": ["SpO2 back within normal range (95, +7 since the last reading)"]
+    }
+
+def test_analyze_reports_a_recent_turn():
+    """Test a change over the last readings is reported when the whole history's fit misses it"""
+    ward = {"turned": notes([["K: 4.0"], ["K: 4.4"], ["K: 4.8"], ["K: 4.8"], ["K: 4.4"], ["K: 4.0"]])}
+    assert analyze(ward) == {"turned": ["K down 0.8 over the last 3 readings"]}
+
+def test_analyze_does_not_trend_across_units():
+    """Test glucose charted in mmol/L and mg/dL is compared in one unit"""
+    ward = {"mixed": notes([["Glucose: 6.0 mmol/L"], ["Glucose: 110 mg/dL"], ["Glucose: 6.2 mmol/L"]])}
+    assert analyze(ward) == {"mixed": []}
+
+def test_leo_fills_trends_from_history(tmp_path):
+    """Test the note's trends come from the stored history without a model call"""
+    store = NoteStore(str(tmp_path / "notes.sqlite3"))
+    for note in notes([["BP: 150/95"], ["BP: 140/90"]], start=datetime.now() - timedelta(days=2)):
+        stored = ProgressNote(
+            mrn="12345", subjective="Stable", assessment="", plan="", changes_since_last_note="",
+            action_items=[], discrepancies=[], **note
+        )
+        store.save("12345", stored.date, stored.model_dump(mode="json"))
+    llm = Mock()
+    llm.process_clinical_conversation.return_value = {"subjective": "Stable", "vitals": ["BP: 128/84"]}
+    leo = Leo(Config(), llm=llm, note_store=store)
+
+    note = leo.process_input(ClinicalInput(transcribed_audio="...", patient_info={"mrn": "12345"}))
+
+    llm.compare_notes.assert_not_called()
+    assert "Trends: SBP falling over 3 readings (150 → 128" in note.changes_since_last_note
+    store.close()
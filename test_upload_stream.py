@@ -0,0 +1,89 @@
+import pytest
+import hashlib
+import os
+import subprocess
+import sys
+from upload_stream import spool_upload, UploadTooLargeError
+
+class FakeUpload:
+    """Async reader that yields `total` bytes without holding them all in memory"""
+
+    def __init__(self, total: int, block: bytes = b"\x5a" * 65536):
+        self.remaining = total
+        self.block = block
+
+    async def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        n = min(size, self.remaining, len(self.block))
+        self.remaining -= n
+        return self.block[:n]
+
+@pytest.mark.asyncio
+async def test_spool_upload_hash_and_size(tmp_path):
+    """Test spooling computes size and digest while streaming"""
+    total = 300_000
+    dest = str(tmp_path / "audio.mp4")
+    with await spool_upload(FakeUpload(total), dest, chunk_size=4096) as spooled:
+        assert spooled.size == total
+        assert spooled.sha256 == hashlib.sha256(b"\x5a" * total).hexdigest()
+        # Handle is rewound and ready for the transcriber
+        assert spooled.file.read() == b"\x5a" * total
+    assert os.path.getsize(dest) == total
+
+@pytest.mark.asyncio
+async def test_spool_upload_rejects_oversize(tmp_path):
+    """Test oversize uploads are rejected and the partial file removed"""
+    dest = str(tmp_path / "big.mp4")
+    with pytest.raises(UploadTooLargeError):
+        await spool_upload(FakeUpload(100_000), dest, chunk_size=4096, max_bytes=50_000)
+    assert not os.path.exists(dest)
+
+PEAK_RSS_SCRIPT = """
+import asyncio, resource, sys
+sys.path.insert(0, {root!r})
+from test_upload_stream import FakeUpload
+from upload_stream import spool_upload
+
+async def main(total):
+    if total:
+        spooled = await spool_upload(FakeUpload(total), {dest!r}, chunk_size=1024 * 1024)
+        spooled.close()
+
+asyncio.run(main({total}))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def _peak_rss_kb(tmp_path, total: int) -> int:
+    script = PEAK_RSS_SCRIPT.format(
+        root=os.path.dirname(os.path.abspath(__file__)),
+        dest=str(tmp_path / "rss.bin"),
+        total=total
+    )
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return int(out.stdout.strip())
+
+@pytest.mark.skipif(sys.platform != "linux", reason="ru_maxrss is reported in KiB on Linux")
+def test_spool_upload_peak_rss_is_flat(tmp_path):
+    """Test peak RSS does not grow with upload size"""
+    baseline = _peak_rss_kb(tmp_path, 0)
+    small = _peak_rss_kb(tmp_path, 8 * 1024 * 1024)
+    large = _peak_rss_kb(tmp_path, 256 * 1024 * 1024)
+    # A buffered read of 256 MiB would add ~256 MiB; streaming should stay within a few chunks
+    assert large - baseline < 32 * 1024
+    assert large - small < 16 * 1024
+
+@pytest.mark.asyncio
+async def test_store_as_dedupes_identical_uploads(tmp_path):
+    """Test a repeat upload is dropped in favour of the stored copy"""
+    paths = []
+    for n in range(2):
+        spooled = await spool_upload(FakeUpload(10_000), str(tmp_path / f"spool{n}.mp4"))
+        target = str(tmp_path / f"{spooled.sha256}.mp4")
+        with spooled:
+            paths.append((spooled.store_as(target), spooled.path))
+            assert len(spooled.file.read()) == 10_000
+    
+    assert paths[0][0] is False
+    assert paths[1] == (True, paths[0][1])
+    assert sorted(p.name for p in tmp_path.iterdir()) == [os.path.basename(paths[0][1])]
@@ -0,0 +1,102 @@
+from typing import Any, Callable, Dict, List
+import re
+from structured_extraction import canonical_name
+
+# A line that opens a speaker turn, optionally after a timestamp: "[00:12:31] Nurse: ..."
+_TURN = re.compile(r"^\s*(?:[\[(]?\d{1,2}:\d{2}(?::\d{2})?[\])]?\s*)?[A-Z][\w .'()-]{0,30}:\s")
+_TIMESTAMP = re.compile(r"^\s*[\[(]?\d{1,2}:\d{2}(?::\d{2})?[\])]?")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+# Result fields holding measurements, deduplicated by what was measured with the latest reading kept
+READING_FIELDS = ("vitals", "labs")
+MEDICATION_FIELDS = ("medications",)
+
+def _units(transcript: str) -> List[str]:
+    """Speaker turns, with unlabelled lines kept with the turn before; sentences if there are none"""
+    turns: List[str] = []
+    for line in transcript.splitlines():
+        if not line.strip():
+            continue
+        if _TURN.match(line) or not turns:
+            turns.append(line)
+        else:
+            turns[-1] += "\n" + line
+    if len(turns) > 1:
+        return turns
+    return [sentence for sentence in _SENTENCE.split(transcript) if sentence.strip()]
+
+def split_transcript(transcript: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """
+    Split a transcript into segments of at most max_tokens on speaker turn boundaries.
+
+    A segment that is at least half full is ended early at a timestamped turn, so segments
+    follow the round's own time markers where it has them. A single turn longer than
+    max_tokens is split between sentences.
+    """
+    segments: List[str] = []
+    current: List[str] = []
+    size = 0
+    for unit in _units(transcript):
+        cost = count(unit)
+        if cost > max_tokens:
+            pieces = [piece for piece in _SENTENCE.split(unit) if piece.strip()]
+            if len(pieces) > 1:
+                for piece in pieces:
+                    if current and size + count(piece) > max_tokens:
+                        segments.append("\n".join(current))
+                        current, size = [], 0
+                    current.append(piece)
+                    size += count(piece)
+                continue
+        boundary = _TIMESTAMP.match(unit) and size >= max_tokens / 2
+        if current and (size + cost > max_tokens or boundary):
+            segments.append("\n".join(current))
+            current, size = [], 0
+        current.append(unit)
+        size += cost
+    if current:
+        segments.append("\n".join(current))
+    return segments
+
+def _medication_key(medication: Any) -> str:
+    return re.sub(r"[\s.]+", "", str(medication).lower())
+
+def merge_extractions(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-segment extraction results, in transcript order, into one result.
+
+    Text fields are joined; list fields are concatenated without repeats. Vitals and labs keep
+    only the last reading of each measurement, and medications differing only in case or
+    spacing ("Lisinopril 10mg", "lisinopril 10 mg") are listed once.
+    """
+    merged: Dict[str, Any] = {}
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, str):
+                if value.strip() and value.strip() not in merged.get(key, ""):
+                    merged[key] = f"{merged[key]} {value.strip()}" if merged.get(key) else value.strip()
+                else:
+                    merged.setdefault(key, "")
+            elif isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            elif value is not None:
+                merged[key] = value
+
+    for key in READING_FIELDS:
+        if key in merged:
+            latest: Dict[str, str] = {}
+            for entry in merged[key]:
+                label = str(entry).split(":", 1)[0].strip()
+                name = canonical_name(label) or label
+                latest[name] = entry
+            merged[key] = list(latest.values())
+    for key, values in merged.items():
+        if isinstance(values, list) and key not in READING_FIELDS:
+            normalize = _medication_key if key in MEDICATION_FIELDS else (lambda v: v if isinstance(v, str) else repr(v))
+            seen = set()
+            unique = []
+            for value in values:
+                if normalize(value) not in seen:
+                    seen.add(normalize(value))
+                    unique.append(value)
+            merged[key] = unique
+    return merged
@@ -0,0 +1,67 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+import asyncio
+from async_llm import run_in_executor
+from provider_client import ProviderClient
+from resilience import CircuitBreaker, DeadlineExceeded, check_deadline, deadline_expired, remaining_time
+
+class Transcriber(ABC):
+    """Interface for speech-to-text backends"""
+
+    @abstractmethod
+    async def transcribe(self, audio_file: BinaryIO, audio_sha256: Optional[str] = None) -> str:
+        """Transcribe audio_file; audio_sha256 is its digest, when the caller already has it"""
+        pass
+
+class OpenAITranscriber(Transcriber):
+    """
+    Whisper transcription with the blocking client call moved off the event loop; with a
+    client, calls go through its connection pool
+    """
+
+    def __init__(self, model: str = "whisper-1", max_workers: int = 8, client: Optional[ProviderClient] = None):
+        self.model = model
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="leo-transcribe")
+
+    def _transcribe_sync(self, audio_file: BinaryIO) -> str:
+        import openai
+        return openai.Audio.transcribe(
+            model=self.model,
+            file=audio_file,
+            response_format="text",
+            api_base=self.client.config.base_url if self.client is not None else None
+        )
+
+    async def transcribe(self, audio_file: BinaryIO, audio_sha256: Optional[str] = None) -> str:
+        return await run_in_executor(self.executor, self._transcribe_sync, audio_file)
+
+class GuardedTranscriber(Transcriber):
+    """
+    Transcriber wrapper bounding each call by the current deadline and failing fast while
+    the transcription provider's circuit is open. Calls cut off by the deadline are not
+    counted against the provider.
+    """
+
+    def __init__(self, transcriber: Transcriber, breaker: CircuitBreaker):
+        self.transcriber = transcriber
+        self.breaker = breaker
+
+    async def transcribe(self, audio_file: BinaryIO, audio_sha256: Optional[str] = None) -> str:
+        check_deadline("transcription")
+        self.breaker.before_call()
+        try:
+            transcript = await asyncio.wait_for(
+                self.transcriber.transcribe(audio_file, audio_sha256), remaining_time()
+            )
+        except Exception as e:
+            if not deadline_expired(e):
+                self.breaker.record_failure()
+                raise
+            self.breaker.cancel_trial()
+            if isinstance(e, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded("Deadline exceeded during transcription") from e
+        self.breaker.record_success()
+        return transcript
@@ -0,0 +1,121 @@
+from typing import BinaryIO, Optional
+from datetime import datetime
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from async_llm import run_in_executor
+from transcription import Transcriber
+
+logger = logging.getLogger(__name__)
+
+class TranscriptionCache:
+    """
+    Transcripts stored in SQLite, keyed by the SHA-256 of the audio and the transcription model.
+
+    The total size of cached transcripts is capped at max_bytes; once exceeded, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transcripts (
+                audio_sha256 TEXT NOT NULL,
+                model TEXT NOT NULL,
+                transcript TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (audio_sha256, model)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used)")
+
+    def get(self, audio_sha256: str, model: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT transcript FROM transcripts WHERE audio_sha256 = ? AND model = ?",
+                (audio_sha256, model)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE transcripts SET last_used = ? WHERE audio_sha256 = ? AND model = ?",
+                (time.time(), audio_sha256, model)
+            )
+            return row[0]
+
+    def put(self, audio_sha256: str, model: str, transcript: str) -> None:
+        size = len(transcript.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?, ?)",
+                (audio_sha256, model, transcript, size, datetime.now().isoformat(), time.time())
+            )
+            self._evict()
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+
+    def _evict(self) -> None:
+        """Drop least recently used transcripts until the cache fits in max_bytes"""
+        excess = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for audio_sha256, model, size in self._conn.execute(
+            "SELECT audio_sha256, model, size FROM transcripts ORDER BY last_used"
+        ):
+            victims.append((audio_sha256, model))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM transcripts WHERE audio_sha256 = ? AND model = ?", victims)
+        logger.info("Evicted %d cached transcripts", len(victims))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def file_sha256(audio_file: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file in chunks, leaving its position where it was"""
+    position = audio_file.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: audio_file.read(chunk_size), b""):
+        digest.update(chunk)
+    audio_file.seek(position)
+    return digest.hexdigest()
+
+class CachedTranscriber(Transcriber):
+    """
+    Transcriber that skips transcription for audio it has seen before. Hashing and the
+    cache's SQLite reads and writes run in the default executor, off the event loop.
+    """
+
+    def __init__(self, transcriber: Transcriber, cache: TranscriptionCache, model: str):
+        self.transcriber = transcriber
+        self.cache = cache
+        self.model = model
+
+    async def transcribe(self, audio_file: BinaryIO, audio_sha256: Optional[str] = None) -> str:
+        audio_sha256 = audio_sha256 or await run_in_executor(None, file_sha256, audio_file)
+        transcript = await run_in_executor(None, self.cache.get, audio_sha256, self.model)
+        if transcript is not None:
+            logger.info("Transcription cache hit for %s", audio_sha256)
+            return transcript
+        transcript = await self.transcriber.transcribe(audio_file, audio_sha256)
+        await run_in_executor(None, self.cache.put, audio_sha256, self.model, transcript)
+        return transcript
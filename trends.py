@@ -0,0 +1,237 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+import logging
+import re
+import numpy as np
+from structured_extraction import canonical_name, UNITS
+
+logger = logging.getLogger(__name__)
+
+# Normal ranges; a reading moving across one of these bounds is reported as a crossing
+NORMAL_RANGES = {
+    "SBP": (90, 140),
+    "DBP": (60, 90),
+    "HR": (60, 100),
+    "RR": (12, 20),
+    "Temp": (96.8, 100.4),
+    "SpO2": (92, 100),
+    "WBC": (4.0, 11.0),
+    "Hgb": (12.0, 17.5),
+    "Plt": (150, 400),
+    "Na": (135, 145),
+    "K": (3.5, 5.0),
+    "Cr": (0.6, 1.3),
+    "Glucose": (70, 180),
+    "Lactate": (0.5, 2.0),
+    "INR": (0.8, 1.2),
+}
+# The unit each measurement is trended in (that of NORMAL_RANGES), and factors converting
+# other units to it. Readings in any other unit are left out rather than trended alongside
+# readings they cannot be compared with; readings without a unit are taken to be in it.
+SERIES_UNITS: Dict[str, Tuple[str, Dict[str, float]]] = {
+    "SBP": ("mmHg", {}),
+    "DBP": ("mmHg", {}),
+    "HR": ("bpm", {}),
+    "RR": ("/min", {}),
+    "Temp": ("°F", {}),  # Celsius is converted in parse_readings
+    "SpO2": ("%", {}),
+    "Weight": ("kg", {"lb": 0.45359237}),
+    "WBC": ("K/uL", {}),
+    "Hgb": ("g/dL", {"g/L": 0.1}),
+    "Hct": ("%", {}),
+    "Plt": ("K/uL", {}),
+    "Na": ("mEq/L", {"mmol/L": 1.0}),
+    "K": ("mEq/L", {"mmol/L": 1.0}),
+    "Cl": ("mEq/L", {"mmol/L": 1.0}),
+    "CO2": ("mEq/L", {"mmol/L": 1.0}),
+    "BUN": ("mg/dL", {"mmol/L": 2.801}),
+    "Cr": ("mg/dL", {"µmol/L": 1 / 88.42}),
+    "Glucose": ("mg/dL", {"mmol/L": 18.016}),
+    "Ca": ("mg/dL", {"mmol/L": 4.008}),
+    "Mg": ("mg/dL", {"mmol/L": 2.431, "mEq/L": 1.215}),
+    "Phos": ("mg/dL", {"mmol/L": 3.097}),
+    "Lactate": ("mmol/L", {"mg/dL": 1 / 9.008}),
+    "Troponin": ("ng/mL", {"ng/L": 0.001}),
+    "INR": ("", {}),
+    "BNP": ("pg/mL", {"ng/L": 1.0}),
+    "A1c": ("%", {}),
+    "ALT": ("U/L", {}),
+    "AST": ("U/L", {}),
+    "Alk Phos": ("U/L", {}),
+    "T Bili": ("mg/dL", {"µmol/L": 1 / 17.1}),
+    "Albumin": ("g/dL", {"g/L": 0.1}),
+    "CRP": ("mg/L", {"mg/dL": 10.0}),
+    "TSH": ("mIU/L", {}),
+}
+# A fitted change over the history of at least this fraction of the mean is reported as a trend
+TREND_THRESHOLD = 0.10
+SECONDS_PER_DAY = 86400.0
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_UNIT = re.compile(r"\s*([^\s\d,;()]+)")
+
+def _unit(value: str, end: int) -> Optional[str]:
+    """The canonical unit written after the number ending at end, if any"""
+    match = _UNIT.match(value, end)
+    return UNITS.get(match.group(1).lower()) if match else None
+
+def _in_series_unit(name: str, number: float, unit: Optional[str]) -> Optional[float]:
+    """number converted to the unit name is trended in, or None if it cannot be"""
+    if name == "Temp" and (unit == "°C" or (unit is None and number < 50)):
+        return number * 9 / 5 + 32
+    if name not in SERIES_UNITS or unit is None:
+        return number
+    series_unit, factors = SERIES_UNITS[name]
+    if unit == series_unit:
+        return number
+    return number * factors[unit] if unit in factors else None
+
+def parse_readings(entries: Iterable[str]) -> List[Tuple[str, float]]:
+    """
+    Numeric readings from objective entries such as "BP: 120/80" or "Glucose: 7.2 mmol/L",
+    in the units of SERIES_UNITS; readings in units that do not convert are left out
+    """
+    readings = []
+    for entry in entries:
+        label, _, value = str(entry).partition(":")
+        name = canonical_name(label.strip())
+        numbers = list(_NUMBER.finditer(value))
+        if name is None or not numbers:
+            continue
+        if name == "BP":
+            if len(numbers) >= 2 and _unit(value, numbers[1].end()) in (None, "mmHg"):
+                readings.append(("SBP", float(numbers[0].group())))
+                readings.append(("DBP", float(numbers[1].group())))
+            continue
+        number = _in_series_unit(name, float(numbers[0].group()), _unit(value, numbers[0].end()))
+        if number is None:
+            logger.debug("Not trending %r: its unit does not convert to %s's", entry, name)
+            continue
+        readings.append((name, number))
+    return readings
+
+def _timestamp(date: Any) -> float:
+    return (date if isinstance(date, datetime) else datetime.fromisoformat(str(date))).timestamp()
+
+class WardSeries:
+    """
+    Every patient's readings of one measurement as a padded (patients × readings) matrix.
+
+    Rows are left-aligned in time order and padded with NaN, so statistics for a whole ward
+    are single NumPy operations along axis 1.
+    """
+
+    def __init__(self, name: str, mrns: List[str], times: np.ndarray, values: np.ndarray, counts: np.ndarray):
+        self.name = name
+        self.mrns = mrns
+        self.times = times  # Days since the patient's first reading
+        self.values = values
+        self.counts = counts
+
+    @classmethod
+    def from_readings(cls, name: str, readings: Dict[str, List[Tuple[float, float]]]) -> "WardSeries":
+        """Build from {mrn: [(unix time, value), ...]}, each list non-empty and in time order"""
+        mrns = list(readings)
+        counts = np.fromiter((len(readings[mrn]) for mrn in mrns), dtype=np.int64, count=len(mrns))
+        width = int(counts.max())
+        times = np.full((len(mrns), width), np.nan)
+        values = np.full((len(mrns), width), np.nan)
+        for row, mrn in enumerate(mrns):
+            series = np.asarray(readings[mrn], dtype=np.float64)
+            times[row, :len(series)] = series[:, 0]
+            values[row, :len(series)] = series[:, 1]
+        times = (times - times[:, :1]) / SECONDS_PER_DAY
+        return cls(name, mrns, times, values, counts)
+
+class TrendStats:
+    """Per-patient trend statistics for one WardSeries, as arrays aligned with its rows"""
+
+    def __init__(self, series: WardSeries, window: int = 3):
+        values, times, counts = series.values, series.times, series.counts
+        rows = np.arange(len(counts))
+        valid = ~np.isnan(values)
+        self.series = series
+        self.counts = counts
+        self.window = window
+
+        # Least-squares slope per day over each patient's full history
+        mean_t = np.nanmean(times, axis=1, keepdims=True)
+        mean_v = np.nanmean(values, axis=1, keepdims=True)
+        dt = np.where(valid, times - mean_t, 0.0)
+        dv = np.where(valid, values - mean_v, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.slope = (dt * dv).sum(axis=1) / (dt * dt).sum(axis=1)
+        self.mean = mean_v[:, 0]
+
+        self.first = values[:, 0]
+        self.last = values[rows, counts - 1]
+        self.previous = values[rows, np.maximum(counts - 2, 0)]
+        self.span_days = times[rows, counts - 1]
+
+        # Change since the previous reading, and over the last `window` readings
+        self.last_delta = np.where(counts >= 2, self.last - self.previous, np.nan)
+        self.window_delta = np.where(counts > window, self.last - values[rows, np.maximum(counts - 1 - window, 0)], np.nan)
+
+        # Threshold state of the last two readings: -1 below, 0 within, 1 above the normal range
+        self.low, self.high = NORMAL_RANGES.get(series.name, (-np.inf, np.inf))
+        self.state_last = np.where(self.last < self.low, -1, np.where(self.last > self.high, 1, 0))
+        self.state_previous = np.where(self.previous < self.low, -1, np.where(self.previous > self.high, 1, 0))
+        self.crossed = (counts >= 2) & (self.state_last != self.state_previous)
+
+    def describe(self, row: int, min_readings: int = 3) -> List[str]:
+        """Sentences for changes_since_last_note about one patient"""
+        name = self.series.name
+        lines = []
+        count = int(self.counts[row])
+        threshold = TREND_THRESHOLD * abs(self.mean[row])
+        fitted_change = self.slope[row] * self.span_days[row]
+        trend = 0
+        if count >= min_readings and np.isfinite(fitted_change) and abs(fitted_change) >= threshold:
+            trend = 1 if fitted_change > 0 else -1
+            lines.append(
+                f"{name} {'rising' if trend > 0 else 'falling'} over {count} readings "
+                f"({self.first[row]:g} → {self.last[row]:g}, {self.slope[row]:+.1f}/day)"
+            )
+        # A recent change the fit over the whole history smooths over, such as a turn
+        recent = self.window_delta[row]
+        if np.isfinite(recent) and abs(recent) >= threshold and np.sign(recent) != trend:
+            lines.append(f"{name} {'up' if recent > 0 else 'down'} {abs(recent):.3g} over the last {self.window} readings")
+        if self.crossed[row]:
+            last = self.last[row]
+            since = f"{self.last_delta[row]:+.3g} since the last reading"
+            if self.state_last[row] > 0:
+                lines.append(f"{name} now above normal ({last:g} > {self.high:g}, {since})")
+            elif self.state_last[row] < 0:
+                lines.append(f"{name} now below normal ({last:g} < {self.low:g}, {since})")
+            else:
+                lines.append(f"{name} back within normal range ({last:g}, {since})")
+        return lines
+
+def collect_readings(histories: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, List[Tuple[float, float]]]]:
+    """Regroup {mrn: notes} into {measurement: {mrn: [(unix time, value), ...]}}"""
+    by_name: Dict[str, Dict[str, List[Tuple[float, float]]]] = {}
+    for mrn, notes in histories.items():
+        for note in notes:
+            when = _timestamp(note["date"])
+            objective = note.get("objective") or {}
+            for name, value in parse_readings(list(objective.get("vitals", [])) + list(objective.get("labs", []))):
+                by_name.setdefault(name, {}).setdefault(mrn, []).append((when, value))
+    return by_name
+
+def analyze(
+    histories: Dict[str, List[Dict[str, Any]]],
+    window: int = 3,
+    min_readings: int = 3
+) -> Dict[str, List[str]]:
+    """
+    Trends across a ward: slopes, recent changes and threshold crossings for every patient.
+
+    histories maps each MRN to its notes in date order, as dicts with "date" and "objective".
+    Returns the trend sentences for each MRN.
+    """
+    results: Dict[str, List[str]] = {mrn: [] for mrn in histories}
+    for name, readings in collect_readings(histories).items():
+        stats = TrendStats(WardSeries.from_readings(name, readings), window=window)
+        for row, mrn in enumerate(stats.series.mrns):
+            results[mrn].extend(stats.describe(row, min_readings=min_readings))
+    return results
@@ -0,0 +1,86 @@
+from typing import Optional, BinaryIO
+import asyncio
+import hashlib
+import os
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds its configured size limit"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds maximum size of {limit} bytes")
+        self.limit = limit
+
+class SpooledUpload:
+    """An uploaded file copied to disk, with its size and SHA-256 digest"""
+
+    def __init__(self, path: str, file: BinaryIO, size: int, sha256: str):
+        self.path = path
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+
+    def store_as(self, path: str) -> bool:
+        """
+        Move the spooled file to path, e.g. a content-addressed name.
+
+        If path already exists the spooled copy is discarded in favour of it. Either way the
+        upload is reopened, rewound, at its new path. Returns True if it was a duplicate.
+        """
+        self.close()
+        duplicate = os.path.exists(path)
+        if duplicate:
+            os.remove(self.path)
+        else:
+            os.replace(self.path, path)
+        self.path = path
+        self.file = open(path, "rb")
+        return duplicate
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+async def spool_upload(
+    upload,
+    dest_path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_bytes: Optional[int] = None
+) -> SpooledUpload:
+    """
+    Copy an upload to dest_path in fixed-size chunks, hashing and size-checking as it streams.
+
+    `upload` is anything with an async `read(size)` (e.g. FastAPI's UploadFile). At most one
+    chunk is held in memory at a time. The returned SpooledUpload keeps the destination file
+    open and rewound, so it can be handed straight to the transcriber. If max_bytes is
+    exceeded the partial file is removed and UploadTooLargeError is raised.
+    """
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256()
+    size = 0
+    out = open(dest_path, "w+b")
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+            digest.update(chunk)
+            await loop.run_in_executor(None, out.write, chunk)
+        await loop.run_in_executor(None, out.flush)
+        out.seek(0)
+    except BaseException:
+        out.close()
+        os.remove(dest_path)
+        raise
+
+    return SpooledUpload(dest_path, out, size, digest.hexdigest())